@@ -1,10 +1,101 @@
+import copy
+import csv
+import heapq
+import json
+import lzma
+import mmap
+import multiprocessing
+import os
 import pickle
-from datetime import datetime
-from collections import Counter
+import sqlite3
+import struct
+import sys
+import threading
+import tracemalloc
+import zlib
+from bisect import bisect_left, bisect_right
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from array import array
+from collections import Counter, OrderedDict, deque
+from collections.abc import MutableMapping, Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import chain, compress, islice
+from time import perf_counter
 from enum import Enum, auto
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class SlottedRecord:
+    __slots__ = ()
+
+    def __getstate__(self):
+        # state is the dict the classes pickled before they had slots, with
+        # amounts under their unit names, so older versions can load it
+        state = {}
+        for name in self.__slots__:
+            if name.endswith("_cents"):
+                state[name[:-len("_cents")]] = Money.from_cents(
+                    getattr(self, name))
+            else:
+                state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        # a unit amount goes through its property and becomes cents; the
+        # cents names of earlier slotted files are set directly
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def from_fields(cls, *values):
+        # rebuilds a record from stored slot values, amounts already in cents
+        record = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, values):
+            setattr(record, name, value)
+        return record
+
+
+class Money:
+    # amounts are stored as integer cents; the unit values are what the
+    # constructors take and what reports show
+    CENTS = 100
+
+    @staticmethod
+    def to_cents(amount):
+        try:
+            if isinstance(amount, int):
+                return amount * Money.CENTS
+            if isinstance(amount, float):
+                return round(amount * Money.CENTS)
+            return int((Decimal(str(amount)) * Money.CENTS)
+                       .to_integral_value())
+        except (ArithmeticError, TypeError, ValueError):
+            # Decimal's InvalidOperation and the overflow of an infinite
+            # amount are ArithmeticErrors
+            raise ValueError(f"{amount!r} is not an amount of money") from None
+
+    @staticmethod
+    def parse(text):
+        # typed or imported text stays an exact Decimal instead of a float
+        Money.to_cents(text)
+        return Decimal(text)
+
+    @staticmethod
+    def from_cents(cents):
+        units, remainder = divmod(cents, Money.CENTS)
+        return units if not remainder else cents / Money.CENTS
+
+
+class Employee(SlottedRecord):
+    __slots__ = ("employee_id", "full_name", "position", "phone_number",
+                 "email")
 
-class Employee:
     def __init__(self, employee_id, full_name, position, phone_number, email):
         self.employee_id = employee_id
         self.full_name = full_name
@@ -12,13 +103,21 @@ class Employee:
         self.phone_number = phone_number
         self.email = email
 
+    def as_row(self):
+        return {"employee_id": self.employee_id, "full_name": self.full_name,
+                "position": self.position, "phone_number": self.phone_number,
+                "email": self.email}
+
     def __repr__(self):
         return (f"Employee: ID - {self.employee_id}, Full name - {self.full_name}, "
                 f"Position - {self.position}, Phone number - {self.phone_number}, "
                 f"Email - {self.email}")
 
 
-class Car:
+class Car(SlottedRecord):
+    __slots__ = ("car_id", "producer", "model", "release_year", "cost_cents",
+                 "potential_sale_price_cents")
+
     def __init__(self, car_id, producer, model,
                  release_year, cost, potential_sale_price):
         self.car_id = car_id
@@ -28,6 +127,28 @@ class Car:
         self.cost = cost
         self.potential_sale_price = potential_sale_price
 
+    @property
+    def cost(self):
+        return Money.from_cents(self.cost_cents)
+
+    @cost.setter
+    def cost(self, amount):
+        self.cost_cents = Money.to_cents(amount)
+
+    @property
+    def potential_sale_price(self):
+        return Money.from_cents(self.potential_sale_price_cents)
+
+    @potential_sale_price.setter
+    def potential_sale_price(self, amount):
+        self.potential_sale_price_cents = Money.to_cents(amount)
+
+    def as_row(self):
+        return {"car_id": self.car_id, "producer": self.producer,
+                "model": self.model, "release_year": self.release_year,
+                "cost": self.cost,
+                "potential_sale_price": self.potential_sale_price}
+
     def __repr__(self):
         return (f"Car: ID - {self.car_id}, Producer - {self.producer}, "
                 f"Model - {self.model}, Release year - {self.release_year}, "
@@ -35,7 +156,9 @@ class Car:
                 f"Potential sale price - {self.potential_sale_price}")
 
 
-class Sale:
+class Sale(SlottedRecord):
+    __slots__ = ("employee", "car", "sale_date", "real_sale_price_cents")
+
     def __init__(self, employee: Employee, car: Car,
                  sale_date, real_sale_price):
         self.employee = employee
@@ -43,36 +166,218 @@ class Sale:
         self.sale_date = sale_date
         self.real_sale_price = real_sale_price
 
+    @property
+    def real_sale_price(self):
+        return Money.from_cents(self.real_sale_price_cents)
+
+    @real_sale_price.setter
+    def real_sale_price(self, amount):
+        self.real_sale_price_cents = Money.to_cents(amount)
+
+    def as_row(self):
+        row = {"employee_id": self.employee.employee_id}
+        row.update(self.car.as_row())
+        row["sale_date"] = self.sale_date.isoformat()
+        row["real_sale_price"] = self.real_sale_price
+        return row
+
     def __repr__(self):
         return (f"Sale: Employee - {self.employee.employee_id}, Car - {self.car}, "
                 f"Sale date - {self.sale_date}, "
                 f"Real sale price - {self.real_sale_price}")
 
 
+class MetricsSink:
+    # records nothing; sinks override the calls they care about
+    def count(self, name, value=1):
+        pass
+
+    def observe(self, name, seconds):
+        pass
+
+    def event(self, name, message):
+        pass
+
+    def memory(self, name, current, peak):
+        pass
+
+
+class LogSink(MetricsSink):
+    # the messages the salon used to print; names limits them to those
+    # events, e.g. only save and load messages from a busy server
+    def __init__(self, file=None, names=None):
+        self.file = file
+        self.names = names
+
+    def event(self, name, message):
+        if self.names is None or name in self.names:
+            print(message, file=self.file or sys.stdout)
+
+
+class LatencyHistogram:
+    # bucket i counts latencies below 2 ** i microseconds, so a histogram
+    # is a fixed list however many samples it takes
+    BUCKETS = 32
+
+    def __init__(self):
+        self.buckets = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = int(seconds * 1_000_000).bit_length()
+        self.buckets[min(bucket, self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent):
+        rank = self.count * percent / 100
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << bucket) / 1_000_000, self.max)
+        return 0.0
+
+    def as_dict(self):
+        return {"count": self.count, "total_seconds": self.total,
+                "max_seconds": self.max,
+                **{f"p{percent}_seconds": self.percentile(percent)
+                   for percent in (50, 95, 99)}}
+
+
+class MemorySink(MetricsSink):
+    def __init__(self, max_events=1000):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.histograms = {}
+        self.events = deque(maxlen=max_events)
+        self.memory_peaks = {}
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.add(seconds)
+
+    def event(self, name, message):
+        with self.lock:
+            self.events.append((name, message))
+
+    def memory(self, name, current, peak):
+        with self.lock:
+            self.memory_peaks[name] = max(peak,
+                                          self.memory_peaks.get(name, 0))
+
+    def as_dict(self):
+        with self.lock:
+            return {"counters": dict(self.counters),
+                    "latency": {name: histogram.as_dict() for name, histogram
+                                in self.histograms.items()},
+                    "memory_peak_bytes": dict(self.memory_peaks)}
+
+
+class MetricsTimer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        if self.metrics.trace_memory:
+            tracemalloc.reset_peak()
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, perf_counter() - self.started)
+        if self.metrics.trace_memory:
+            self.metrics.memory(self.name, *tracemalloc.get_traced_memory())
+
+
+class Metrics:
+    # without sinks every call is an empty loop and timers are nullcontext,
+    # so the hot paths only pay for the instrumentation when it is wanted
+    def __init__(self, *sinks, trace_memory=False):
+        self.sinks = sinks
+        self.enabled = bool(sinks)
+        self.trace_memory = trace_memory and self.enabled
+        self.started_tracing = (self.trace_memory
+                                and not tracemalloc.is_tracing())
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def stop(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        self.trace_memory = False
+
+    def count(self, name, value=1):
+        for sink in self.sinks:
+            sink.count(name, value)
+
+    def observe(self, name, seconds):
+        for sink in self.sinks:
+            sink.observe(name, seconds)
+
+    def event(self, name, message):
+        for sink in self.sinks:
+            sink.event(name, message)
+
+    def memory(self, name, current, peak):
+        for sink in self.sinks:
+            sink.memory(name, current, peak)
+
+    def timer(self, name):
+        return MetricsTimer(self, name) if self.enabled else nullcontext()
+
+
+NO_METRICS = Metrics()
+
+
 class SaveDataToFile:
     @staticmethod
-    def save_data_to_file(data, filename):
+    def save_data_to_file(data, filename, metrics=NO_METRICS):
+        # written next to the target and renamed over it, so the old file
+        # stays whole until the new one is, even while it is still mapped
+        temp_filename = f"{filename}.tmp"
         try:
-            with open(filename, 'wb') as file:
+            with open(temp_filename, 'wb') as file:
                 pickle.dump(data, file)
-                print(f"Data saved to {filename}")
+            os.replace(temp_filename, filename)
+            metrics.event("save_data", f"Data saved to {filename}")
+            return True
         except Exception as e:
-            print(f"Error saving file {filename}: {e}")
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            metrics.count("save_data.errors")
+            metrics.event("save_data", f"Error saving file {filename}: {e}")
+            return False
 
 
 class LoadDataFromFile:
     @staticmethod
-    def load_data_from_file(filename):
+    def load_data_from_file(filename, metrics=NO_METRICS):
         try:
             with open(filename, 'rb') as file:
                 data = pickle.load(file)
-                print("Data loaded from file")
+                metrics.event("load_data", "Data loaded from file")
                 return data
         except FileNotFoundError:
-            print(f"File {filename} not found")
+            metrics.count("load_data.errors")
+            metrics.event("load_data", f"File {filename} not found")
             return None
         except Exception as e:
-            print(f"Error loading file {filename}: {e}")
+            metrics.count("load_data.errors")
+            metrics.event("load_data", f"Error loading file {filename}: {e}")
             return None
 
 
@@ -90,50 +395,2778 @@ class DateValidator:
             return None
 
 
-class AutoSalon:
+class SalesView(Sequence):
+    # the first length sales of a list that is only ever appended to, so a
+    # snapshot shares the list instead of copying it
+    def __init__(self, sales, length):
+        self.sales = sales
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return self.sales[slice(*row.indices(self.length))]
+        if row < 0:
+            row += self.length
+        if not 0 <= row < self.length:
+            raise IndexError("sale index out of range")
+        return self.sales[row]
+
+    def __iter__(self):
+        return islice(self.sales, self.length)
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class SaleIndex:
+    # sales ordered by date in chunks of about CHUNK, so an insert moves
+    # one chunk; a copy shares the chunks and each side copies a chunk
+    # before its first change, so copying costs the chunk list only
+    CHUNK = 1024
+
+    def __init__(self, sales=()):
+        self._chunk(sorted(sales, key=self._date))
+
+    @staticmethod
+    def _date(sale):
+        return sale.sale_date
+
+    def _chunk(self, ordered):
+        self.sale_chunks = [ordered[start:start + self.CHUNK]
+                            for start in range(0, len(ordered), self.CHUNK)]
+        self.date_chunks = [[sale.sale_date for sale in chunk]
+                            for chunk in self.sale_chunks]
+        self.maxes = [dates[-1] for dates in self.date_chunks]
+        self.owned = [True] * len(self.sale_chunks)
+        self.size = len(ordered)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return chain.from_iterable(self.sale_chunks)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            start, end, step = row.indices(self.size)
+            if step != 1:
+                return list(self)[row]
+            return list(self._slice(start, end))
+        if row < 0:
+            row += self.size
+        if not 0 <= row < self.size:
+            raise IndexError("sale index out of range")
+        for chunk in self.sale_chunks:
+            if row < len(chunk):
+                return chunk[row]
+            row -= len(chunk)
+
+    def copy(self):
+        index = SaleIndex()
+        index.sale_chunks = self.sale_chunks.copy()
+        index.date_chunks = self.date_chunks.copy()
+        index.maxes = self.maxes.copy()
+        index.size = self.size
+        self.owned = [False] * len(self.sale_chunks)
+        index.owned = self.owned.copy()
+        return index
+
+    def _writable(self, number):
+        if not self.owned[number]:
+            self.sale_chunks[number] = self.sale_chunks[number].copy()
+            self.date_chunks[number] = self.date_chunks[number].copy()
+            self.owned[number] = True
+        return self.date_chunks[number], self.sale_chunks[number]
+
+    def _replace(self, number, ordered):
+        # ordered takes the place of chunk number, cut into CHUNK pieces
+        # when it has grown past two of them
+        if len(ordered) > 2 * self.CHUNK:
+            chunks = [ordered[start:start + self.CHUNK]
+                      for start in range(0, len(ordered), self.CHUNK)]
+        else:
+            chunks = [ordered]
+        self.sale_chunks[number:number + 1] = chunks
+        self.date_chunks[number:number + 1] = [
+            [sale.sale_date for sale in chunk] for chunk in chunks]
+        self.maxes[number:number + 1] = [chunk[-1].sale_date
+                                         for chunk in chunks]
+        self.owned[number:number + 1] = [True] * len(chunks)
+
+    def add(self, sale):
+        if not self.sale_chunks:
+            self._chunk([sale])
+            return
+        # bisect_right keeps sales with equal dates in registration order,
+        # and a backdated sale lands in its place instead of at the end
+        number = min(bisect_right(self.maxes, sale.sale_date),
+                     len(self.maxes) - 1)
+        dates, sales = self._writable(number)
+        position = bisect_right(dates, sale.sale_date)
+        dates.insert(position, sale.sale_date)
+        sales.insert(position, sale)
+        self.maxes[number] = dates[-1]
+        self.size += 1
+        if len(sales) > 2 * self.CHUNK:
+            self._replace(number, sales)
+
+    def extend(self, sales):
+        added = sorted(sales, key=self._date)
+        if not added:
+            return
+        if not self.sale_chunks:
+            self._chunk(added)
+            return
+        # one linear merge per chunk the batch lands in, instead of an
+        # insert per backdated sale
+        last = len(self.maxes) - 1
+        runs = []
+        start = 0
+        while start < len(added):
+            number = min(bisect_right(self.maxes, added[start].sale_date),
+                         last)
+            end = (len(added) if number == last else
+                   bisect_left(added, self.maxes[number], start,
+                               key=self._date))
+            runs.append((number, start, end))
+            start = end
+        for number, start, end in reversed(runs):
+            self._replace(number, list(heapq.merge(
+                self.sale_chunks[number], added[start:end], key=self._date)))
+        self.size += len(added)
+
+    def _locate(self, date, find):
+        # (chunk number, position) of date in the chunks, found with
+        # bisect_left or bisect_right
+        number = find(self.maxes, date)
+        if number == len(self.maxes):
+            return number - 1, len(self.date_chunks[-1])
+        return number, find(self.date_chunks[number], date)
+
+    def _runs(self, start_date, end_date):
+        if not self.sale_chunks:
+            return
+        first, start = ((0, 0) if start_date is None
+                        else self._locate(start_date, bisect_left))
+        last, end = ((len(self.sale_chunks) - 1, len(self.sale_chunks[-1]))
+                     if end_date is None
+                     else self._locate(end_date, bisect_right))
+        for number in range(first, last + 1):
+            chunk = self.sale_chunks[number]
+            low = start if number == first else 0
+            high = end if number == last else len(chunk)
+            if low < high:
+                yield chunk, low, high
+
+    def _slice(self, start, end):
+        offset = 0
+        for chunk in self.sale_chunks:
+            if offset >= end:
+                return
+            if offset + len(chunk) > start:
+                yield from islice(chunk, max(start - offset, 0), end - offset)
+            offset += len(chunk)
+
+    def _position(self, date, find):
+        number, row = self._locate(date, find)
+        return sum(map(len, self.sale_chunks[:number])) + row
+
+    def bounds(self, start_date, end_date):
+        # positions in the whole index, for slicing it
+        if not self.sale_chunks:
+            return 0, 0
+        start = (0 if start_date is None
+                 else self._position(start_date, bisect_left))
+        end = (self.size if end_date is None
+               else self._position(end_date, bisect_right))
+        return start, end
+
+    def in_period(self, start_date=None, end_date=None):
+        sales = []
+        for chunk, start, end in self._runs(start_date, end_date):
+            sales.extend(chunk[start:end])
+        return sales
+
+    def iter_period(self, start_date=None, end_date=None):
+        return chain.from_iterable(
+            islice(chunk, start, end)
+            for chunk, start, end in self._runs(start_date, end_date))
+
+    def on_date(self, date):
+        return self.in_period(date, date)
+
+
+class SortedColumn:
+    # (int value, car) pairs ordered by value and then by id(car), split into
+    # chunks of about CHUNK, so an insert or delete moves one chunk instead
+    # of the whole column and finds its car by bisection even when many
+    # cars share a value; ties come back in no particular order. A copy
+    # shares the chunks, copied one by one before their first change
+    CHUNK = 512
+
+    def __init__(self, values=(), cars=()):
+        self._chunk(list(values), list(cars))
+
+    def _chunk(self, values, cars):
+        self.values = [values[start:start + self.CHUNK]
+                       for start in range(0, len(values), self.CHUNK)]
+        self.cars = [cars[start:start + self.CHUNK]
+                     for start in range(0, len(cars), self.CHUNK)]
+        self.maxes = [(values[-1], id(cars[-1]))
+                      for values, cars in zip(self.values, self.cars)]
+        self.owned = [True] * len(self.values)
+
+    def __len__(self):
+        return sum(map(len, self.values))
+
+    def copy(self):
+        column = SortedColumn()
+        column.values = self.values.copy()
+        column.cars = self.cars.copy()
+        column.maxes = self.maxes.copy()
+        self.owned = [False] * len(self.values)
+        column.owned = self.owned.copy()
+        return column
+
+    def _writable(self, number):
+        if not self.owned[number]:
+            self.values[number] = self.values[number].copy()
+            self.cars[number] = self.cars[number].copy()
+            self.owned[number] = True
+        return self.values[number], self.cars[number]
+
+    @staticmethod
+    def _position(values, cars, value, car):
+        return bisect_left(cars, id(car), bisect_left(values, value),
+                           bisect_right(values, value), key=id)
+
+    def insert(self, value, car):
+        if not self.values:
+            self._chunk([value], [car])
+            return
+        number = min(bisect_right(self.maxes, (value, id(car))),
+                     len(self.maxes) - 1)
+        values, cars = self._writable(number)
+        position = self._position(values, cars, value, car)
+        values.insert(position, value)
+        cars.insert(position, car)
+        self.maxes[number] = (values[-1], id(cars[-1]))
+        if len(values) > 2 * self.CHUNK:
+            half = len(values) // 2
+            self.values[number:number + 1] = [values[:half], values[half:]]
+            self.cars[number:number + 1] = [cars[:half], cars[half:]]
+            self.maxes[number:number + 1] = [(values[half - 1],
+                                              id(cars[half - 1])),
+                                             self.maxes[number]]
+            self.owned[number:number + 1] = [True, True]
+
+    def remove(self, value, car):
+        number = bisect_left(self.maxes, (value, id(car)))
+        if number == len(self.maxes):
+            return
+        values, cars = self.values[number], self.cars[number]
+        position = self._position(values, cars, value, car)
+        if position == len(cars) or cars[position] is not car:
+            return
+        values, cars = self._writable(number)
+        del values[position]
+        del cars[position]
+        if values:
+            self.maxes[number] = (values[-1], id(cars[-1]))
+        else:
+            del self.values[number]
+            del self.cars[number]
+            del self.maxes[number]
+            del self.owned[number]
+
+    def extend(self, values, cars):
+        # values are ints, so a value and an id pack into one int key; the
+        # column is one sorted run and the new pairs another, which the
+        # sort merges
+        values = list(chain.from_iterable(self.values)) + list(values)
+        cars = list(chain.from_iterable(self.cars)) + list(cars)
+        keys = [value << 64 | id(car) for value, car in zip(values, cars)]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._chunk([values[position] for position in order],
+                    [cars[position] for position in order])
+
+    def discard(self, cars):
+        # one pass over the column keeps its order, so nothing is sorted
+        kept_values = []
+        kept_cars = []
+        for values, chunk in zip(self.values, self.cars):
+            keep = [car not in cars for car in chunk]
+            kept_values.extend(compress(values, keep))
+            kept_cars.extend(compress(chunk, keep))
+        self._chunk(kept_values, kept_cars)
+
+    def _runs(self, low, high):
+        # (chunk number, start, end) for the pairs with low <= value <= high
+        first = 0 if low is None else bisect_left(self.maxes, (low,))
+        for number in range(first, len(self.values)):
+            values = self.values[number]
+            start = 0 if low is None or number > first else bisect_left(
+                values, low)
+            end = len(values) if high is None else bisect_right(values, high)
+            if start < end:
+                yield number, start, end
+            if end < len(values):
+                return
+
+    def count(self, low=None, high=None):
+        return sum(end - start for _, start, end in self._runs(low, high))
+
+    def between(self, low=None, high=None):
+        cars = []
+        for number, start, end in self._runs(low, high):
+            cars.extend(self.cars[number][start:end])
+        return cars
+
+    def ordered(self, descending=False):
+        if descending:
+            return (car for cars in reversed(self.cars)
+                    for car in reversed(cars))
+        return (car for cars in self.cars for car in cars)
+
+
+class LayeredDict(MutableMapping):
+    # a dict kept as a base that is never changed in place plus the keys
+    # set and removed since; a copy shares the base and copies only those
+    # changes, which are folded into a new base once they outgrow FOLD or
+    # eight times the square root of the base. Iteration follows dict order
+    FOLD = 1024
+
+    def __init__(self, items=()):
+        self.base = dict(items)
+        self.changes = {}
+        self.removed = set()
+        self.size = len(self.base)
+
+    def copy(self):
+        layered = LayeredDict()
+        layered.base = self.base
+        layered.changes = self.changes.copy()
+        layered.removed = self.removed.copy()
+        layered.size = self.size
+        return layered
+
+    def __getitem__(self, key):
+        if key in self.changes:
+            return self.changes[key]
+        if key in self.removed:
+            raise KeyError(key)
+        return self.base[key]
+
+    def __contains__(self, key):
+        return key in self.changes or (key in self.base
+                                       and key not in self.removed)
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.size += 1
+        self.changes[key] = value
+        self._fold()
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.size -= 1
+        self.changes.pop(key, None)
+        if key in self.base:
+            self.removed.add(key)
+        self._fold()
+
+    def update(self, other=(), **kwargs):
+        changes = dict(other, **kwargs)
+        self.size += sum(key not in self for key in changes)
+        self.changes.update(changes)
+        self._fold()
+
+    def _fold(self):
+        if (len(self.changes) + len(self.removed)
+                > max(self.FOLD, 8 * int(len(self.base) ** 0.5))):
+            # a key removed and set again is deleted first, so it moves
+            # to the end
+            base = self.base.copy()
+            for key in self.removed:
+                del base[key]
+            base.update(self.changes)
+            self.base = base
+            self.changes = {}
+            self.removed = set()
+
+    def _items(self):
+        if not self.changes and not self.removed:
+            return iter(self.base.items())
+        return chain(((key, self.changes.get(key, value))
+                      for key, value in self.base.items()
+                      if key not in self.removed),
+                     ((key, value) for key, value in self.changes.items()
+                      if key in self.removed or key not in self.base))
+
+    def __iter__(self):
+        return (key for key, _ in self._items())
+
+    def __len__(self):
+        return self.size
+
+    def values(self):
+        return [value for _, value in self._items()]
+
+    def items(self):
+        return list(self._items())
+
+    def __reduce__(self):
+        return dict, (dict(self._items()),)
+
+    def __repr__(self):
+        return repr(dict(self._items()))
+
+
+class CarIndex:
+    # hash indexes on producer and model and sorted columns on the numeric
+    # fields; a search starts from the predicate that matches the fewest
+    # cars and narrows that down with the others
+    HASHED = ("producer", "model")
+    SORTED = {"release_year": "release_year", "cost": "cost_cents",
+              "potential_sale_price": "potential_sale_price_cents"}
+    MONEY = ("cost", "potential_sale_price")
+    # below this many cars one update per car beats rebuilding the columns
+    BULK = 64
+
+    def __init__(self, cars=(), layered=False):
+        # a layered index keeps its cars and buckets in LayeredDicts, so
+        # a copy for a thread-safe salon does not grow with the inventory
+        self.layered = layered
+        self.cars = self._dict()
+        self.hashed = {name: {} for name in self.HASHED}
+        self.sorted = {name: SortedColumn() for name in self.SORTED}
+        self.shared = set()
+        self.extend(cars)
+
+    def __len__(self):
+        return len(self.cars)
+
+    def _dict(self):
+        return LayeredDict() if self.layered else {}
+
+    def copy(self):
+        # buckets and column chunks stay shared until they change
+        index = CarIndex(layered=self.layered)
+        index.cars = self.cars.copy()
+        index.hashed = {name: buckets.copy()
+                        for name, buckets in self.hashed.items()}
+        index.sorted = {name: column.copy()
+                        for name, column in self.sorted.items()}
+        self.shared = {id(bucket) for buckets in self.hashed.values()
+                       for bucket in buckets.values()}
+        index.shared = self.shared.copy()
+        return index
+
+    def _bucket(self, name, value):
+        buckets = self.hashed[name]
+        bucket = buckets.get(value)
+        if bucket is None:
+            bucket = buckets[value] = self._dict()
+        elif id(bucket) in self.shared:
+            self.shared.discard(id(bucket))
+            bucket = buckets[value] = bucket.copy()
+        return bucket
+
+    @staticmethod
+    def _value(car, attribute):
+        # release years typed into the menu arrive as text; a car whose
+        # value is not a number stays out of that column
+        value = getattr(car, attribute)
+        if isinstance(value, int):
+            return value
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _hash(self, car):
+        for name in self.HASHED:
+            self._bucket(name, getattr(car, name))[car.car_id] = car
+
+    def _unhash(self, car):
+        for name in self.HASHED:
+            value = getattr(car, name)
+            bucket = self._bucket(name, value)
+            del bucket[car.car_id]
+            if not bucket:
+                del self.hashed[name][value]
+
+    def add(self, car):
+        self.remove(car.car_id)
+        self.cars[car.car_id] = car
+        self._hash(car)
+        for name, attribute in self.SORTED.items():
+            value = self._value(car, attribute)
+            if value is not None:
+                self.sorted[name].insert(value, car)
+
+    def extend(self, cars):
+        cars = list(cars)
+        if len(cars) < self.BULK:
+            for car in cars:
+                self.add(car)
+            return
+        self.remove_many([car.car_id for car in cars])
+        self.cars.update((car.car_id, car) for car in cars)
+        for name in self.HASHED:
+            groups = {}
+            for car in cars:
+                groups.setdefault(getattr(car, name), {})[car.car_id] = car
+            for value, group in groups.items():
+                self._bucket(name, value).update(group)
+        for name, attribute in self.SORTED.items():
+            values = [self._value(car, attribute) for car in cars]
+            indexed = [car for car, value in zip(cars, values)
+                       if value is not None]
+            self.sorted[name].extend(
+                [value for value in values if value is not None], indexed)
+
+    def remove(self, car_id):
+        car = self.cars.pop(car_id, None)
+        if car is None:
+            return
+        self._unhash(car)
+        for name, attribute in self.SORTED.items():
+            value = self._value(car, attribute)
+            if value is not None:
+                self.sorted[name].remove(value, car)
+
+    def remove_many(self, car_ids):
+        removed = {car_id for car_id in car_ids if car_id in self.cars}
+        if len(removed) < self.BULK:
+            for car_id in removed:
+                self.remove(car_id)
+            return
+        dropped = set()
+        for car_id in removed:
+            car = self.cars.pop(car_id)
+            self._unhash(car)
+            dropped.add(car)
+        for column in self.sorted.values():
+            column.discard(dropped)
+
+    def _bounds(self, name, limits):
+        # limits is one value or an inclusive (low, high) pair, where
+        # either end may be None
+        low, high = (limits if isinstance(limits, (tuple, list))
+                     else (limits, limits))
+        if name in self.MONEY:
+            low = None if low is None else Money.to_cents(low)
+            high = None if high is None else Money.to_cents(high)
+        return low, high
+
+    @staticmethod
+    def _between(value, low, high):
+        return (value is not None and (low is None or value >= low)
+                and (high is None or value <= high))
+
+    def search(self, producer=None, model=None, release_year=None, cost=None,
+               potential_sale_price=None, order_by=None, descending=False,
+               limit=None):
+        if order_by is not None and order_by not in self.SORTED:
+            raise ValueError(f"Cars can be ordered by "
+                             f"{', '.join(self.SORTED)}, not {order_by}")
+        sources = []
+        for name, value in (("producer", producer), ("model", model)):
+            if value is not None:
+                bucket = self.hashed[name].get(value, {})
+                sources.append((len(bucket), name,
+                                lambda bucket=bucket: list(bucket.values()),
+                                lambda car, name=name, value=value:
+                                getattr(car, name) == value))
+        for name, limits in (("release_year", release_year), ("cost", cost),
+                             ("potential_sale_price", potential_sale_price)):
+            if limits is not None:
+                low, high = self._bounds(name, limits)
+                column = self.sorted[name]
+                sources.append((column.count(low, high), name,
+                                lambda column=column, low=low, high=high:
+                                column.between(low, high),
+                                lambda car, attribute=self.SORTED[name],
+                                low=low, high=high: self._between(
+                                    self._value(car, attribute), low, high)))
+        if not sources:
+            if order_by is None:
+                return list(islice(self.cars.values(), limit))
+            column = self.sorted[order_by]
+            cars = column.ordered(descending)
+            if len(column) < len(self.cars):
+                # cars without a numeric value are not in the column and
+                # sort last
+                attribute = self.SORTED[order_by]
+                cars = chain(cars, (car for car in self.cars.values()
+                                    if self._value(car, attribute) is None))
+            return list(islice(cars, limit))
+
+        # the smallest match list drives; a larger one is intersected as a
+        # set, unless checking the few remaining cars directly is cheaper
+        sources.sort(key=lambda source: source[0])
+        _, driver, rows, _ = sources[0]
+        matches = rows()
+        wanted = None
+        checks = []
+        for size, _, rows, check in sources[1:]:
+            if len(matches) * 4 < size:
+                checks.append(check)
+            elif wanted is None:
+                wanted = set(rows())
+            else:
+                wanted.intersection_update(rows())
+        if wanted is not None:
+            matches = [car for car in matches if car in wanted]
+        for check in checks:
+            matches = list(filter(check, matches))
+
+        if order_by is not None:
+            attribute = self.SORTED[order_by]
+
+            def key(car):
+                # cars without a numeric value sort last either way
+                value = self._value(car, attribute)
+                return (value is None) != descending, value or 0
+
+            if limit is not None and driver != order_by:
+                pick = heapq.nlargest if descending else heapq.nsmallest
+                return pick(limit, matches, key=key)
+            if driver != order_by or descending:
+                matches.sort(key=key, reverse=descending)
+        return matches[:limit]
+
+
+class DateOrdinal:
+    # int64 microseconds since datetime.min, so a datetime comes back
+    # unchanged when a Sale is rebuilt from a column or a binary record
+    _MICROSECOND = timedelta(microseconds=1)
+
+    @staticmethod
+    def encode(value):
+        if not isinstance(value, datetime):
+            value = datetime.combine(value, datetime.min.time())
+        return (value - datetime.min) // DateOrdinal._MICROSECOND
+
+    @staticmethod
+    def decode(ordinal):
+        return datetime.min + int(ordinal) * DateOrdinal._MICROSECOND
+
+
+class ColumnarSales:
+    def __init__(self, sales=(), capacity=1024):
+        if np is None:
+            raise ImportError("Columnar sales storage requires numpy")
+        self._size = 0
+        self._dates = np.empty(capacity, dtype=np.int64)
+        # amounts in cents, so sums over the columns are exact
+        self._prices = np.empty(capacity, dtype=np.int64)
+        self._costs = np.empty(capacity, dtype=np.int64)
+        self._potential_prices = np.empty(capacity, dtype=np.int64)
+        self._employee_codes = np.empty(capacity, dtype=np.int32)
+        self._producer_codes = np.empty(capacity, dtype=np.int32)
+        self._model_codes = np.empty(capacity, dtype=np.int32)
+        self._release_year_codes = np.empty(capacity, dtype=np.int32)
+        self._car_ids = []
+        self._employees = []
+        self._employee_lookup = {}
+        self._employee_name_codes = []
+        self._names = []
+        self._name_lookup = {}
+        self._producers = []
+        self._producer_lookup = {}
+        self._models = []
+        self._model_lookup = {}
+        self._release_years = []
+        self._release_year_lookup = {}
+        for sale in sales:
+            self.append(sale)
+
+    @staticmethod
+    def _encode(value, table, lookup):
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(table)
+            table.append(value)
+        return code
+
+    def _grow(self):
+        capacity = max(2 * len(self._dates), 1024)
+        for column in ("_dates", "_prices", "_costs", "_potential_prices",
+                       "_employee_codes", "_producer_codes", "_model_codes",
+                       "_release_year_codes"):
+            old = getattr(self, column)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, column, new)
+
+    def append(self, sale):
+        if self._size == len(self._dates):
+            self._grow()
+        row = self._size
+        employee = sale.employee
+        # keyed on every field: an employee re-added with new details gets
+        # a new code, and the old sales keep the old details
+        key = (employee.employee_id, employee.full_name, employee.position,
+               employee.phone_number, employee.email)
+        employee_code = self._employee_lookup.get(key)
+        if employee_code is None:
+            employee_code = len(self._employees)
+            self._employee_lookup[key] = employee_code
+            self._employees.append(employee)
+            self._employee_name_codes.append(
+                self._encode(employee.full_name, self._names,
+                             self._name_lookup))
+        car = sale.car
+        self._dates[row] = DateOrdinal.encode(sale.sale_date)
+        self._prices[row] = sale.real_sale_price_cents
+        self._costs[row] = car.cost_cents
+        self._potential_prices[row] = car.potential_sale_price_cents
+        self._employee_codes[row] = employee_code
+        self._producer_codes[row] = self._encode(
+            car.producer, self._producers, self._producer_lookup)
+        self._model_codes[row] = self._encode(
+            car.model, self._models, self._model_lookup)
+        self._release_year_codes[row] = self._encode(
+            car.release_year, self._release_years, self._release_year_lookup)
+        self._car_ids.append(car.car_id)
+        self._size += 1
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self._materialize(index)
+                    for index in range(*row.indices(self._size))]
+        if row < 0:
+            row += self._size
+        if not 0 <= row < self._size:
+            raise IndexError("sale index out of range")
+        return self._materialize(row)
+
+    def __iter__(self):
+        return map(self._materialize, range(self._size))
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def _materialize(self, row):
+        car = Car.from_fields(
+            self._car_ids[row], self._producers[self._producer_codes[row]],
+            self._models[self._model_codes[row]],
+            self._release_years[self._release_year_codes[row]],
+            int(self._costs[row]), int(self._potential_prices[row]))
+        return Sale.from_fields(self._employees[self._employee_codes[row]],
+                                car, DateOrdinal.decode(self._dates[row]),
+                                int(self._prices[row]))
+
+    def _mask(self, start_date=None, end_date=None):
+        dates = self._dates[:self._size]
+        mask = np.ones(self._size, dtype=bool)
+        if start_date is not None:
+            mask &= dates >= DateOrdinal.encode(start_date)
+        if end_date is not None:
+            mask &= dates <= DateOrdinal.encode(end_date)
+        return mask
+
+    def _rows(self, mask):
+        # same order as SaleIndex: by date, then by registration
+        rows = np.flatnonzero(mask)
+        return rows[np.argsort(self._dates[rows], kind="stable")]
+
+    def in_period(self, start_date=None, end_date=None):
+        return list(self.iter_period(start_date, end_date))
+
+    def iter_period(self, start_date=None, end_date=None):
+        return map(self._materialize,
+                   self._rows(self._mask(start_date, end_date)).tolist())
+
+    def on_date(self, date):
+        return self.in_period(date, date)
+
+    def employee_sales(self, employee_id, start_date=None, end_date=None):
+        codes = [code for code, employee in enumerate(self._employees)
+                 if employee.employee_id == employee_id]
+        if not codes:
+            return []
+        mask = self._mask(start_date, end_date)
+        mask &= np.isin(self._employee_codes[:self._size], codes)
+        return [self._materialize(row) for row in self._rows(mask).tolist()]
+
+    def model_sales(self, producer, model, start_date=None, end_date=None):
+        if (producer not in self._producer_lookup
+                or model not in self._model_lookup):
+            return []
+        mask = self._mask(start_date, end_date)
+        mask &= (self._producer_codes[:self._size]
+                 == self._producer_lookup[producer])
+        mask &= self._model_codes[:self._size] == self._model_lookup[model]
+        return [self._materialize(row) for row in self._rows(mask).tolist()]
+
+    def period_summary(self, start_date, end_date):
+        summary = PeriodSummary()
+        mask = self._mask(start_date, end_date)
+        summary.sales_count = int(np.count_nonzero(mask))
+        if not summary.sales_count:
+            return summary
+
+        revenue = int(self._prices[:self._size][mask].sum())
+        summary.revenue_cents = revenue
+        summary.profit_cents = revenue - int(self._costs[:self._size][mask]
+                                             .sum())
+        model_counts = np.bincount(self._model_codes[:self._size][mask],
+                                   minlength=len(self._models))
+        name_codes = np.asarray(self._employee_name_codes, dtype=np.int32)
+        employee_counts = np.bincount(
+            name_codes[self._employee_codes[:self._size][mask]],
+            minlength=len(self._names))
+        for counts, table, counter in (
+                (model_counts, self._models, summary.model_sales),
+                (employee_counts, self._names, summary.employee_sales)):
+            for code in np.flatnonzero(counts).tolist():
+                counter[table[code]] = int(counts[code])
+        return summary
+
+    def group_totals(self, start_date, end_date, by, metric):
+        mask = self._mask(start_date, end_date)
+        if by == "employee":
+            name_codes = np.asarray(self._employee_name_codes, dtype=np.int32)
+            codes = name_codes[self._employee_codes[:self._size][mask]]
+            table = self._names
+        elif by == "producer":
+            codes = self._producer_codes[:self._size][mask]
+            table = self._producers
+        else:
+            codes = self._model_codes[:self._size][mask]
+            table = self._models
+        if not codes.size:
+            return {}
+        if metric == "count":
+            counts = np.bincount(codes, minlength=len(table))
+            return {table[code]: int(counts[code])
+                    for code in np.flatnonzero(counts).tolist()}
+
+        # cents per group; int64 sums stay exact where float weights
+        # in bincount would round
+        values = self._prices[:self._size][mask]
+        if metric == "profit":
+            values = values - self._costs[:self._size][mask]
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        starts = np.flatnonzero(np.concatenate(([True],
+                                                codes[1:] != codes[:-1])))
+        totals = np.add.reduceat(values[order], starts)
+        return dict(zip((table[code] for code in codes[starts].tolist()),
+                        totals.tolist()))
+
+
+class SalonJournal:
+    # each record is a length and crc32 header followed by a pickled
+    # (sequence, operation, args) tuple
+    _HEADER = struct.Struct("<II")
+
+    def __init__(self, filename, checkpoint_every=1000, metrics=NO_METRICS):
+        self.filename = filename
+        self.log_filename = f"{filename}.log"
+        self.checkpoint_every = checkpoint_every
+        self.metrics = metrics
+        self.sequence = 0
+        self.pending = 0
+        self._log = None
+
+    def read(self):
+        try:
+            with open(self.filename, 'rb') as file:
+                data = pickle.load(file)
+        except FileNotFoundError:
+            data = None
+        snapshot_sequence = data.get("journal_sequence", 0) if data else 0
+        self.sequence = snapshot_sequence
+
+        records = []
+        good_offset = end = 0
+        try:
+            with open(self.log_filename, 'rb') as log:
+                while True:
+                    header = log.read(self._HEADER.size)
+                    if len(header) < self._HEADER.size:
+                        break
+                    length, checksum = self._HEADER.unpack(header)
+                    payload = log.read(length)
+                    if (len(payload) < length
+                            or zlib.crc32(payload) != checksum):
+                        break
+                    good_offset = log.tell()
+                    sequence, operation, args = pickle.loads(payload)
+                    # records already folded into the snapshot are skipped,
+                    # which covers a crash between snapshot and log reset
+                    if sequence > snapshot_sequence:
+                        records.append((operation, args))
+                        self.sequence = sequence
+                end = log.seek(0, os.SEEK_END)
+        except FileNotFoundError:
+            pass
+
+        if good_offset < end:
+            # drop a record torn by a crash in the middle of an append
+            with open(self.log_filename, 'r+b') as log:
+                log.truncate(good_offset)
+            self.metrics.count("journal.discarded_bytes", end - good_offset)
+            self.metrics.event("load_data",
+                               f"Discarded {end - good_offset} bytes of "
+                               f"incomplete journal records in "
+                               f"{self.log_filename}")
+        self.pending = len(records)
+        return data, records
+
+    def append(self, operation, *args):
+        if self._log is None:
+            self._log = open(self.log_filename, 'ab')
+        self.sequence += 1
+        payload = pickle.dumps((self.sequence, operation, args),
+                               pickle.HIGHEST_PROTOCOL)
+        self._log.write(self._HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._log.write(payload)
+        self._log.flush()
+        self.pending += 1
+
+    def needs_checkpoint(self):
+        return self.pending >= self.checkpoint_every
+
+    def checkpoint(self, data):
+        temp_filename = f"{self.filename}.tmp"
+        with open(temp_filename, 'wb') as file:
+            pickle.dump(dict(data, journal_sequence=self.sequence), file)
+        os.replace(temp_filename, self.filename)
+        self.close()
+        open(self.log_filename, 'wb').close()
+        self.pending = 0
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+class IncrementalSnapshot:
+    # a pickled base, readable by LoadDataFromFile, plus delta files
+    # filename.1.delta, filename.2.delta, ... holding the employees and cars
+    # changed since (None for removed) and the sales appended since. Every
+    # base gets a new generation, and only the unbroken run of deltas of
+    # the base's generation is applied, so deltas left behind by an older
+    # base or a crash are ignored. Each file is written to a temporary
+    # name and renamed, so a crash mid-save leaves the previous file whole
+    GENERATION = "delta_generation"
+
+    @staticmethod
+    def is_base(data):
+        return (isinstance(data, dict)
+                and IncrementalSnapshot.GENERATION in data)
+
+    @staticmethod
+    def delta_filename(filename, sequence):
+        return f"{filename}.{sequence}.delta"
+
+    @staticmethod
+    def _write_atomic(value, filename):
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, 'wb') as file:
+            pickle.dump(value, file, pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, filename)
+        return os.path.getsize(filename)
+
+    @staticmethod
+    def write_base(data, filename):
+        generation = os.urandom(8).hex()
+        written = IncrementalSnapshot._write_atomic(
+            dict(data, **{IncrementalSnapshot.GENERATION: generation}),
+            filename)
+        sequence = 1
+        while True:
+            try:
+                os.remove(IncrementalSnapshot.delta_filename(filename,
+                                                             sequence))
+            except FileNotFoundError:
+                break
+            sequence += 1
+        return generation, written
+
+    @staticmethod
+    def write_delta(changes, filename, generation, sequence):
+        return IncrementalSnapshot._write_atomic(
+            dict(changes, generation=generation),
+            IncrementalSnapshot.delta_filename(filename, sequence))
+
+    @staticmethod
+    def apply_deltas(data, filename):
+        data = dict(data)
+        generation = data.pop(IncrementalSnapshot.GENERATION)
+        sequence = 1
+        while True:
+            try:
+                with open(IncrementalSnapshot.delta_filename(
+                        filename, sequence), 'rb') as file:
+                    delta = pickle.load(file)
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                break
+            if delta.get("generation") != generation:
+                break
+            for name in ("employees", "cars"):
+                container = data.setdefault(name, {})
+                for key, value in delta[name].items():
+                    if value is None:
+                        container.pop(key, None)
+                    else:
+                        container[key] = value
+            data.setdefault("sales", []).extend(delta["sales"])
+            sequence += 1
+        return data
+
+
+class AutoSaver:
+    # writers record what they changed while holding the salon lock; the
+    # saver swaps those changes out under the same lock and writes them
+    # after releasing it, so a save never holds up register_sale
+    def __init__(self, salon, filename, interval=30.0, threshold=1000,
+                 compact_every=50):
+        self.salon = salon
+        self.filename = filename
+        self.interval = interval
+        self.threshold = threshold
+        self.compact_every = compact_every
+        self.pending = self._empty()
+        self.changes = 0
+        self.full = True
+        self.generation = None
+        self.deltas = 0
+        self.write_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+    @staticmethod
+    def _empty():
+        return {"employees": {}, "cars": {}, "sales": []}
+
+    def mark(self, name, key, value):
+        self.pending[name][key] = value
+        self._count(1)
+
+    def mark_sales(self, sales):
+        self.pending["sales"].extend(sales)
+        self._count(len(sales))
+
+    def _count(self, changes):
+        self.changes += changes
+        if self.changes >= self.threshold:
+            self.wake.set()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name=f"autosave {self.filename}")
+        self.thread.start()
+        self.wake.set()
+
+    def stop(self):
+        self.stopping = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            if self.stopping:
+                return
+            self.flush()
+
+    def flush(self):
+        salon = self.salon
+        metrics = salon.metrics
+        with self.write_lock:
+            with salon._lock:
+                pending, self.pending = self.pending, self._empty()
+                self.changes = 0
+                full = self.full or self.deltas >= self.compact_every
+                self.full = False
+                view = salon.snapshot() if full else None
+            if not full and not any(pending.values()):
+                return True
+            try:
+                with metrics.timer("autosave"):
+                    if full:
+                        self.generation, written = (
+                            IncrementalSnapshot.write_base(view._data(),
+                                                           self.filename))
+                        self.deltas = 0
+                    else:
+                        self.deltas += 1
+                        written = IncrementalSnapshot.write_delta(
+                            pending, self.filename, self.generation,
+                            self.deltas)
+            except OSError as e:
+                # the changes taken out are lost to the deltas, so the next
+                # save writes a whole new base instead
+                self.full = True
+                metrics.count("autosave.errors")
+                metrics.event("autosave",
+                              f"Error saving file {self.filename}: {e}")
+                return False
+        metrics.count("autosave.base" if full else "autosave.delta")
+        metrics.count("autosave.bytes", written)
+        return True
+
+
+class ChunkedSnapshot:
+    # layout: magic and codec, then frames of (length, crc32) followed by
+    # that many compressed bytes: a header frame with employees and cars,
+    # one frame per chunk of sales, and an empty frame with the sale count
+    MAGIC = b"SALONCZ2"
+    # the first version stored sale prices in units instead of cents
+    LEGACY_MAGIC = b"SALONCZ1"
+    PREFIX = struct.Struct("<8sB")
+    FRAME = struct.Struct("<II")
+    COUNT = struct.Struct("<Q")
+    CODECS = {"zlib": 1, "lzma": 2}
+    CHUNK_SALES = 8192
+
+    @staticmethod
+    def is_snapshot(filename):
+        try:
+            with open(filename, 'rb') as file:
+                return file.read(len(ChunkedSnapshot.MAGIC)) in (
+                    ChunkedSnapshot.MAGIC, ChunkedSnapshot.LEGACY_MAGIC)
+        except OSError:
+            return False
+
+    @staticmethod
+    def _compress(codec, payload):
+        if codec == ChunkedSnapshot.CODECS["lzma"]:
+            return lzma.compress(payload)
+        return zlib.compress(payload)
+
+    @staticmethod
+    def _decompress(codec, number, payload):
+        try:
+            if codec == ChunkedSnapshot.CODECS["lzma"]:
+                return lzma.decompress(payload)
+            return zlib.decompress(payload)
+        except (zlib.error, lzma.LZMAError) as e:
+            raise ValueError(f"Chunk {number} does not decompress: {e}")
+
+    @staticmethod
+    def write(data, filename, compression="zlib"):
+        if compression not in ChunkedSnapshot.CODECS:
+            raise ValueError(f"Unknown compression {compression}")
+        codec = ChunkedSnapshot.CODECS[compression]
+        employees = list(data["employees"].values())
+        # sales name their employee by code, and a chunk carries the
+        # employees that no earlier chunk or the header introduced
+        codes = {id(employee): code for code, employee in enumerate(employees)}
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, 'wb') as file:
+            def write_frame(value):
+                payload = ChunkedSnapshot._compress(
+                    codec, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                file.write(ChunkedSnapshot.FRAME.pack(len(payload),
+                                                      zlib.crc32(payload)))
+                file.write(payload)
+
+            file.write(ChunkedSnapshot.PREFIX.pack(ChunkedSnapshot.MAGIC,
+                                                   codec))
+            write_frame((employees, data["cars"]))
+            sales = iter(data["sales"])
+            count = 0
+            while chunk := list(islice(sales, ChunkedSnapshot.CHUNK_SALES)):
+                new_employees = []
+                rows = []
+                for sale in chunk:
+                    code = codes.get(id(sale.employee))
+                    if code is None:
+                        code = codes[id(sale.employee)] = len(codes)
+                        new_employees.append(sale.employee)
+                    rows.append((code, sale.car, sale.sale_date,
+                                 sale.real_sale_price_cents))
+                write_frame((new_employees, rows))
+                count += len(rows)
+            file.write(ChunkedSnapshot.FRAME.pack(0, 0))
+            file.write(ChunkedSnapshot.COUNT.pack(count))
+        os.replace(temp_filename, filename)
+
+    @staticmethod
+    def _frames(file):
+        number = 0
+        while True:
+            frame = file.read(ChunkedSnapshot.FRAME.size)
+            if len(frame) < ChunkedSnapshot.FRAME.size:
+                raise ValueError("Snapshot is truncated")
+            length, checksum = ChunkedSnapshot.FRAME.unpack(frame)
+            if not length:
+                return
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                raise ValueError(f"Chunk {number} is corrupt")
+            yield number, payload
+            number += 1
+
+    @staticmethod
+    def read(filename, workers=None):
+        workers = workers or os.cpu_count() or 1
+        with open(filename, 'rb') as file, \
+                ThreadPoolExecutor(max_workers=workers) as executor:
+            magic, codec = ChunkedSnapshot.PREFIX.unpack(
+                file.read(ChunkedSnapshot.PREFIX.size))
+            if magic not in (ChunkedSnapshot.MAGIC,
+                             ChunkedSnapshot.LEGACY_MAGIC):
+                raise ValueError(f"{filename} is not a chunked snapshot")
+            build_sale = (Sale if magic == ChunkedSnapshot.LEGACY_MAGIC
+                          else Sale.from_fields)
+            # the codecs release the GIL, so a few chunks decompress on
+            # worker threads while earlier ones are unpickled here
+            pending = deque()
+            employees = None
+            data = {"sales": []}
+            frames = ChunkedSnapshot._frames(file)
+            while True:
+                for number, payload in islice(frames,
+                                              2 * workers - len(pending)):
+                    pending.append(executor.submit(
+                        ChunkedSnapshot._decompress, codec, number, payload))
+                if not pending:
+                    break
+                value = pickle.loads(pending.popleft().result())
+                if employees is None:
+                    employees, data["cars"] = value
+                    data["employees"] = {employee.employee_id: employee
+                                         for employee in employees}
+                    continue
+                new_employees, rows = value
+                employees.extend(new_employees)
+                data["sales"].extend(
+                    build_sale(employees[code], car, sale_date, price)
+                    for code, car, sale_date, price in rows)
+            count = file.read(ChunkedSnapshot.COUNT.size)
+        if (employees is None or len(count) < ChunkedSnapshot.COUNT.size
+                or ChunkedSnapshot.COUNT.unpack(count)[0]
+                != len(data["sales"])):
+            raise ValueError("Snapshot is truncated")
+        return data
+
+
+class BinarySnapshot:
+    # layout: magic, header length, pickled header (employees, cars and
+    # string tables), then fixed-width sale records sorted by sale date
+    MAGIC = b"SALONMM2"
+    PREFIX = struct.Struct("<8sQ")
+    # amounts in cents
+    RECORD = struct.Struct("<qqiiiiqqqB")
+    # the first version stored amounts as doubles in units
+    LEGACY_MAGIC = b"SALONMM1"
+    LEGACY_RECORD = struct.Struct("<qqiiiidddB")
+    _CHUNK_RECORDS = 4096
+    # flag bit: car_id is a value-table code
+    CAR_ID_CODE = 1
+
+    @staticmethod
+    def is_snapshot(filename):
+        try:
+            with open(filename, 'rb') as file:
+                return file.read(len(BinarySnapshot.MAGIC)) in (
+                    BinarySnapshot.MAGIC, BinarySnapshot.LEGACY_MAGIC)
+        except OSError:
+            return False
+
+    @staticmethod
+    def write(data, filename):
+        sales = sorted(data["sales"], key=lambda sale: sale.sale_date)
+        employees = {}
+        values = {}
+        records = []
+        for sale in sales:
+            employee = sale.employee
+            employee_code = employees.setdefault(
+                (employee.employee_id, employee.full_name, employee.position,
+                 employee.phone_number, employee.email), len(employees))
+            car = sale.car
+            car_id_is_code = type(car.car_id) is not int
+            flags = car_id_is_code * BinarySnapshot.CAR_ID_CODE
+            records.append((
+                DateOrdinal.encode(sale.sale_date),
+                values.setdefault(car.car_id, len(values))
+                if car_id_is_code else car.car_id,
+                employee_code,
+                values.setdefault(car.producer, len(values)),
+                values.setdefault(car.model, len(values)),
+                values.setdefault(car.release_year, len(values)),
+                car.cost_cents, car.potential_sale_price_cents,
+                sale.real_sale_price_cents, flags))
+        header = pickle.dumps({
+            "employees": data["employees"],
+            "cars": data["cars"],
+            "sale_employees": list(employees),
+            "values": list(values),
+            "count": len(records),
+        }, pickle.HIGHEST_PROTOCOL)
+
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, 'wb') as file:
+            file.write(BinarySnapshot.PREFIX.pack(BinarySnapshot.MAGIC,
+                                                  len(header)))
+            file.write(header)
+            pack = BinarySnapshot.RECORD.pack
+            for start in range(0, len(records),
+                               BinarySnapshot._CHUNK_RECORDS):
+                chunk = records[start:start + BinarySnapshot._CHUNK_RECORDS]
+                file.write(b"".join(pack(*record) for record in chunk))
+        os.replace(temp_filename, filename)
+
+
+class _MappedDates:
+    def __init__(self, sales):
+        self.sales = sales
+
+    def __len__(self):
+        return self.sales.mapped_count
+
+    def __getitem__(self, row):
+        return self.sales.ordinal_at(row)
+
+
+class MappedSales:
+    # sales read straight from a memory-mapped BinarySnapshot; sales
+    # registered after loading are kept in an in-memory SaleIndex
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as file:
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = BinarySnapshot.PREFIX.unpack_from(self._buffer)
+        if magic not in (BinarySnapshot.MAGIC, BinarySnapshot.LEGACY_MAGIC):
+            raise ValueError(f"{filename} is not a binary salon snapshot")
+        self._legacy = magic == BinarySnapshot.LEGACY_MAGIC
+        self._record_struct = (BinarySnapshot.LEGACY_RECORD if self._legacy
+                               else BinarySnapshot.RECORD)
+        header_start = BinarySnapshot.PREFIX.size
+        header = pickle.loads(
+            self._buffer[header_start:header_start + header_length])
+        self.employees = header["employees"]
+        self.cars = header["cars"]
+        self.mapped_count = header["count"]
+        self._sale_employees = header["sale_employees"]
+        self._values = header["values"]
+        self._offset = header_start + header_length
+        self._employee_cache = {}
+        self._dates = _MappedDates(self)
+        self._added = SaleIndex()
+
+    def __reduce__(self):
+        # pickling a mapped store saves the sales as a plain list
+        return list, (list(self),)
+
+    def close(self):
+        self._buffer.close()
+
+    def __len__(self):
+        return self.mapped_count + len(self._added)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[index] for index in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("sale index out of range")
+        if row >= self.mapped_count:
+            return self._added[row - self.mapped_count]
+        return self._materialize(row)
+
+    def __iter__(self):
+        return self.iter_period()
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def append(self, sale):
+        self._added.add(sale)
+
+    def ordinal_at(self, row):
+        return struct.unpack_from(
+            "<q", self._buffer,
+            self._offset + row * self._record_struct.size)[0]
+
+    def _records(self, start, end):
+        size = self._record_struct.size
+        view = memoryview(self._buffer)[self._offset + start * size:
+                                        self._offset + end * size]
+        records = self._record_struct.iter_unpack(view)
+        if self._legacy:
+            return ((*record[:6], *map(Money.to_cents, record[6:9]),
+                     record[9]) for record in records)
+        return records
+
+    def _employee(self, code):
+        employee = self._employee_cache.get(code)
+        if employee is None:
+            employee = self._employee_cache[code] = Employee(
+                *self._sale_employees[code])
+        return employee
+
+    def _materialize(self, row):
+        return self._build_sale(next(self._records(row, row + 1)))
+
+    def _build_sale(self, record):
+        (ordinal, car_id, employee_code, producer_code, model_code,
+         release_year_code, cost, potential_sale_price, real_sale_price,
+         flags) = record
+        values = self._values
+        if flags & BinarySnapshot.CAR_ID_CODE:
+            car_id = values[car_id]
+        car = Car.from_fields(car_id, values[producer_code],
+                              values[model_code], values[release_year_code],
+                              cost, potential_sale_price)
+        return Sale.from_fields(self._employee(employee_code), car,
+                                DateOrdinal.decode(ordinal), real_sale_price)
+
+    def bounds(self, start_date, end_date):
+        start = (0 if start_date is None else
+                 bisect_left(self._dates, DateOrdinal.encode(start_date)))
+        end = (self.mapped_count if end_date is None else
+               bisect_right(self._dates, DateOrdinal.encode(end_date)))
+        return start, end
+
+    def in_period(self, start_date=None, end_date=None):
+        return list(self.iter_period(start_date, end_date))
+
+    def iter_period(self, start_date=None, end_date=None):
+        start, end = self.bounds(start_date, end_date)
+        mapped = map(self._build_sale, self._records(start, end))
+        added = self._added.iter_period(start_date, end_date)
+        return heapq.merge(mapped, added, key=lambda sale: sale.sale_date)
+
+    def on_date(self, date):
+        return self.in_period(date, date)
+
+    def _employee_codes(self, employee_id):
+        return {code for code, fields in enumerate(self._sale_employees)
+                if fields[0] == employee_id}
+
+    def employee_sales(self, employee_id, start_date=None, end_date=None):
+        codes = self._employee_codes(employee_id)
+        start, end = self.bounds(start_date, end_date)
+        mapped = [self._build_sale(record)
+                  for record in self._records(start, end)
+                  if record[2] in codes]
+        added = [sale for sale in self._added.iter_period(start_date, end_date)
+                 if sale.employee.employee_id == employee_id]
+        return list(heapq.merge(mapped, added,
+                                key=lambda sale: sale.sale_date))
+
+    def model_sales(self, producer, model, start_date=None, end_date=None):
+        start, end = self.bounds(start_date, end_date)
+        values = self._values
+        mapped = [self._build_sale(record)
+                  for record in self._records(start, end)
+                  if values[record[3]] == producer
+                  and values[record[4]] == model]
+        added = [sale for sale in self._added.iter_period(start_date, end_date)
+                 if (sale.car.producer, sale.car.model) == (producer, model)]
+        return list(heapq.merge(mapped, added,
+                                key=lambda sale: sale.sale_date))
+
+    def period_summary(self, start_date, end_date):
+        summary = self.summarize_rows(*self.bounds(start_date, end_date))
+        return self.add_new_sales(summary, start_date, end_date)
+
+    def add_new_sales(self, summary, start_date, end_date):
+        for sale in self._added.iter_period(start_date, end_date):
+            summary.add(sale)
+        return summary
+
+    def summarize_rows(self, start, end):
+        summary = PeriodSummary()
+        model_codes = Counter()
+        employee_codes = Counter()
+        for record in self._records(start, end):
+            summary.add_amounts(record[8], record[6])
+            model_codes[record[4]] += 1
+            employee_codes[record[2]] += 1
+        summary.sales_count = end - start
+        for code, count in model_codes.items():
+            summary.model_sales[self._values[code]] += count
+        for code, count in employee_codes.items():
+            summary.employee_sales[self._sale_employees[code][1]] += count
+        return summary
+
+
+class SqliteTable(MutableMapping):
+    # the employees and cars dicts of an AutoSalon, kept in a table; a
+    # soft-deleted row stays behind for the sales that reference it
+    def __init__(self, storage, table, record_type, soft_delete=False):
+        self.storage = storage
+        self.record_type = record_type
+        columns = record_type.__slots__
+        key = columns[0]
+        active = " AND active = 1" if soft_delete else ""
+        self._select = (f"SELECT {', '.join(columns)} FROM {table} "
+                        f"WHERE {key} = ?{active}")
+        self._contains = f"SELECT 1 FROM {table} WHERE {key} = ?{active}"
+        self._keys = f"SELECT {key} FROM {table} WHERE 1{active}"
+        self._values = (f"SELECT {', '.join(columns)} FROM {table} "
+                        f"WHERE 1{active}")
+        self._count = f"SELECT COUNT(*) FROM {table} WHERE 1{active}"
+        if soft_delete:
+            self._insert = (f"INSERT OR REPLACE INTO {table} "
+                            f"({', '.join(columns)}, active) "
+                            f"VALUES ({', '.join('?' * len(columns))}, 1)")
+            self._delete = (f"UPDATE {table} SET active = 0 "
+                            f"WHERE {key} = ? AND active = 1")
+        else:
+            self._insert = (f"INSERT OR REPLACE INTO {table} "
+                            f"({', '.join(columns)}) "
+                            f"VALUES ({', '.join('?' * len(columns))})")
+            self._delete = f"DELETE FROM {table} WHERE {key} = ?"
+
+    def _row(self, record):
+        return tuple(getattr(record, name)
+                     for name in self.record_type.__slots__)
+
+    def __getitem__(self, key):
+        row = self.storage.connection.execute(self._select, (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self.record_type.from_fields(*row)
+
+    def __setitem__(self, key, record):
+        self.storage.connection.execute(self._insert, self._row(record))
+
+    def __delitem__(self, key):
+        if not self.storage.connection.execute(self._delete, (key,)).rowcount:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.storage.connection.execute(
+            self._contains, (key,)).fetchone() is not None
+
+    def __iter__(self):
+        return iter([row[0] for row in
+                     self.storage.connection.execute(self._keys)])
+
+    def __len__(self):
+        return self.storage.connection.execute(self._count).fetchone()[0]
+
+    def values(self):
+        return [self.record_type.from_fields(*row)
+                for row in self.storage.connection.execute(self._values)]
+
+    def update(self, records):
+        self.storage.connection.executemany(
+            self._insert, map(self._row, dict(records).values()))
+
+    def as_dict(self):
+        key = self.record_type.__slots__[0]
+        return {getattr(record, key): record for record in self.values()}
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class SqliteSales:
+    # answers the same queries as SaleIndex, ColumnarSales and MappedSales,
+    # with the employee and car copied into the sale row, since sold cars
+    # leave the cars table and a re-added employee replaces its row
+    _COLUMNS = ("s.employee_id, s.full_name, s.position, s.phone_number, "
+                "s.email, s.car_id, s.producer, s.model, s.release_year, "
+                "s.cost_cents, s.potential_sale_price_cents, s.sale_date, "
+                "s.real_sale_price_cents")
+    _FROM = "FROM sales s"
+    _WINDOW = "s.sale_date BETWEEN ? AND ?"
+    _ORDER = "ORDER BY s.sale_date, s.sale_id"
+    _INSERT = ("INSERT INTO sales (employee_id, full_name, position, "
+               "phone_number, email, car_id, producer, model, "
+               "release_year, cost_cents, potential_sale_price_cents, "
+               "sale_date, real_sale_price_cents) "
+               "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+    _GROUP_KEYS = {"model": "s.model", "producer": "s.producer",
+                   "employee": "s.full_name"}
+    # amounts are integer cents, so SQLite's SUM is exact
+    _GROUP_VALUES = {"count": "COUNT(*)",
+                     "revenue": "SUM(s.real_sale_price_cents)",
+                     "profit": "SUM(s.real_sale_price_cents - s.cost_cents)"}
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    @staticmethod
+    def _row(sale):
+        employee, car = sale.employee, sale.car
+        return (employee.employee_id, employee.full_name, employee.position,
+                employee.phone_number, employee.email, car.car_id,
+                car.producer, car.model, car.release_year, car.cost_cents,
+                car.potential_sale_price_cents,
+                DateOrdinal.encode(sale.sale_date), sale.real_sale_price_cents)
+
+    @staticmethod
+    def _window(start_date, end_date):
+        return (0 if start_date is None else DateOrdinal.encode(start_date),
+                (1 << 63) - 1 if end_date is None
+                else DateOrdinal.encode(end_date))
+
+    def _query(self, where, parameters):
+        employees = {}
+        for row in self.storage.connection.execute(
+                f"SELECT {self._COLUMNS} {self._FROM} WHERE {where} "
+                f"{self._ORDER}", parameters):
+            employee = employees.get(row[:5])
+            if employee is None:
+                employee = employees[row[:5]] = Employee(*row[:5])
+            yield Sale.from_fields(employee, Car.from_fields(*row[5:11]),
+                                   DateOrdinal.decode(row[11]), row[12])
+
+    def append(self, sale):
+        self.storage.connection.execute(self._INSERT, self._row(sale))
+
+    def extend(self, sales):
+        self.storage.connection.executemany(self._INSERT,
+                                            map(self._row, sales))
+
+    def __len__(self):
+        return self.storage.connection.execute(
+            "SELECT COUNT(*) FROM sales").fetchone()[0]
+
+    def __iter__(self):
+        return self.iter_period()
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def in_period(self, start_date=None, end_date=None):
+        return list(self.iter_period(start_date, end_date))
+
+    def iter_period(self, start_date=None, end_date=None):
+        return self._query(self._WINDOW, self._window(start_date, end_date))
+
+    def on_date(self, date):
+        return self.in_period(date, date)
+
+    def employee_sales(self, employee_id, start_date=None, end_date=None):
+        return list(self._query(f"s.employee_id = ? AND {self._WINDOW}",
+                                (employee_id,
+                                 *self._window(start_date, end_date))))
+
+    def model_sales(self, producer, model, start_date=None, end_date=None):
+        return list(self._query(
+            f"s.producer = ? AND s.model = ? AND {self._WINDOW}",
+            (producer, model, *self._window(start_date, end_date))))
+
+    def group_totals(self, start_date, end_date, by, metric):
+        key = self._GROUP_KEYS[by]
+        return dict(self.storage.connection.execute(
+            f"SELECT {key}, {self._GROUP_VALUES[metric]} {self._FROM} "
+            f"WHERE {self._WINDOW} GROUP BY {key}",
+            self._window(start_date, end_date)))
+
+    def period_summary(self, start_date, end_date):
+        summary = PeriodSummary()
+        window = self._window(start_date, end_date)
+        count, revenue, profit = self.storage.connection.execute(
+            "SELECT COUNT(*), SUM(real_sale_price_cents), "
+            "SUM(real_sale_price_cents - cost_cents) FROM sales "
+            "WHERE sale_date BETWEEN ? AND ?", window).fetchone()
+        summary.sales_count = count
+        if not count:
+            return summary
+        summary.revenue_cents = revenue
+        summary.profit_cents = profit
+        summary.model_sales.update(self.group_totals(start_date, end_date,
+                                                     "model", "count"))
+        summary.employee_sales.update(self.group_totals(
+            start_date, end_date, "employee", "count"))
+        return summary
+
+
+class SqliteStorage:
+    # a storage backend hands AutoSalon its employees, cars and sales
+    # containers, and is itself the context every write runs in: the
+    # outermost write commits, or rolls back on an error
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS employees (employee_id PRIMARY KEY, "
+        "full_name, position, phone_number, email, "
+        "active INTEGER NOT NULL DEFAULT 1)",
+        "CREATE TABLE IF NOT EXISTS cars (car_id PRIMARY KEY, producer, "
+        "model, release_year, cost_cents INTEGER, "
+        "potential_sale_price_cents INTEGER)",
+        "CREATE TABLE IF NOT EXISTS sales (sale_id INTEGER PRIMARY KEY, "
+        "employee_id, full_name, position, phone_number, email, "
+        "car_id, producer, model, release_year, "
+        "cost_cents INTEGER, potential_sale_price_cents INTEGER, "
+        "sale_date INTEGER NOT NULL, real_sale_price_cents INTEGER)",
+        "CREATE INDEX IF NOT EXISTS sales_by_date ON sales (sale_date)",
+        "CREATE INDEX IF NOT EXISTS sales_by_employee "
+        "ON sales (employee_id, sale_date)",
+        "CREATE INDEX IF NOT EXISTS sales_by_model "
+        "ON sales (producer, model, sale_date)",
+    )
+
+    def __init__(self, filename=":memory:"):
+        self.filename = filename
+        # one connection for the salon's lifetime; its statement cache
+        # keeps the hot-path queries prepared
+        self.connection = sqlite3.connect(filename, cached_statements=256,
+                                          check_same_thread=False)
+        with self.connection:
+            for statement in self.SCHEMA:
+                self.connection.execute(statement)
+            self._copy_employees_into_sales()
+        self.employees = SqliteTable(self, "employees", Employee,
+                                     soft_delete=True)
+        self.cars = SqliteTable(self, "cars", Car)
+        self.sales = SqliteSales(self)
+        self._depth = 0
+
+    def _copy_employees_into_sales(self):
+        # sales of a database written before they kept their employee take
+        # it from the employees table, where removed employees stay behind
+        columns = {row[1] for row in
+                   self.connection.execute("PRAGMA table_info(sales)")}
+        if "full_name" in columns:
+            return
+        for column in Employee.__slots__[1:]:
+            self.connection.execute(f"ALTER TABLE sales ADD COLUMN {column}")
+        self.connection.execute(
+            "UPDATE sales SET (full_name, position, phone_number, email) = "
+            "(SELECT full_name, position, phone_number, email "
+            "FROM employees e WHERE e.employee_id = sales.employee_id)")
+
+    def __enter__(self):
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._depth -= 1
+        if not self._depth:
+            if exc_type is None:
+                self.connection.commit()
+            else:
+                self.connection.rollback()
+        return False
+
+    def replace(self, data):
+        with self:
+            for table in ("sales", "cars", "employees"):
+                self.connection.execute(f"DELETE FROM {table}")
+            self.employees.update(data.get("employees", {}))
+            self.cars.update(data.get("cars", {}))
+            self.sales.extend(data.get("sales", []))
+
+    def data(self):
+        return {"employees": self.employees.as_dict(),
+                "cars": self.cars.as_dict(), "sales": list(self.sales)}
+
+    def close(self):
+        self.connection.close()
+
+
+class BulkResult:
     def __init__(self):
-        self.employees = {}
-        self.cars = {}
-        self.sales = []
+        self.accepted = 0
+        self.errors = []
+
+    def reject(self, row_number, message):
+        self.errors.append((row_number, message))
+
+    def __repr__(self):
+        return (f"Bulk result: Accepted - {self.accepted}, "
+                f"Rejected - {len(self.errors)}")
+
+
+class BulkSource:
+    EMPLOYEE_FIELDS = ("employee_id", "full_name", "position",
+                       "phone_number", "email")
+    CAR_FIELDS = ("car_id", "producer", "model", "release_year", "cost",
+                  "potential_sale_price")
+    SALE_FIELDS = ("employee_id", "car_id", "sale_date", "real_sale_price")
+
+    @staticmethod
+    def read_csv(filename):
+        with open(filename, newline='', encoding='utf-8') as file:
+            yield from csv.DictReader(file)
+
+    @staticmethod
+    def fields(record, names):
+        if isinstance(record, dict):
+            missing = [name for name in names
+                       if record.get(name) in (None, "")]
+            if missing:
+                raise ValueError(f"missing {', '.join(missing)}")
+            return [record[name] for name in names]
+        values = list(record)
+        if len(values) != len(names):
+            raise ValueError(f"expected {len(names)} fields, "
+                             f"got {len(values)}")
+        return values
+
+    @staticmethod
+    def employee(record):
+        if isinstance(record, Employee):
+            return record
+        return Employee(*BulkSource.fields(record,
+                                           BulkSource.EMPLOYEE_FIELDS))
+
+    @staticmethod
+    def car(record):
+        if isinstance(record, Car):
+            return record
+        (car_id, producer, model, release_year, cost,
+         potential_sale_price) = BulkSource.fields(record,
+                                                   BulkSource.CAR_FIELDS)
+        return Car(car_id, producer, model, release_year,
+                   BulkSource.money(cost),
+                   BulkSource.money(potential_sale_price))
+
+    @staticmethod
+    def sale(record):
+        employee_id, car_id, sale_date, real_sale_price = BulkSource.fields(
+            record, BulkSource.SALE_FIELDS)
+        if isinstance(sale_date, str):
+            sale_date = datetime.fromisoformat(sale_date)
+        if not isinstance(sale_date, datetime):
+            raise ValueError(f"sale_date {sale_date!r} is not a datetime")
+        return (employee_id, car_id, sale_date,
+                BulkSource.money(real_sale_price))
+
+    @staticmethod
+    def money(value):
+        # checked here, so a bad amount is rejected with its row
+        if isinstance(value, str):
+            return Money.parse(value)
+        Money.to_cents(value)
+        return value
+
+
+class AutoSalon:
+    def __init__(self, columnar=False, rollups=True, thread_safe=False,
+                 storage=None, metrics=None):
+        if columnar and thread_safe:
+            raise ValueError("A thread-safe salon keeps its sales in lists")
+        if storage is not None and (columnar or thread_safe):
+            raise ValueError("A storage backend keeps its own sales")
+        self.columnar = columnar
+        self.rollups = rollups
+        self.thread_safe = thread_safe
+        self.storage = storage
+        self.metrics = NO_METRICS if metrics is None else metrics
+        if storage is not None:
+            self.employees = storage.employees
+            self.cars = storage.cars
+            self.sales = storage.sales
+        else:
+            self.employees = {}
+            self.cars = LayeredDict() if thread_safe else {}
+            self.sales = ColumnarSales() if columnar else []
+        self.sales_index = self.sales if self.has_sales_store else SaleIndex()
+        self.car_index = CarIndex(self.cars.values(), layered=thread_safe)
+        self.sales_by_employee = {}
+        self.sales_by_model = {}
+        self.rollup = (SalesRollup() if rollups and not self.has_sales_store
+                       else None)
+        self.journal = None
+        self.autosave = None
+        self._shared_dates = {}
+        self.version = 0
+        self.changes = deque(maxlen=1024)
+        # writers hold the lock; readers take a snapshot, and containers a
+        # snapshot still shares are copied on their next write. The sales
+        # list is only appended to, so a snapshot shares it up to its
+        # length. A storage backend's transaction takes the lock's place
+        self._lock = threading.RLock() if thread_safe else nullcontext()
+        if storage is not None:
+            self._lock = storage
+        self._owned = {} if thread_safe else None
+
+    def snapshot(self):
+        if not self.thread_safe:
+            return self
+        with self._lock:
+            view = copy.copy(self)
+            view.sales = SalesView(self.sales, len(self.sales))
+            view.thread_safe = False
+            view.journal = None
+            view.autosave = None
+            view._lock = nullcontext()
+            view._owned = None
+            self._owned = {}
+        return view
+
+    def _own(self, *values):
+        if self._owned is not None:
+            for value in values:
+                self._owned[id(value)] = value
+
+    def _is_owned(self, value):
+        return self._owned is None or id(value) in self._owned
+
+    @staticmethod
+    def _copy(value):
+        if isinstance(value, deque):
+            return deque(value, value.maxlen)
+        return value.copy()
+
+    def _writable(self, name):
+        value = getattr(self, name)
+        if not self._is_owned(value):
+            value = self._copy(value)
+            setattr(self, name, value)
+            self._own(value)
+        return value
+
+    def _entry(self, container, key, factory):
+        # container must already be writable; the entry is copied the same
+        # way when a snapshot still shares it
+        value = container.get(key)
+        if value is None:
+            value = container[key] = factory()
+            self._own(value)
+        elif not self._is_owned(value):
+            value = container[key] = value.copy()
+            self._own(value)
+        return value
+
+    def _changed(self, kind, first_date=None, last_date=None):
+        # readers that remember a version can replay what changed since
+        # then, as long as it is still in the bounded change log
+        self.version += 1
+        self._writable("changes").append((self.version, kind,
+                                          first_date, last_date))
 
     def add_employee(self, employee: Employee):
-        self.employees[employee.employee_id] = employee
+        with self._lock:
+            self._share_employee_values(employee)
+            self._writable("employees")[employee.employee_id] = employee
+            self._mark("employees", employee.employee_id, employee)
+            self._changed("employees")
+            self._journal("add_employee", employee)
+        self.metrics.count("add_employee")
 
     def remove_employee(self, employee: Employee):
-        if employee.employee_id in self.employees:
-            del self.employees[employee.employee_id]
+        # the employee's sales stay in history, so their index entry stays too
+        with self._lock:
+            if employee.employee_id in self.employees:
+                del self._writable("employees")[employee.employee_id]
+                self._mark("employees", employee.employee_id, None)
+                self._changed("employees")
+                self._journal("remove_employee", employee.employee_id)
+        self.metrics.count("remove_employee")
 
     def add_car(self, car: Car):
-        self.cars[car.car_id] = car
+        with self._lock:
+            self._share_car_values(car)
+            self._writable("cars")[car.car_id] = car
+            self._writable("car_index").add(car)
+            self._mark("cars", car.car_id, car)
+            self._changed("cars")
+            self._journal("add_car", car)
+        self.metrics.count("add_car")
 
     def remove_car(self, car: Car):
-        if car.car_id in self.cars:
-            del self.cars[car.car_id]
+        with self._lock:
+            if car.car_id in self.cars:
+                del self._writable("cars")[car.car_id]
+                self._writable("car_index").remove(car.car_id)
+                self._mark("cars", car.car_id, None)
+                self._changed("cars")
+                self._journal("remove_car", car.car_id)
+        self.metrics.count("remove_car")
 
     def register_sale(self, employee_id, car_id, sale_date, real_sale_price):
-        if employee_id not in self.employees or car_id not in self.cars:
-            print(f"Employee - {employee_id} or car - {car_id} not found")
-            return None
+        metrics = self.metrics
+        with metrics.timer("register_sale"), self._lock:
+            if employee_id not in self.employees or car_id not in self.cars:
+                metrics.count("register_sale.not_found")
+                if metrics.enabled:
+                    metrics.event("register_sale",
+                                  f"Employee - {employee_id} or "
+                                  f"car - {car_id} not found")
+                return None
+
+            sale = self._record_sale(employee_id, car_id, sale_date,
+                                     real_sale_price)
+            self._journal("register_sale", employee_id, car_id, sale_date,
+                          real_sale_price)
+        metrics.count("register_sale")
+        metrics.event("register_sale", "Sale registered")
+        return sale
 
+    def _record_sale(self, employee_id, car_id, sale_date, real_sale_price):
         sale = Sale(self.employees[employee_id], self.cars[car_id],
-                    sale_date, real_sale_price)
+                    self._share_date(sale_date),
+                    real_sale_price)
         self.sales.append(sale)
-        del self.cars[car_id]
-        print("Sale registered")
+        self._index_sale(sale)
+        del self._writable("cars")[car_id]
+        self._writable("car_index").remove(car_id)
+        if self.autosave is not None:
+            self.autosave.mark("cars", car_id, None)
+            self.autosave.mark_sales([sale])
+        self._changed("sales", sale.sale_date, sale.sale_date)
         return sale
 
-    def save_data(self, filename):
-        data = {"employees": self.employees, "cars": self.cars, "sales": self.sales}
-        SaveDataToFile.save_data_to_file(data, filename)
-
+    def bulk_add_employees(self, records):
+        result = BulkResult()
+        employees = {}
+        for row_number, record in enumerate(records, 1):
+            try:
+                employee = BulkSource.employee(record)
+            except (TypeError, ValueError) as e:
+                result.reject(row_number, str(e))
+                continue
+            if employee.employee_id in employees:
+                result.reject(row_number, f"duplicate employee "
+                                          f"{employee.employee_id} in batch")
+                continue
+            employees[employee.employee_id] = employee
+
+        for employee in employees.values():
+            self._share_employee_values(employee)
+        if employees:
+            with self._lock:
+                self._writable("employees").update(employees)
+                if self.autosave is not None:
+                    for employee in employees.values():
+                        self.autosave.mark("employees",
+                                           employee.employee_id, employee)
+                self._changed("employees")
+                self._journal("bulk_add_employees", list(employees.values()))
+        result.accepted = len(employees)
+        self.metrics.count("bulk_add_employees", result.accepted)
+        self.metrics.count("bulk_add_employees.rejected", len(result.errors))
+        return result
+
+    def bulk_add_cars(self, records):
+        result = BulkResult()
+        cars = {}
+        for row_number, record in enumerate(records, 1):
+            try:
+                car = BulkSource.car(record)
+            except (TypeError, ValueError) as e:
+                result.reject(row_number, str(e))
+                continue
+            if car.car_id in cars:
+                result.reject(row_number, f"duplicate car {car.car_id} "
+                                          f"in batch")
+                continue
+            cars[car.car_id] = car
+
+        for car in cars.values():
+            self._share_car_values(car)
+        if cars:
+            with self._lock:
+                self._writable("cars").update(cars)
+                self._writable("car_index").extend(cars.values())
+                if self.autosave is not None:
+                    for car in cars.values():
+                        self.autosave.mark("cars", car.car_id, car)
+                self._changed("cars")
+                self._journal("bulk_add_cars", list(cars.values()))
+        result.accepted = len(cars)
+        self.metrics.count("bulk_add_cars", result.accepted)
+        self.metrics.count("bulk_add_cars.rejected", len(result.errors))
+        return result
+
+    def bulk_register_sales(self, records):
+        result = BulkResult()
+        parsed = []
+        for row_number, record in enumerate(records, 1):
+            try:
+                parsed.append((row_number, BulkSource.sale(record)))
+            except (TypeError, ValueError) as e:
+                result.reject(row_number, str(e))
+
+        rows = []
+        sold = set()
+        with self._lock:
+            for row_number, row in parsed:
+                employee_id, car_id = row[:2]
+                if employee_id not in self.employees:
+                    result.reject(row_number,
+                                  f"employee {employee_id} not found")
+                elif car_id not in self.cars:
+                    result.reject(row_number, f"car {car_id} not found")
+                elif car_id in sold:
+                    result.reject(row_number, f"car {car_id} already sold "
+                                              f"in batch")
+                else:
+                    sold.add(car_id)
+                    rows.append(row)
+
+            self._record_sales(rows)
+            if rows:
+                self._journal("bulk_register_sales", rows)
+        result.errors.sort()
+        result.accepted = len(rows)
+        self.metrics.count("bulk_register_sales", result.accepted)
+        self.metrics.count("bulk_register_sales.rejected", len(result.errors))
+        return result
+
+    def _record_sales(self, rows):
+        share_date = self._share_date
+        sales = [Sale(self.employees[employee_id], self.cars[car_id],
+                      share_date(sale_date), real_sale_price)
+                 for employee_id, car_id, sale_date, real_sale_price in rows]
+        # the batch is built and ordered before anything changes, so a
+        # sale that cannot be indexed leaves the salon as it was
+        ordered = sorted(sales, key=lambda sale: sale.sale_date)
+        if self.storage is not None:
+            self.sales.extend(sales)
+        elif self.has_sales_store:
+            for sale in sales:
+                self.sales.append(sale)
+        else:
+            self.sales.extend(sales)
+            self._index_sales(ordered)
+        cars = self._writable("cars")
+        for sale in sales:
+            del cars[sale.car.car_id]
+        self._writable("car_index").remove_many(sale.car.car_id
+                                                for sale in sales)
+        if self.autosave is not None:
+            for sale in sales:
+                self.autosave.mark("cars", sale.car.car_id, None)
+            self.autosave.mark_sales(sales)
+        if sales:
+            dates = [sale.sale_date for sale in sales]
+            self._changed("sales", min(dates), max(dates))
+        return sales
+
+    def _data(self):
+        if self.storage is not None:
+            return self.storage.data()
+        return {"employees": self.employees, "cars": self.cars,
+                "sales": self.sales}
+
+    def _count_bytes(self, name, filename):
+        if self.metrics.enabled:
+            try:
+                self.metrics.count(f"{name}.bytes", os.path.getsize(filename))
+            except OSError:
+                pass
+
+    def save_data(self, filename, compression=None):
+        metrics = self.metrics
+        with metrics.timer("save_data"):
+            saved = self._save_data(filename, compression)
+        if saved:
+            metrics.count("save_data")
+            self._count_bytes("save_data", filename)
+        return saved
+
+    def _save_data(self, filename, compression):
+        metrics = self.metrics
+        self._unmap(filename)
+        autosave = self.autosave
+        if (autosave is not None and filename == autosave.filename
+                and compression is None):
+            if not autosave.flush():
+                return False
+            metrics.event("save_data", f"Changes saved to {filename}")
+            return True
+        with self._lock:
+            if self.journal is not None and filename == self.journal.filename:
+                self.journal.checkpoint(self._data())
+                metrics.event("save_data",
+                              f"Journal checkpointed to {filename}")
+                return True
+        # a snapshot is written without holding writers back
+        data = self.snapshot()._data()
+        if compression is None:
+            return SaveDataToFile.save_data_to_file(data, filename, metrics)
+        try:
+            ChunkedSnapshot.write(data, filename, compression)
+        except OSError as e:
+            metrics.count("save_data.errors")
+            metrics.event("save_data", f"Error saving file {filename}: {e}")
+            return False
+        metrics.event("save_data",
+                      f"Data saved to {filename} with {compression} chunks")
+        return True
+
+    def save_snapshot(self, filename):
+        self._unmap(filename)
+        with self.metrics.timer("save_snapshot"):
+            BinarySnapshot.write(self.snapshot()._data(), filename)
+        self.metrics.count("save_snapshot")
+        self._count_bytes("save_snapshot", filename)
+        self.metrics.event("save_snapshot",
+                           f"Binary snapshot saved to {filename}")
+
+    def _unmap(self, filename):
+        # sales mapped from the file about to be replaced are read into
+        # memory first, and the mapping is closed
+        sales = self.sales
+        if not (isinstance(sales, MappedSales) and os.path.exists(filename)
+                and os.path.samefile(sales.filename, filename)):
+            return
+        with self._lock:
+            self.sales = list(sales)
+            sales.close()
+            self._own(self.sales)
+            self.rebuild_indexes()
+            self._changed("all")
 
     def load_data(self, filename):
-        data = LoadDataFromFile.load_data_from_file(filename)
+        metrics = self.metrics
+        with metrics.timer("load_data"):
+            loaded = self._load_data(filename)
+        if loaded:
+            metrics.count("load_data")
+            self._count_bytes("load_data", filename)
+        return loaded
+
+    def _load_data(self, filename):
+        metrics = self.metrics
+        with self._lock:
+            if self.journal is not None and filename == self.journal.filename:
+                self._restore_journal()
+                return True
+        if ChunkedSnapshot.is_snapshot(filename):
+            try:
+                data = ChunkedSnapshot.read(filename)
+            except (OSError, ValueError, EOFError,
+                    pickle.UnpicklingError) as e:
+                metrics.count("load_data.errors")
+                metrics.event("load_data",
+                              f"Error loading file {filename}: {e}")
+                return False
+            with self._lock:
+                self._restore(data)
+            metrics.event("load_data", f"Data loaded from {filename}")
+            return True
+        if BinarySnapshot.is_snapshot(filename):
+            try:
+                sales = MappedSales(filename)
+            except (OSError, ValueError, pickle.UnpicklingError) as e:
+                metrics.count("load_data.errors")
+                metrics.event("load_data",
+                              f"Error loading file {filename}: {e}")
+                return False
+            with self._lock:
+                self._restore({"employees": sales.employees,
+                               "cars": sales.cars, "sales": sales})
+            metrics.event("load_data", f"Data mapped from {filename}")
+            return True
+        data = LoadDataFromFile.load_data_from_file(filename, metrics)
+        if IncrementalSnapshot.is_base(data):
+            data = IncrementalSnapshot.apply_deltas(data, filename)
         if data:
+            with self._lock:
+                self._restore(data)
+            metrics.event("load_data", "Data loaded")
+            return True
+        return False
+
+    def _restore(self, data):
+        if self.storage is not None:
+            self.storage.replace(data)
+        else:
             self.employees = data.get("employees", {})
             self.cars = data.get("cars", {})
-            self.sales = data.get("sales", [])
-            print("Data loaded")
+            if self.thread_safe:
+                self.cars = LayeredDict(self.cars)
+            self.sales = self._adopt_sales(data.get("sales", []))
+            self._own(self.employees, self.cars, self.sales)
+            self._share_values()
+        if self.autosave is not None:
+            self.autosave.full = True
+        self.rebuild_indexes()
+        self._changed("all")
+
+    @staticmethod
+    def _share_employee_values(employee):
+        if isinstance(employee.position, str):
+            employee.position = sys.intern(employee.position)
+
+    @staticmethod
+    def _share_car_values(car):
+        if isinstance(car.producer, str):
+            car.producer = sys.intern(car.producer)
+        if isinstance(car.model, str):
+            car.model = sys.intern(car.model)
+
+    def _share_values(self):
+        # pickle stores every repeated string and date as its own object,
+        # so a loaded history is folded back onto one copy of each value
+        self._shared_dates = {}
+        for employee in self.employees.values():
+            self._share_employee_values(employee)
+        for car in self.cars.values():
+            self._share_car_values(car)
+        if self.has_sales_store:
+            return
+        share_date = self._share_date
+        for sale in self.sales:
+            self._share_employee_values(sale.employee)
+            self._share_car_values(sale.car)
+            sale.sale_date = share_date(sale.sale_date)
+
+    def _share_date(self, sale_date):
+        # only whole days repeat across sales, so only they are shared; a
+        # timestamp with a time of day is kept as it is, and the table
+        # stays one entry per day of history
+        if isinstance(sale_date, datetime) and sale_date.time() != time.min:
+            return sale_date
+        return self._shared_dates.setdefault(sale_date, sale_date)
+
+    def _mark(self, name, key, value):
+        if self.autosave is not None:
+            self.autosave.mark(name, key, value)
+
+    def start_autosave(self, filename, interval=30.0, threshold=1000,
+                       compact_every=50):
+        if not self.thread_safe:
+            raise ValueError("Autosave writes from a background thread, "
+                             "so it needs a thread-safe salon")
+        self.stop_autosave()
+        with self._lock:
+            self.autosave = AutoSaver(self, filename, interval, threshold,
+                                      compact_every)
+        self.autosave.start()
+        self.metrics.event("autosave", f"Saving to {filename} in the "
+                                       f"background")
+
+    def stop_autosave(self):
+        autosave = self.autosave
+        if autosave is not None:
+            autosave.stop()
+            with self._lock:
+                self.autosave = None
+            # whatever was marked while the saver was stopping
+            autosave.flush()
+
+    def open_journal(self, filename, checkpoint_every=1000):
+        with self._lock:
+            self.close_journal()
+            self.journal = SalonJournal(filename, checkpoint_every,
+                                        self.metrics)
+            self._restore_journal()
+
+    def close_journal(self):
+        with self._lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+    def _restore_journal(self):
+        journal = self.journal
+        data, records = journal.read()
+        self.journal = None
+        try:
+            self._restore(data or {})
+            for operation, args in records:
+                self._replay(operation, args)
+        finally:
+            self.journal = journal
+        self.metrics.event("load_data",
+                           f"Data loaded from {journal.filename} "
+                           f"and {len(records)} journal records")
+
+    def _replay(self, operation, args):
+        if operation == "add_employee":
+            self.add_employee(*args)
+        elif operation == "remove_employee":
+            self._writable("employees").pop(args[0], None)
+        elif operation == "add_car":
+            self.add_car(*args)
+        elif operation == "remove_car":
+            self._writable("cars").pop(args[0], None)
+            self._writable("car_index").remove(args[0])
+        elif operation == "register_sale":
+            employee_id, car_id = args[:2]
+            if employee_id in self.employees and car_id in self.cars:
+                self._record_sale(*args)
+        elif operation == "bulk_add_employees":
+            self.bulk_add_employees(*args)
+        elif operation == "bulk_add_cars":
+            self.bulk_add_cars(*args)
+        elif operation == "bulk_register_sales":
+            self.bulk_register_sales(*args)
+
+    def _journal(self, operation, *args):
+        if self.journal is None:
+            return
+        self.journal.append(operation, *args)
+        if self.journal.needs_checkpoint():
+            self.journal.checkpoint(self._data())
+
+    @property
+    def has_sales_store(self):
+        # ColumnarSales and MappedSales answer date, employee and model
+        # queries themselves instead of through SaleIndex objects
+        return not isinstance(self.sales, (list, SalesView))
+
+    def _adopt_sales(self, sales):
+        if self.thread_safe and isinstance(sales, MappedSales):
+            # copy-on-write snapshots need the sales in a list
+            rows = list(sales)
+            sales.close()
+            return rows
+        if self.columnar and not isinstance(sales, ColumnarSales):
+            return ColumnarSales(sales)
+        if not self.columnar and isinstance(sales, ColumnarSales):
+            return list(sales)
+        return sales
+
+    def _index_sale(self, sale):
+        if self.has_sales_store:
+            return
+        self._writable("sales_index").add(sale)
+        if self.rollup is not None:
+            self._writable("rollup").add(sale, self._entry)
+        self._entry(self._writable("sales_by_employee"),
+                    sale.employee.employee_id, SaleIndex).add(sale)
+        self._entry(self._writable("sales_by_model"),
+                    (sale.car.producer, sale.car.model), SaleIndex).add(sale)
+
+    def _index_sales(self, sales):
+        self._writable("sales_index").extend(sales)
+        if self.rollup is not None:
+            rollup = self._writable("rollup")
+            for sale in sales:
+                rollup.add(sale, self._entry)
+        by_employee = {}
+        by_model = {}
+        for sale in sales:
+            by_employee.setdefault(sale.employee.employee_id, []).append(sale)
+            by_model.setdefault((sale.car.producer, sale.car.model),
+                                []).append(sale)
+        sales_by_employee = self._writable("sales_by_employee")
+        for employee_id, employee_sales in by_employee.items():
+            self._entry(sales_by_employee, employee_id,
+                        SaleIndex).extend(employee_sales)
+        sales_by_model = self._writable("sales_by_model")
+        for model_key, model_sales in by_model.items():
+            self._entry(sales_by_model, model_key,
+                        SaleIndex).extend(model_sales)
+
+    def rebuild_indexes(self):
+        with self._lock:
+            self.car_index = CarIndex(self.cars.values(),
+                                      layered=self.thread_safe)
+            self._own(self.car_index)
+            if self.has_sales_store:
+                self.sales_index = self.sales
+                self.rollup = None
+                return
+            self.sales_index = SaleIndex()
+            self.rollup = SalesRollup() if self.rollups else None
+            self.sales_by_employee = {}
+            self.sales_by_model = {}
+            self._own(self.sales_index, self.rollup, self.sales_by_employee,
+                      self.sales_by_model)
+            self._index_sales(self.sales)
+
+    def search_cars(self, producer=None, model=None, release_year=None,
+                    cost=None, potential_sale_price=None, order_by=None,
+                    descending=False, limit=None):
+        return self.car_index.search(producer, model, release_year, cost,
+                                     potential_sale_price, order_by,
+                                     descending, limit)
+
+    def sales_in_period(self, start_date, end_date):
+        return self.sales_index.in_period(start_date, end_date)
+
+    def iter_sales_in_period(self, start_date, end_date):
+        return self.sales_index.iter_period(start_date, end_date)
+
+    def sales_on_date(self, date):
+        return self.sales_index.on_date(date)
+
+    def employee_sales(self, employee_id, start_date=None, end_date=None):
+        if self.has_sales_store:
+            return self.sales.employee_sales(employee_id, start_date, end_date)
+        if employee_id not in self.sales_by_employee:
+            return []
+        return self.sales_by_employee[employee_id].in_period(start_date,
+                                                             end_date)
+
+    def model_sales(self, producer, model, start_date=None, end_date=None):
+        if self.has_sales_store:
+            return self.sales.model_sales(producer, model,
+                                          start_date, end_date)
+        if (producer, model) not in self.sales_by_model:
+            return []
+        return self.sales_by_model[(producer, model)].in_period(start_date,
+                                                                end_date)
+
+
+class PeriodSummary:
+    def __init__(self):
+        self.sales_count = 0
+        # integer cents, so totals are exact in any order of adding or
+        # merging
+        self.revenue_cents = 0
+        self.profit_cents = 0
+        self.model_sales = Counter()
+        self.employee_sales = Counter()
+
+    @property
+    def revenue(self):
+        return self.revenue_cents / Money.CENTS
+
+    @property
+    def profit(self):
+        return self.profit_cents / Money.CENTS
+
+    def add(self, sale):
+        self.sales_count += 1
+        self.add_amounts(sale.real_sale_price_cents, sale.car.cost_cents)
+        self.model_sales[sale.car.model] += 1
+        self.employee_sales[sale.employee.full_name] += 1
+
+    def add_amounts(self, real_sale_price_cents, cost_cents):
+        self.revenue_cents += real_sale_price_cents
+        self.profit_cents += real_sale_price_cents - cost_cents
+
+    def merge(self, other):
+        self.sales_count += other.sales_count
+        self.revenue_cents += other.revenue_cents
+        self.profit_cents += other.profit_cents
+        self.model_sales.update(other.model_sales)
+        self.employee_sales.update(other.employee_sales)
+        return self
+
+    def copy(self):
+        summary = PeriodSummary()
+        summary.sales_count = self.sales_count
+        summary.revenue_cents = self.revenue_cents
+        summary.profit_cents = self.profit_cents
+        summary.model_sales = self.model_sales.copy()
+        summary.employee_sales = self.employee_sales.copy()
+        return summary
+
+    @staticmethod
+    def _leader(counter):
+        # ties go to the smallest name, so every way of building a summary
+        # (raw rows, rollups, columns, parallel shards) agrees
+        if not counter:
+            return None
+        return min(counter.items(),
+                   key=lambda item: (-item[1], str(item[0])))[0]
+
+    def most_sale_car(self):
+        return self._leader(self.model_sales)
+
+    def top_employee(self):
+        return self._leader(self.employee_sales)
+
+    def __repr__(self):
+        return (f"Period summary: Sales - {self.sales_count}, "
+                f"Revenue - {self.revenue}, Profit - {self.profit}, "
+                f"Most sale car - {self.most_sale_car()}, "
+                f"Top employee - {self.top_employee()}")
+
+
+class SalesRollup:
+    _ONE_DAY = timedelta(days=1)
+    _ONE_MICROSECOND = timedelta(microseconds=1)
+
+    def __init__(self, sales=()):
+        self.days = {}
+        self.months = {}
+        for sale in sales:
+            self.add(sale)
+
+    def copy(self):
+        # the buckets, and the days of each month, stay shared; a
+        # thread-safe salon copies each through its entry function before
+        # changing it, so a copy grows with the months and not the sales
+        rollup = SalesRollup()
+        rollup.days = self.days.copy()
+        rollup.months = self.months.copy()
+        return rollup
+
+    @staticmethod
+    def _entry(container, key, factory):
+        if key not in container:
+            container[key] = factory()
+        return container[key]
+
+    def add(self, sale, entry=None):
+        entry = entry or SalesRollup._entry
+        day = sale.sale_date
+        if isinstance(day, datetime):
+            day = day.date()
+        month = (day.year, day.month)
+        entry(entry(self.days, month, dict), day, PeriodSummary).add(sale)
+        entry(self.months, month, PeriodSummary).add(sale)
+
+    def summary(self, start_date, end_date, sales_index):
+        summary = PeriodSummary()
+        if not (isinstance(start_date, datetime)
+                and isinstance(end_date, datetime)):
+            for sale in sales_index.iter_period(start_date, end_date):
+                summary.add(sale)
+            return summary
+
+        first_day = start_date.date()
+        if start_date.time() != time.min:
+            first_day += self._ONE_DAY
+        last_day = end_date.date()
+        if end_date.time() != time.max:
+            last_day -= self._ONE_DAY
+        if first_day > last_day:
+            for sale in sales_index.iter_period(start_date, end_date):
+                summary.add(sale)
+            return summary
+
+        # raw rows only for the partial days at either edge of the window
+        first_full = datetime.combine(first_day, time.min)
+        after_last_full = datetime.combine(last_day + self._ONE_DAY, time.min)
+        for sale in sales_index.iter_period(
+                start_date, first_full - self._ONE_MICROSECOND):
+            summary.add(sale)
+        self._add_buckets(summary, first_day, last_day)
+        for sale in sales_index.iter_period(after_last_full, end_date):
+            summary.add(sale)
+        return summary
+
+    def _add_buckets(self, summary, first_day, last_day):
+        day = first_day
+        while day <= last_day:
+            next_month = (day.replace(day=28)
+                          + 4 * self._ONE_DAY).replace(day=1)
+            if day.day == 1 and next_month - self._ONE_DAY <= last_day:
+                if (day.year, day.month) in self.months:
+                    summary.merge(self.months[(day.year, day.month)])
+                day = next_month
+                continue
+            bucket = self.days.get((day.year, day.month), {}).get(day)
+            if bucket is not None:
+                summary.merge(bucket)
+            day += self._ONE_DAY
+
+
+class Leaderboard:
+    DIMENSIONS = ("model", "producer", "employee")
+    METRICS = ("count", "revenue", "profit")
+
+    def __init__(self, by="model", metric="count"):
+        self.validate(by, metric)
+        self.by = by
+        self.metric = metric
+        # counts, or amounts in cents
+        self.totals = Counter()
+
+    @staticmethod
+    def validate(by, metric):
+        if by not in Leaderboard.DIMENSIONS:
+            raise ValueError(f"Unknown leaderboard dimension {by}")
+        if metric not in Leaderboard.METRICS:
+            raise ValueError(f"Unknown leaderboard metric {metric}")
+
+    @staticmethod
+    def key(sale, by):
+        if by == "model":
+            return sale.car.model
+        if by == "producer":
+            return sale.car.producer
+        return sale.employee.full_name
+
+    @staticmethod
+    def weight(sale, metric):
+        if metric == "count":
+            return 1
+        if metric == "revenue":
+            return sale.real_sale_price_cents
+        return sale.real_sale_price_cents - sale.car.cost_cents
+
+    def add(self, sale):
+        self.totals[self.key(sale, self.by)] += self.weight(sale, self.metric)
+
+    def extend(self, sales):
+        for sale in sales:
+            self.add(sale)
+
+    def scores(self):
+        return self.totals.items()
+
+    def top(self, k=10):
+        return self.units(self.select(self.scores(), k), self.metric)
+
+    @staticmethod
+    def units(entries, metric):
+        if metric == "count":
+            return entries
+        return [(key, total / Money.CENTS) for key, total in entries]
+
+    @staticmethod
+    def select(scores, k):
+        # a k-sized heap instead of sorting every key; ties go to the
+        # smallest name, as in PeriodSummary._leader
+        return heapq.nsmallest(k, scores,
+                               key=lambda item: (-item[1], str(item[0])))
+
+
+class SpaceSavingLeaderboard(Leaderboard):
+    # Space-Saving (Metwally et al.): at most capacity keys are tracked,
+    # and a new key takes over the smallest one, inheriting its total as
+    # the bound on how much it may be overestimated
+    def __init__(self, by="model", metric="count", capacity=1000):
+        super().__init__(by, metric)
+        if metric == "profit":
+            raise ValueError("Approximate rankings need non-negative "
+                             "weights, rank by count or revenue")
+        if capacity < 1:
+            raise ValueError("Capacity must be positive")
+        self.capacity = capacity
+        self.totals = {}
+        self.errors = {}
+        self._heap = []
+
+    def add(self, sale):
+        self.offer(self.key(sale, self.by), self.weight(sale, self.metric))
+
+    def offer(self, key, weight):
+        if key in self.totals:
+            self.totals[key] += weight
+        elif len(self.totals) < self.capacity:
+            self.totals[key] = weight
+            self.errors[key] = 0
+        else:
+            floor, floor_key = self._pop_smallest()
+            del self.totals[floor_key]
+            del self.errors[floor_key]
+            self.totals[key] = floor + weight
+            self.errors[key] = floor
+        heapq.heappush(self._heap, (self.totals[key], str(key), key))
+        if len(self._heap) > 4 * self.capacity:
+            # drop the entries that later offers made stale
+            self._heap = [(total, str(key), key)
+                          for key, total in self.totals.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_smallest(self):
+        while True:
+            total, _, key = heapq.heappop(self._heap)
+            if self.totals.get(key) == total:
+                return total, key
+
+    def scores(self):
+        return self.totals.items()
+
+    def guaranteed(self, key):
+        return self.totals.get(key, 0) - self.errors.get(key, 0)
 
 
 class ReportsMenu(Enum):
@@ -149,85 +3182,603 @@ class ReportsMenu(Enum):
     BACK = auto()
 
 
+class ReportCache:
+    # which salon changes each cached report depends on; a "sales" change
+    # also sold a car out of the inventory
+    DEPENDENCIES = {
+        ReportsMenu.SHOW_EMPLOYEES: ("employees",),
+        ReportsMenu.SHOW_CARS: ("cars", "sales"),
+        ReportsMenu.SHOW_REPORTS_BY_DATE: ("sales",),
+        ReportsMenu.SHOW_SALES_IN_PERIOD: ("sales",),
+        ReportsMenu.SHOW_SALES_BY_EMPLOYEE: ("sales",),
+        ReportsMenu.SHOW_MOST_SALE_CAR_IN_PERIOD: ("sales",),
+        ReportsMenu.SHOW_TOP_EMPLOYEE_IN_PERIOD: ("sales",),
+        ReportsMenu.SHOW_PROFIT_IN_PERIOD: ("sales",),
+    }
+
+    def __init__(self, salon: AutoSalon, max_entries=128):
+        self.salon = salon
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.version = salon.version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_cacheable(report_type):
+        return report_type in ReportCache.DEPENDENCIES
+
+    # salon is the snapshot a report is read from; a snapshot older than
+    # the cache neither reads nor fills it
+    def get(self, key, salon=None):
+        with self.lock:
+            if self._sync(salon or self.salon) and key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, report, salon=None):
+        with self.lock:
+            if not self._sync(salon or self.salon):
+                return
+            self.entries[key] = report
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self.entries)}
+
+    def _sync(self, salon):
+        if self.version >= salon.version:
+            return self.version == salon.version
+        changes = [change for change in salon.changes
+                   if change[0] > self.version]
+        if not changes or changes[0][0] != self.version + 1:
+            # the change log has moved past us, so anything may be stale
+            self.clear()
+        else:
+            for _, kind, first_date, last_date in changes:
+                if kind == "all":
+                    self.clear()
+                    break
+                self._invalidate(kind, first_date, last_date)
+        self.version = salon.version
+        return True
+
+    def _invalidate(self, kind, first_date, last_date):
+        stale = [key for key in self.entries
+                 if kind in self.DEPENDENCIES[key[0]]
+                 and self._overlaps(key, kind, first_date, last_date)]
+        for key in stale:
+            del self.entries[key]
+        self.invalidations += len(stale)
+
+    @staticmethod
+    def _overlaps(key, kind, first_date, last_date):
+        report_type, date, start_date, end_date, _ = key
+        if kind != "sales" or report_type == ReportsMenu.SHOW_CARS:
+            return True
+        if report_type == ReportsMenu.SHOW_REPORTS_BY_DATE:
+            start_date = end_date = date
+        if end_date is not None and end_date < first_date:
+            return False
+        if start_date is not None and start_date > last_date:
+            return False
+        return True
+
+
+class ParallelSummary:
+    # one pool of workers serves every summary until close(); its workers
+    # come from a forkserver, or are spawned, since forking a process that
+    # may run threads is unsafe. They share no memory with the salon, so
+    # shards are sent encoded rather than as Sale objects
+    def __init__(self, workers=None, min_rows=100_000):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_rows = min_rows
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def summarize(self, salon: AutoSalon, start_date, end_date):
+        sales = salon.sales
+        if isinstance(sales, MappedSales):
+            start, end = sales.bounds(start_date, end_date)
+            if end - start < max(self.min_rows, 1):
+                return sales.period_summary(start_date, end_date)
+            tasks = [(ParallelSummary._summarize_mapped,
+                      (sales.filename, shard_start, shard_end))
+                     for shard_start, shard_end in self._shards(start, end)]
+            return sales.add_new_sales(self._run(tasks), start_date, end_date)
+
+        start, end = salon.sales_index.bounds(start_date, end_date)
+        if end - start < max(self.min_rows, 1):
+            summary = PeriodSummary()
+            for sale in salon.iter_sales_in_period(start_date, end_date):
+                summary.add(sale)
+            return summary
+        return self._run([(ParallelSummary._summarize_encoded,
+                           self._encode(salon.sales_index[shard_start:
+                                                          shard_end]))
+                          for shard_start, shard_end in self._shards(start,
+                                                                     end)])
+
+    def _shards(self, start, end):
+        # contiguous rows of the date index, i.e. consecutive date ranges
+        count = min(self.workers, end - start)
+        step = -(-(end - start) // count)
+        return [(shard_start, min(shard_start + step, end))
+                for shard_start in range(start, end, step)]
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                method = ("forkserver" if "forkserver"
+                          in multiprocessing.get_all_start_methods()
+                          else "spawn")
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(method))
+            return self._executor
+
+    def _run(self, tasks):
+        summary = PeriodSummary()
+        executor = self._pool()
+        futures = [executor.submit(function, *args)
+                   for function, args in tasks]
+        for future in futures:
+            summary.merge(future.result())
+        return summary
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    @staticmethod
+    def _encode(sales):
+        models = {}
+        names = {}
+        model_codes = array("i")
+        name_codes = array("i")
+        prices = array("q")
+        costs = array("q")
+        for sale in sales:
+            model_codes.append(models.setdefault(sale.car.model, len(models)))
+            name_codes.append(names.setdefault(sale.employee.full_name,
+                                               len(names)))
+            prices.append(sale.real_sale_price_cents)
+            costs.append(sale.car.cost_cents)
+        return (list(models), list(names), model_codes, name_codes, prices,
+                costs)
+
+    @staticmethod
+    def _summarize_encoded(models, names, model_codes, name_codes,
+                           prices, costs):
+        summary = PeriodSummary()
+        summary.sales_count = len(prices)
+        summary.add_amounts(sum(prices), sum(costs))
+        for code, count in Counter(model_codes).items():
+            summary.model_sales[models[code]] = count
+        for code, count in Counter(name_codes).items():
+            summary.employee_sales[names[code]] = count
+        return summary
+
+    @staticmethod
+    def _summarize_mapped(filename, start, end):
+        sales = MappedSales(filename)
+        try:
+            return sales.summarize_rows(start, end)
+        finally:
+            sales.close()
+
+
+class ReportPage:
+    # one page of a list report; cursor continues it and is None on the
+    # last page
+    def __init__(self, rows, cursor=None):
+        self.rows = rows
+        self.cursor = cursor
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __repr__(self):
+        return (f"Report page: Rows - {len(self.rows)}, "
+                f"More - {self.cursor is not None}")
+
+
 class ReportGenerator:
-    def __init__(self, salon: AutoSalon):
+    # a cursor keeps the report's iterator over the snapshot its first page
+    # read, so later pages neither repeat nor skip rows and each costs only
+    # its own rows. A salon that is not thread-safe has no snapshots, so
+    # its cursor expires once the salon changes. The oldest cursors are
+    # dropped past MAX_CURSORS
+    MAX_CURSORS = 64
+
+    def __init__(self, salon: AutoSalon, cache_size=128, workers=None):
         self.salon = salon
+        self.cache = ReportCache(salon, cache_size) if cache_size else None
+        # workers only applies to period summaries that would otherwise
+        # read every sale: a salon built with rollups=False, or one holding
+        # a mapped binary snapshot. Rollups, columns and storage backends
+        # answer a period without reading its rows, so they come first
+        self.parallel = ParallelSummary(workers) if workers else None
+        self.cursors = OrderedDict()
+        self.cursor_lock = threading.Lock()
 
     def generate_report(self, report_type: ReportsMenu, date=None,
-                        start_date=None, end_date=None, employee_id=None):
+                        start_date=None, end_date=None, employee_id=None,
+                        page_size=None, cursor=None):
+        if page_size is not None or cursor is not None:
+            return self._page(report_type, date, start_date, end_date,
+                              employee_id, page_size, cursor)
+        # every report reads one snapshot, so a thread-safe salon keeps
+        # taking sales while it is built
+        salon = self.salon.snapshot()
+        metrics = salon.metrics
+        with metrics.timer(f"report.{report_type.name}"):
+            if (self.cache is None
+                    or not ReportCache.is_cacheable(report_type)):
+                return self._build_report(salon, report_type, date,
+                                          start_date, end_date, employee_id)
+            key = (report_type, date, start_date, end_date, employee_id)
+            found, report = self.cache.get(key, salon)
+            metrics.count("report_cache.hit" if found
+                          else "report_cache.miss")
+            if not found:
+                report = self._build_report(salon, report_type, date,
+                                            start_date, end_date, employee_id)
+                self.cache.put(key, report, salon)
+            return report
+
+    def _build_report(self, salon, report_type, date, start_date, end_date,
+                      employee_id):
         if report_type == ReportsMenu.SHOW_EMPLOYEES:
-            return list(self.salon.employees.values())
+            return list(salon.employees.values())
         elif report_type == ReportsMenu.SHOW_CARS:
-            return list(self.salon.cars.values())
+            return list(salon.cars.values())
         elif report_type == ReportsMenu.SHOW_SALES:
-            return self.salon.sales
+            return salon.sales
         elif report_type == ReportsMenu.SHOW_REPORTS_BY_DATE:
-            return [sale for sale in self.salon.sales
-                    if sale.sale_date == date]
+            return salon.sales_on_date(date)
         elif report_type == ReportsMenu.SHOW_SALES_IN_PERIOD:
-            return [sale for sale in self.salon.sales
-                    if start_date <= sale.sale_date <= end_date]
+            return salon.sales_in_period(start_date, end_date)
         elif report_type == ReportsMenu.SHOW_SALES_BY_EMPLOYEE:
-            return [sale for sale in self.salon.sales
-                    if sale.employee.employee_id == employee_id]
-        elif report_type == ReportsMenu.SHOW_MOST_SALE_CAR_IN_PERIOD:
-            return self.get_most_sale_car(start_date, end_date)
-        elif report_type == ReportsMenu.SHOW_TOP_EMPLOYEE_IN_PERIOD:
-            return self.get_top_employee(start_date, end_date)
-        elif report_type == ReportsMenu.SHOW_PROFIT_IN_PERIOD:
-            return self.get_total_profit(start_date, end_date)
+            return salon.employee_sales(employee_id, start_date, end_date)
+        elif report_type in (ReportsMenu.SHOW_MOST_SALE_CAR_IN_PERIOD,
+                             ReportsMenu.SHOW_TOP_EMPLOYEE_IN_PERIOD,
+                             ReportsMenu.SHOW_PROFIT_IN_PERIOD):
+            return self.describe_summary(
+                report_type, self._period_summary(salon, start_date,
+                                                  end_date))
 
-    def get_most_sale_car(self, start_date, end_date):
-        sales_in_period = [sale for sale in self.salon.sales
-                           if start_date <= sale.sale_date <= end_date]
-        if not sales_in_period:
-            return "No sales in period"
+    @staticmethod
+    def _records(salon, report_type, date, start_date, end_date,
+                 employee_id):
+        # the rows of a list report, read lazily where the salon can;
+        # None for the reports that are a single line
+        if report_type == ReportsMenu.SHOW_EMPLOYEES:
+            return salon.employees.values()
+        elif report_type == ReportsMenu.SHOW_CARS:
+            return salon.cars.values()
+        elif report_type == ReportsMenu.SHOW_SALES:
+            return salon.sales
+        elif report_type == ReportsMenu.SHOW_REPORTS_BY_DATE:
+            return salon.sales_on_date(date)
+        elif report_type == ReportsMenu.SHOW_SALES_IN_PERIOD:
+            return salon.iter_sales_in_period(start_date, end_date)
+        elif report_type == ReportsMenu.SHOW_SALES_BY_EMPLOYEE:
+            return salon.employee_sales(employee_id, start_date, end_date)
+        return None
+
+    def iter_report(self, report_type: ReportsMenu, date=None,
+                    start_date=None, end_date=None, employee_id=None):
+        records = self._records(self.salon.snapshot(), report_type, date,
+                                start_date, end_date, employee_id)
+        if records is None:
+            yield {"report": self.generate_report(
+                report_type, date=date, start_date=start_date,
+                end_date=end_date, employee_id=employee_id)}
+            return
+        for record in records:
+            yield record.as_row()
+
+    def _page(self, report_type, date, start_date, end_date, employee_id,
+              page_size, cursor):
+        if page_size is None or page_size < 1:
+            raise ValueError("A report page needs a page size of at least 1")
+        with self.cursor_lock:
+            if cursor is not None:
+                cursor_id, _, offset = str(cursor).partition(".")
+                state = self.cursors.pop(cursor_id, None)
+                # only the newest page of a cursor can be continued, since
+                # its iterator has moved on, and a salon without snapshots
+                # must not have changed under that iterator
+                if (state is None or state[0] != report_type
+                        or str(state[2]) != offset
+                        or state[3] not in (None, self.salon.version)):
+                    raise ValueError(f"Report cursor {cursor} is unknown "
+                                     f"or expired")
+                _, rows, offset, version = state
+        if cursor is None:
+            salon = self.salon.snapshot()
+            records = self._records(salon, report_type, date, start_date,
+                                    end_date, employee_id)
+            if records is None:
+                return self.generate_report(report_type, date=date,
+                                            start_date=start_date,
+                                            end_date=end_date,
+                                            employee_id=employee_id)
+            # without snapshots the salon may change its dicts and date
+            # indexes between pages, so the cursor remembers its version
+            version = None if self.salon.thread_safe else self.salon.version
+            rows, offset = iter(records), 0
+            cursor_id = os.urandom(8).hex()
+
+        with self.salon.metrics.timer(f"report.{report_type.name}"):
+            page = list(islice(rows, page_size))
+            # one row more tells whether there is a next page
+            following = list(islice(rows, 1))
+        if not following:
+            return ReportPage(page)
+        offset += len(page)
+        rows = chain(following, rows)
+        with self.cursor_lock:
+            self.cursors[cursor_id] = (report_type, rows, offset, version)
+            while len(self.cursors) > self.MAX_CURSORS:
+                self.cursors.popitem(last=False)
+        return ReportPage(page, f"{cursor_id}.{offset}")
+
+    def get_sales_by_model(self, producer, model,
+                           start_date=None, end_date=None):
+        return self.salon.snapshot().model_sales(producer, model,
+                                                 start_date, end_date)
+
+    def search_cars(self, **query):
+        return self.salon.snapshot().search_cars(**query)
+
+    def get_period_summary(self, start_date, end_date):
+        return self._period_summary(self.salon.snapshot(),
+                                    start_date, end_date)
+
+    def _period_summary(self, salon, start_date, end_date):
+        if salon.columnar or salon.storage is not None:
+            return salon.sales.period_summary(start_date, end_date)
+        if salon.rollup is not None:
+            return salon.rollup.summary(start_date, end_date,
+                                        salon.sales_index)
+        if self.parallel is not None:
+            return self.parallel.summarize(salon, start_date, end_date)
+        if salon.has_sales_store:
+            return salon.sales.period_summary(start_date, end_date)
+        summary = PeriodSummary()
+        for sale in salon.iter_sales_in_period(start_date, end_date):
+            summary.add(sale)
+        return summary
+
+    def get_leaderboard(self, start_date=None, end_date=None, by="model",
+                        metric="count", k=10, capacity=None):
+        # capacity switches to the bounded-memory approximate ranking
+        Leaderboard.validate(by, metric)
+        salon = self.salon.snapshot()
+        if capacity is not None:
+            leaderboard = SpaceSavingLeaderboard(by, metric, capacity)
+            leaderboard.extend(salon.iter_sales_in_period(start_date,
+                                                          end_date))
+            return leaderboard.top(k)
+        if metric == "count" and by != "producer":
+            summary = self._period_summary(salon, start_date, end_date)
+            return Leaderboard.select(
+                (summary.model_sales if by == "model"
+                 else summary.employee_sales).items(), k)
+        if salon.columnar or salon.storage is not None:
+            return Leaderboard.units(Leaderboard.select(
+                salon.sales.group_totals(start_date, end_date, by,
+                                         metric).items(), k), metric)
+        leaderboard = Leaderboard(by, metric)
+        leaderboard.extend(salon.iter_sales_in_period(start_date, end_date))
+        return leaderboard.top(k)
 
-        cars = [sale.car.model for sale in sales_in_period]
-        most_sale_car = Counter(cars).most_common(1)[0][0]
-        return f"Most sale car in period - {most_sale_car}"
+    def get_most_sale_car(self, start_date, end_date):
+        return self.describe_summary(
+            ReportsMenu.SHOW_MOST_SALE_CAR_IN_PERIOD,
+            self.get_period_summary(start_date, end_date))
 
     def get_top_employee(self, start_date, end_date):
-        sales_in_period = [sale for sale in self.salon.sales
-                           if start_date <= sale.sale_date <= end_date]
-        if not sales_in_period:
-            return "No sales in period"
-
-        employee_sales = Counter([sale.employee.full_name for sale
-                                  in sales_in_period])
-        top_employee = employee_sales.most_common(1)[0][0]
-        return f"The top employee is {top_employee}"
+        return self.describe_summary(
+            ReportsMenu.SHOW_TOP_EMPLOYEE_IN_PERIOD,
+            self.get_period_summary(start_date, end_date))
 
     def get_total_profit(self, start_date, end_date):
-        sales_in_period = [sale for sale in self.salon.sales
-                           if start_date <= sale.sale_date <= end_date]
-        if not sales_in_period:
+        return self.describe_summary(
+            ReportsMenu.SHOW_PROFIT_IN_PERIOD,
+            self.get_period_summary(start_date, end_date))
+
+    @staticmethod
+    def describe_summary(report_type: ReportsMenu, summary: PeriodSummary):
+        if not summary.sales_count:
             return "No sales in period"
 
-        total_profit = sum(float(sale.real_sale_price) - float(sale.car.cost)
-                           for sale in sales_in_period)
-        return f"Total profit in period is: {total_profit}"
+        if report_type == ReportsMenu.SHOW_MOST_SALE_CAR_IN_PERIOD:
+            return f"Most sale car in period - {summary.most_sale_car()}"
+        elif report_type == ReportsMenu.SHOW_TOP_EMPLOYEE_IN_PERIOD:
+            return f"The top employee is {summary.top_employee()}"
+        elif report_type == ReportsMenu.SHOW_PROFIT_IN_PERIOD:
+            return f"Total profit in period is: {summary.profit}"
+
+    def close(self):
+        # stops the summary workers, if there are any
+        if self.parallel is not None:
+            self.parallel.close()
+
+
+class FederatedSummary:
+    def __init__(self):
+        self.summary = PeriodSummary()
+        self.branches = {}
+        self.failed = {}
+
+    def __repr__(self):
+        return (f"Federated summary: Branches - {len(self.branches)}, "
+                f"Failed - {len(self.failed)}, {self.summary}")
+
+
+class FederatedReportGenerator:
+    SUMMARY_REPORTS = (ReportsMenu.SHOW_MOST_SALE_CAR_IN_PERIOD,
+                       ReportsMenu.SHOW_TOP_EMPLOYEE_IN_PERIOD,
+                       ReportsMenu.SHOW_PROFIT_IN_PERIOD)
+
+    def __init__(self, filenames, workers=None, metrics=NO_METRICS):
+        self.filenames = list(filenames)
+        self.workers = workers or min(len(self.filenames),
+                                      os.cpu_count() or 1) or 1
+        self.metrics = metrics
+
+    def get_period_summary(self, start_date, end_date):
+        # each branch is loaded and summarised in its own process and only
+        # the small PeriodSummary travels back; counters are summed before
+        # ranking, so a seller strong in several branches can still win
+        result = FederatedSummary()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                filename: executor.submit(
+                    FederatedReportGenerator._branch_summary,
+                    filename, start_date, end_date)
+                for filename in self.filenames}
+            for filename, future in futures.items():
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    result.failed[filename] = f"{type(e).__name__}: {e}"
+                    continue
+                result.branches[filename] = summary
+                result.summary.merge(summary)
+        for filename, reason in result.failed.items():
+            self.metrics.count("federated.failed")
+            self.metrics.event("federated",
+                               f"Branch {filename} skipped: {reason}")
+        return result
+
+    def generate_report(self, report_type: ReportsMenu, start_date=None,
+                        end_date=None):
+        if report_type not in self.SUMMARY_REPORTS:
+            raise ValueError(f"{report_type.name} is not a federated report")
+        return ReportGenerator.describe_summary(
+            report_type, self.get_period_summary(start_date, end_date).summary)
+
+    @staticmethod
+    def _branch_summary(filename, start_date, end_date):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f"{filename} not found")
+        salon = AutoSalon()
+        if not salon.load_data(filename):
+            raise ValueError(f"{filename} could not be loaded")
+        return ReportGenerator(salon, cache_size=0).get_period_summary(
+            start_date, end_date)
 
 
 class ReportProcessor:
+    EXPORT_FORMATS = ("csv", "jsonl")
+    CHUNK_ROWS = 10000
+    BUFFER_SIZE = 1 << 20
+    PAGE_ROWS = 50
+
     def __init__(self, report_generator: ReportGenerator):
         self.report_generator = report_generator
 
     def display_or_save_report(self, report_type: ReportsMenu, **kwargs):
-        report = self.report_generator.generate_report(report_type, **kwargs)
         choice = input(
             "Would you like to Display(1) or Save(2) "
             "report? Enter 1 or 2: >> "
         )
 
         if choice == "1":
-            print(report)
+            self.display_report(report_type, **kwargs)
         elif choice == "2":
-            filename = input("Enter filename to save report")
-            SaveDataToFile.save_data_to_file(report, filename)
+            filename = input("Enter filename to save report "
+                             "(.csv and .jsonl are streamed): >> ")
+            file_format = filename.rsplit(".", 1)[-1].lower()
+            if file_format in self.EXPORT_FORMATS:
+                self.export_report(report_type, filename, file_format,
+                                   **kwargs)
+            else:
+                report = self.report_generator.generate_report(report_type,
+                                                               **kwargs)
+                SaveDataToFile.save_data_to_file(
+                    report, filename, self.report_generator.salon.metrics)
         else:
             print("Invalid choice")
 
+    def display_report(self, report_type: ReportsMenu, prompt=True,
+                       file=None, **kwargs):
+        # rows are printed a page at a time as they are read, instead of
+        # building and printing the whole report as one list
+        file = file or sys.stdout
+        page = self.report_generator.generate_report(
+            report_type, page_size=self.PAGE_ROWS, **kwargs)
+        if isinstance(page, str):
+            print(page, file=file)
+            return
+        shown = 0
+        while True:
+            for record in page:
+                print(record, file=file)
+            shown += len(page)
+            if page.cursor is None:
+                break
+            if prompt and input(f"Shown {shown} rows. Press Enter for more "
+                                f"or q to stop: >> ").strip().lower() == "q":
+                break
+            page = self.report_generator.generate_report(
+                report_type, page_size=self.PAGE_ROWS, cursor=page.cursor,
+                **kwargs)
+        if not shown:
+            print("No records", file=file)
+
+    def export_report(self, report_type: ReportsMenu, filename,
+                      file_format="csv", **kwargs):
+        if file_format not in self.EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {file_format}")
+        rows = self.report_generator.iter_report(report_type, **kwargs)
+        exported = 0
+        with open(filename, 'w', newline='', encoding='utf-8',
+                  buffering=self.BUFFER_SIZE) as file:
+            writer = None
+            while True:
+                chunk = list(islice(rows, self.CHUNK_ROWS))
+                if not chunk:
+                    break
+                if file_format == "jsonl":
+                    file.write("".join(json.dumps(row, default=str) + "\n"
+                                       for row in chunk))
+                else:
+                    if writer is None:
+                        writer = csv.DictWriter(file,
+                                                fieldnames=list(chunk[0]))
+                        writer.writeheader()
+                    writer.writerows(chunk)
+                exported += len(chunk)
+        self.report_generator.salon.metrics.event(
+            "export_report", f"Exported {exported} rows to {filename}")
+        return exported
+
 
 class Menu(Enum):
     ADD_EMPLOYEE = auto()
@@ -287,6 +3838,7 @@ class AutoSalonMenu:
             elif choice == Menu.LOAD_DATA.value:
                 self.load_data()
             elif choice == Menu.EXIT.value:
+                self.salon.stop_autosave()
                 print("Exit")
                 break
             else:
@@ -338,10 +3890,10 @@ class AutoSalonMenu:
         release_year = input(
             "Enter car release year: >> "
         )
-        cost = float(input(
+        cost = Money.parse(input(
             "Enter car cost: >> "
         ))
-        potential_sale_price = float(input(
+        potential_sale_price = Money.parse(input(
             "Enter car potential sale price: >> "
         ))
 
@@ -371,7 +3923,7 @@ class AutoSalonMenu:
             "Enter date of sale "
             "in format (YYYY-MM-DD): >> "
         ), "%Y-%m-%d")
-        real_sale_price = float(input(
+        real_sale_price = Money.parse(input(
             "Enter real sale price: >> "
         ))
 
@@ -485,7 +4037,12 @@ class AutoSalonMenu:
         filename = input(
             "Enter filename to save data: >> "
         )
-        self.salon.save_data(filename)
+        # after the first save the salon keeps that file up to date in the
+        # background
+        if self.salon.thread_safe and self.salon.autosave is None:
+            self.salon.start_autosave(filename)
+        else:
+            self.salon.save_data(filename)
 
     def load_data(self):
         filename = input(
@@ -495,7 +4052,7 @@ class AutoSalonMenu:
 
 
 if __name__ == "__main__":
-    salon = AutoSalon()
+    salon = AutoSalon(thread_safe=True, metrics=Metrics(LogSink()))
     menu = AutoSalonMenu(salon)
     menu.start()
 
@@ -0,0 +1,193 @@
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+
+from Exam import (AutoSalon, LogSink, Metrics, ReportGenerator,
+                  ReportProcessor, ReportsMenu)
+
+
+class ReportSpec:
+    # one line of a spec file: {"report": "SHOW_PROFIT_IN_PERIOD",
+    # "start_date": "2024-01-01", "end_date": "2024-12-31",
+    # "output": "profit.txt"}; on the command line the same spec is
+    # SHOW_PROFIT_IN_PERIOD,start_date=2024-01-01,end_date=2024-12-31
+    DATES = ("date", "start_date", "end_date")
+    FIELDS = ("report", *DATES, "employee_id", "output")
+
+    def __init__(self, report_type: ReportsMenu, date=None, start_date=None,
+                 end_date=None, employee_id=None, output=None):
+        self.report_type = report_type
+        self.date = date
+        self.start_date = start_date
+        self.end_date = end_date
+        self.employee_id = employee_id
+        self.output = output
+
+    @staticmethod
+    def from_dict(record):
+        record = dict(record)
+        if "report" not in record:
+            raise ValueError(f"Report spec {record} has no report type")
+        unknown = [name for name in record if name not in ReportSpec.FIELDS]
+        if unknown:
+            raise ValueError(f"Report spec {record} has unknown fields "
+                             f"{', '.join(map(str, unknown))}")
+        try:
+            report_type = ReportsMenu[record.pop("report")]
+        except KeyError as e:
+            raise ValueError(f"Unknown report type {e}") from None
+        for name in ReportSpec.DATES:
+            if record.get(name) is not None:
+                record[name] = datetime.fromisoformat(record[name])
+        return ReportSpec(report_type, **record)
+
+    @staticmethod
+    def parse(text):
+        report, *fields = text.split(",")
+        record = {"report": report}
+        for field in fields:
+            name, _, value = field.partition("=")
+            record[name.strip()] = value.strip()
+        # an employee_id stays text, as the menu stores it; a spec file
+        # gives a number as a JSON number
+        return ReportSpec.from_dict(record)
+
+    @staticmethod
+    def read(filename):
+        # JSON lines; blank lines and # comments are skipped
+        with open(filename, encoding="utf-8") as file:
+            return [ReportSpec.from_dict(json.loads(line))
+                    for line in file
+                    if line.strip() and not line.lstrip().startswith("#")]
+
+    def kwargs(self):
+        return {"date": self.date, "start_date": self.start_date,
+                "end_date": self.end_date, "employee_id": self.employee_id}
+
+    def __repr__(self):
+        fields = ", ".join(f"{name} - {value}"
+                           for name, value in self.kwargs().items()
+                           if value is not None)
+        return f"{self.report_type.name}" + (f": {fields}" if fields else "")
+
+
+class BatchReportRunner:
+    SUMMARY_REPORTS = (ReportsMenu.SHOW_MOST_SALE_CAR_IN_PERIOD,
+                       ReportsMenu.SHOW_TOP_EMPLOYEE_IN_PERIOD,
+                       ReportsMenu.SHOW_PROFIT_IN_PERIOD)
+
+    def __init__(self, salon: AutoSalon, workers=None):
+        self.report_generator = ReportGenerator(salon, workers=workers)
+        self.timings = []
+
+    @staticmethod
+    def load_salon(filename, workers=None, metrics=None):
+        # rollups answer period summaries before any workers would, so a
+        # salon asked for workers is built without them
+        salon = AutoSalon(rollups=workers is None, metrics=metrics)
+        return salon if salon.load_data(filename) else None
+
+    def run(self, specs, stdout=None):
+        # the summary reports of one window share a single period summary,
+        # and every output is written once, after all reports are built
+        summaries = {}
+        results = []
+        self.timings = []
+        for spec in specs:
+            started = time.perf_counter()
+            shared = False
+            if spec.report_type in self.SUMMARY_REPORTS:
+                window = (spec.start_date, spec.end_date)
+                shared = window in summaries
+                if not shared:
+                    summaries[window] = (
+                        self.report_generator.get_period_summary(*window))
+                report = ReportGenerator.describe_summary(spec.report_type,
+                                                          summaries[window])
+            else:
+                report = self.report_generator.generate_report(
+                    spec.report_type, **spec.kwargs())
+            self.timings.append((spec, time.perf_counter() - started, shared))
+            results.append((spec, report))
+
+        started = time.perf_counter()
+        self.write(results, stdout or sys.stdout)
+        self.timings.append(("write outputs", time.perf_counter() - started,
+                             False))
+        return results
+
+    def write(self, results, stdout):
+        outputs = {}
+        for spec, report in results:
+            outputs.setdefault(spec.output, []).append((spec, report))
+        for output, entries in outputs.items():
+            if output is None:
+                self._write(stdout, entries, "text")
+                continue
+            file_format = "jsonl" if str(output).endswith(".jsonl") else "text"
+            with open(output, "w", encoding="utf-8",
+                      buffering=ReportProcessor.BUFFER_SIZE) as file:
+                self._write(file, entries, file_format)
+
+    @staticmethod
+    def _write(file, entries, file_format):
+        for spec, report in entries:
+            if file_format == "jsonl":
+                name = spec.report_type.name
+                if isinstance(report, str):
+                    file.write(json.dumps({"report": name,
+                                           "result": report}) + "\n")
+                    continue
+                for record in report:
+                    row = record.as_row()
+                    row["report"] = name
+                    file.write(json.dumps(row, default=str) + "\n")
+                continue
+            file.write(f"{spec}\n")
+            if isinstance(report, str):
+                file.write(f"{report}\n")
+            else:
+                file.writelines(f"{record}\n" for record in report)
+            file.write("\n")
+
+    def print_timings(self, file=None):
+        file = file or sys.stdout
+        for spec, seconds, shared in self.timings:
+            note = " (shared period summary)" if shared else ""
+            print(f"{seconds * 1000:10.3f} ms  {spec}{note}", file=file)
+        total = sum(seconds for _, seconds, _ in self.timings)
+        print(f"{total * 1000:10.3f} ms  total", file=file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a batch of auto salon reports without the menu")
+    parser.add_argument("data", help="salon file to load")
+    parser.add_argument("--specs", help="JSON lines file of report specs")
+    parser.add_argument("--report", action="append", default=[],
+                        help="REPORT_TYPE[,name=value...], may be repeated")
+    parser.add_argument("--workers", type=int,
+                        help="processes for period summaries")
+    arguments = parser.parse_args()
+
+    specs = ReportSpec.read(arguments.specs) if arguments.specs else []
+    specs += [ReportSpec.parse(text) for text in arguments.report]
+    if not specs:
+        parser.error("no reports given, use --specs or --report")
+    started = time.perf_counter()
+    # load messages go to stderr, so a failed load says why
+    salon = BatchReportRunner.load_salon(
+        arguments.data, arguments.workers,
+        Metrics(LogSink(sys.stderr, names=("load_data",))))
+    if salon is None:
+        sys.exit(f"Could not load {arguments.data}")
+    loaded = time.perf_counter() - started
+    runner = BatchReportRunner(salon, arguments.workers)
+    try:
+        runner.run(specs)
+    finally:
+        runner.report_generator.close()
+    print(f"{loaded * 1000:10.3f} ms  load {arguments.data}")
+    runner.print_timings()
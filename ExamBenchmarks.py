@@ -0,0 +1,381 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from itertools import islice
+
+from Exam import (AutoSalon, Employee, Car, Sale, ReportGenerator,
+                  ReportsMenu)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class DictEmployee:
+    # Employee, Car and Sale as they were laid out before __slots__, with
+    # amounts in plain attributes rather than cents
+    def __init__(self, employee_id, full_name, position, phone_number, email):
+        self.employee_id = employee_id
+        self.full_name = full_name
+        self.position = position
+        self.phone_number = phone_number
+        self.email = email
+
+
+class DictCar:
+    def __init__(self, car_id, producer, model,
+                 release_year, cost, potential_sale_price):
+        self.car_id = car_id
+        self.producer = producer
+        self.model = model
+        self.release_year = release_year
+        self.cost = cost
+        self.potential_sale_price = potential_sale_price
+
+
+class DictSale:
+    def __init__(self, employee, car, sale_date, real_sale_price):
+        self.employee = employee
+        self.car = car
+        self.sale_date = sale_date
+        self.real_sale_price = real_sale_price
+
+
+class ObjectMemoryBenchmark:
+    DICT_CLASSES = {"Employee": DictEmployee, "Car": DictCar,
+                    "Sale": DictSale}
+
+    @staticmethod
+    def measure(factory, count):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            objects = [factory(index) for index in range(count)]
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del objects
+        return (after - before) / count
+
+    @staticmethod
+    def factories(employee_cls, car_cls, sale_cls):
+        employee = employee_cls(1, "John Connor", "Seller",
+                                "123456789", "judgmentday@gmail.com")
+        sale_date = datetime(2024, 8, 1)
+        return {
+            "Employee": lambda index: employee_cls(
+                index, "John Connor", "Seller", "123456789",
+                "judgmentday@gmail.com"),
+            "Car": lambda index: car_cls(index, "Ford", "Mustang", 2024,
+                                         5000, 10000),
+            "Sale": lambda index: sale_cls(employee, None, sale_date, 7000),
+        }
+
+    @staticmethod
+    def run(count=100_000):
+        slotted = ObjectMemoryBenchmark.factories(Employee, Car, Sale)
+        plain = ObjectMemoryBenchmark.factories(
+            *ObjectMemoryBenchmark.DICT_CLASSES.values())
+        results = {}
+        for name in slotted:
+            results[name] = {
+                "dict_bytes": ObjectMemoryBenchmark.measure(plain[name],
+                                                            count),
+                "slots_bytes": ObjectMemoryBenchmark.measure(slotted[name],
+                                                             count),
+            }
+        return results
+
+
+class SyntheticData:
+    # the same seed always gives the same salon: employees, an inventory a
+    # tenth larger than the sales, and sales spread over two years
+    SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+    MODELS = {
+        "Ford": [("Fiesta", 14000), ("Focus", 19000), ("Kuga", 27000),
+                 ("Mustang", 42000)],
+        "Toyota": [("Yaris", 16000), ("Corolla", 21000), ("RAV4", 31000)],
+        "Kia": [("Picanto", 11000), ("Rio", 15000), ("Sportage", 26000)],
+        "BMW": [("118i", 30000), ("320d", 41000), ("X5", 68000)],
+        "Skoda": [("Fabia", 15000), ("Octavia", 22000), ("Kodiaq", 33000)],
+    }
+    FIRST_NAMES = ("John", "Sarah", "Kyle", "Miles", "Ellen", "Marcus",
+                   "Grace", "Danny", "Kate", "Tarissa")
+    LAST_NAMES = ("Connor", "Reese", "Dyson", "Brewster", "Wright",
+                  "Harrison", "Salceda", "Voight")
+    POSITIONS = ("Seller", "Seller", "Seller", "Senior seller", "Manager")
+    START = datetime(2023, 1, 1)
+    DAYS = 730
+    BATCH = 50_000
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.models = [(producer, model, price)
+                       for producer, models in self.MODELS.items()
+                       for model, price in models]
+
+    @staticmethod
+    def rows(size):
+        return SyntheticData.SIZES[size] if size in SyntheticData.SIZES \
+            else int(size)
+
+    def employees(self, count):
+        generator = random.Random(f"{self.seed}-employees")
+        for employee_id in range(count):
+            name = (f"{generator.choice(self.FIRST_NAMES)} "
+                    f"{generator.choice(self.LAST_NAMES)}")
+            yield Employee(employee_id, name,
+                           generator.choice(self.POSITIONS),
+                           f"+1555{generator.randrange(10 ** 7):07d}",
+                           f"seller{employee_id}@example.com")
+
+    def cars(self, count):
+        generator = random.Random(f"{self.seed}-cars")
+        for car_id in range(count):
+            producer, model, price = generator.choice(self.models)
+            release_year = generator.randint(2015, 2025)
+            # older cars are cheaper; prices are whole cents
+            cost = round(price * (0.9 ** (2025 - release_year))
+                         * generator.uniform(0.9, 1.1), 2)
+            yield Car(car_id, producer, model, release_year, cost,
+                      round(cost * generator.uniform(1.1, 1.35), 2))
+
+    def sales(self, count, employees):
+        # the first count cars are sold, the rest stay in the inventory
+        generator = random.Random(f"{self.seed}-sales")
+        for car in self.cars(count):
+            sale_date = self.START + timedelta(
+                seconds=generator.randrange(self.DAYS * 86400))
+            margin = car.potential_sale_price - car.cost
+            yield (generator.randrange(employees), car.car_id, sale_date,
+                   round(car.cost + margin * generator.uniform(0.3, 1.0), 2))
+
+    @staticmethod
+    def batches(records, size):
+        records = iter(records)
+        while batch := list(islice(records, size)):
+            yield batch
+
+    def salon(self, rows, **options):
+        salon = AutoSalon(**options)
+        employees = max(5, rows // 500)
+        salon.bulk_add_employees(self.employees(employees))
+        for batch in self.batches(self.cars(rows + rows // 10), self.BATCH):
+            salon.bulk_add_cars(batch)
+        for batch in self.batches(self.sales(rows, employees), self.BATCH):
+            salon.bulk_register_sales(batch)
+        return salon
+
+
+class SuiteBenchmark:
+    # times register_sale, every report, save_data and load_data on a
+    # synthetic salon, and reports peak memory; results are plain JSON
+    REPORT_TYPES = [report_type for report_type in ReportsMenu
+                    if report_type != ReportsMenu.BACK]
+
+    def __init__(self, rows=10_000, seed=0, repeat=3, trace_memory=False):
+        self.rows = rows
+        self.seed = seed
+        self.repeat = repeat
+        self.trace_memory = trace_memory
+
+    @staticmethod
+    def _best(function, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    @staticmethod
+    def peak_rss_bytes():
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    def run(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        timings = {}
+        try:
+            started = time.perf_counter()
+            salon = SyntheticData(self.seed).salon(self.rows)
+            timings["populate"] = time.perf_counter() - started
+            timings.update(self._register_sales(salon))
+            timings.update(self._reports(salon))
+            timings.update(self._persistence(salon))
+            memory = {"peak_rss_bytes": self.peak_rss_bytes()}
+            if self.trace_memory:
+                _, memory["traced_peak_bytes"] = (
+                    tracemalloc.get_traced_memory())
+        finally:
+            if self.trace_memory:
+                tracemalloc.stop()
+        return {
+            "rows": self.rows,
+            "seed": self.seed,
+            "python": platform.python_version(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "timings": timings,
+            "memory": memory,
+        }
+
+    def _register_sales(self, salon):
+        count = max(1, min(10_000, self.rows // 10))
+        first_id = self.rows + self.rows // 10
+        cars = [Car(first_id + number, "Ford", "Focus", 2024, 19000, 24000)
+                for number in range(count)]
+        salon.bulk_add_cars(cars)
+        started = time.perf_counter()
+        for number, car in enumerate(cars):
+            salon.register_sale(number % len(salon.employees), car.car_id,
+                                SyntheticData.START + timedelta(hours=number),
+                                21000)
+        elapsed = time.perf_counter() - started
+        return {"register_sale_each": elapsed / count}
+
+    @staticmethod
+    def _consume(report):
+        # lazy reports only do their work when they are read
+        if not isinstance(report, str):
+            for _ in report:
+                pass
+
+    def _reports(self, salon):
+        # uncached, so each timing is the report's own work; the period is
+        # a quarter of the generated two years
+        report_generator = ReportGenerator(salon, cache_size=0)
+        start_date = SyntheticData.START + timedelta(days=180)
+        kwargs = {"date": start_date, "start_date": start_date,
+                  "end_date": start_date + timedelta(days=90),
+                  "employee_id": 0}
+        timings = {}
+        for report_type in self.REPORT_TYPES:
+            timings[f"report_{report_type.name.lower()}"] = self._best(
+                lambda: self._consume(report_generator.generate_report(
+                    report_type, **kwargs)),
+                self.repeat)
+        return timings
+
+    def _persistence(self, salon):
+        timings = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for compression in SnapshotBenchmark.FORMATS[:2]:
+                name = compression or "pickle"
+                filename = os.path.join(directory, f"salon.{name}")
+                timings[f"save_data_{name}"] = self._best(
+                    lambda: salon.save_data(filename, compression=compression),
+                    1)
+                timings[f"load_data_{name}"] = self._best(
+                    lambda: AutoSalon().load_data(filename), 1)
+        return timings
+
+    @staticmethod
+    def compare(baseline, current, threshold=0.10, noise=0.0005):
+        # timings that got slower by more than threshold and by more than
+        # noise seconds; timings that only one side has are not compared
+        regressions = {}
+        for name, seconds in current["timings"].items():
+            before = baseline["timings"].get(name)
+            if before and seconds > max(before * (1 + threshold),
+                                        before + noise):
+                regressions[name] = {"baseline": before, "current": seconds,
+                                     "change": seconds / before - 1}
+        return regressions
+
+
+class SnapshotBenchmark:
+    FORMATS = (None, "zlib", "lzma")
+
+    @staticmethod
+    def salon(count):
+        return SyntheticData().salon(count)
+
+    @staticmethod
+    def run(count=200_000):
+        salon = SnapshotBenchmark.salon(count)
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for compression in SnapshotBenchmark.FORMATS:
+                name = compression or "pickle"
+                filename = os.path.join(directory, f"salon.{name}")
+                started = time.perf_counter()
+                salon.save_data(filename, compression=compression)
+                saved = time.perf_counter() - started
+                started = time.perf_counter()
+                AutoSalon().load_data(filename)
+                loaded = time.perf_counter() - started
+                results[name] = {"bytes": os.path.getsize(filename),
+                                 "save_seconds": saved,
+                                 "load_seconds": loaded}
+        return results
+
+
+def suite(arguments):
+    results = SuiteBenchmark(SyntheticData.rows(arguments.size),
+                             arguments.seed, arguments.repeat,
+                             arguments.trace_memory).run()
+    text = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    print(text)
+    if arguments.baseline:
+        with open(arguments.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = SuiteBenchmark.compare(baseline, results,
+                                             arguments.threshold)
+        for name, regression in regressions.items():
+            print(f"Regression in {name}: {regression['baseline']:.6f} s -> "
+                  f"{regression['current']:.6f} s "
+                  f"({regression['change']:+.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+def objects():
+    for name, result in ObjectMemoryBenchmark.run().items():
+        change = result["slots_bytes"] - result["dict_bytes"]
+        print(f"{name}: {result['dict_bytes']:.0f} bytes with __dict__, "
+              f"{result['slots_bytes']:.0f} bytes with __slots__ "
+              f"({change:+.0f} bytes per object)")
+
+    for name, result in SnapshotBenchmark.run().items():
+        print(f"{name}: {result['bytes']} bytes, "
+              f"saved in {result['save_seconds']:.3f} s, "
+              f"loaded in {result['load_seconds']:.3f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Auto salon benchmarks")
+    parser.add_argument("command", nargs="?", default="suite",
+                        choices=("suite", "objects"),
+                        help="suite: timings as JSON; objects: the slots "
+                             "and snapshot size comparisons")
+    parser.add_argument("--size", default="10k",
+                        help="10k, 1m, 10m or a row count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also trace Python allocations (slower)")
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed slowdown before a timing fails")
+    arguments = parser.parse_args()
+    if arguments.command == "suite":
+        suite(arguments)
+    else:
+        objects()
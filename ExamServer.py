@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from Exam import (AutoSalon, Car, Employee, LogSink, Metrics,
+                  ReportGenerator, ReportPage, ReportsMenu)
+
+
+class AutoSalonServer:
+    # newline-delimited JSON: {"id": 1, "op": "report", "args": {...}}
+    # is answered with {"id": 1, "ok": true, "result": ...}
+    STREAM_LIMIT = 1 << 24
+    OPERATIONS = ("add_employee", "add_car", "register_sale", "report",
+                  "search_cars", "save_data", "load_data")
+
+    def __init__(self, salon: AutoSalon, report_workers=4):
+        self.salon = salon
+        self.report_generator = ReportGenerator(salon)
+        # one thread owns the salon, so requests never interleave inside
+        # it, while the event loop keeps serving every other connection
+        self.executor = ThreadPoolExecutor(max_workers=1,
+                                           thread_name_prefix="salon")
+        # a thread-safe salon hands reports a snapshot, so they can run
+        # beside the writer instead of queueing behind it
+        self.report_executor = self.executor
+        if salon.thread_safe:
+            self.report_executor = ThreadPoolExecutor(
+                max_workers=report_workers, thread_name_prefix="report")
+        self.server = None
+        self.requests_served = 0
+
+    async def start(self, host="127.0.0.1", port=8765, path=None):
+        if path is not None:
+            self.server = await asyncio.start_unix_server(
+                self._handle_client, path=path, limit=self.STREAM_LIMIT)
+        else:
+            self.server = await asyncio.start_server(
+                self._handle_client, host, port, limit=self.STREAM_LIMIT)
+        return self.server
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown()
+        self.report_executor.shutdown()
+
+    async def _handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError as e:
+                    # a line over STREAM_LIMIT; the rest of it cannot be
+                    # told apart from the next request, so the client is
+                    # told why and the connection ends
+                    await self._send(writer, {"id": None, "ok": False,
+                                              "error": f"ValueError: {e}"})
+                    break
+                if not line:
+                    break
+                await self._send(writer, await self._respond(line))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _send(writer, response):
+        writer.write(json.dumps(response, default=str).encode() + b"\n")
+        await writer.drain()
+
+    async def _respond(self, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            operation = request["op"]
+            if operation not in self.OPERATIONS:
+                raise ValueError(f"Unknown operation {operation}")
+            handler = getattr(self, f"_{operation}")
+            executor = (self.report_executor
+                        if operation in ("report", "search_cars")
+                        else self.executor)
+            result = await asyncio.get_running_loop().run_in_executor(
+                executor, handler, request.get("args", {}))
+        except Exception as e:
+            return {"id": request_id, "ok": False,
+                    "error": f"{type(e).__name__}: {e}"}
+        self.requests_served += 1
+        return {"id": request_id, "ok": True, "result": result}
+
+    @staticmethod
+    def _date(value):
+        return None if value is None else datetime.fromisoformat(value)
+
+    def _add_employee(self, args):
+        employee = Employee(**args)
+        self.salon.add_employee(employee)
+        return employee.as_row()
+
+    def _add_car(self, args):
+        car = Car(**args)
+        self.salon.add_car(car)
+        return car.as_row()
+
+    def _register_sale(self, args):
+        sale = self.salon.register_sale(args["employee_id"], args["car_id"],
+                                        self._date(args["sale_date"]),
+                                        args["real_sale_price"])
+        if sale is None:
+            raise LookupError(f"Employee - {args['employee_id']} or "
+                              f"car - {args['car_id']} not found")
+        return sale.as_row()
+
+    def _report(self, args):
+        report = self.report_generator.generate_report(
+            ReportsMenu[args["report_type"]],
+            date=self._date(args.get("date")),
+            start_date=self._date(args.get("start_date")),
+            end_date=self._date(args.get("end_date")),
+            employee_id=args.get("employee_id"),
+            page_size=args.get("page_size"), cursor=args.get("cursor"))
+        if isinstance(report, str):
+            return report
+        rows = [record.as_row() for record in report]
+        # a paged report answers with its rows and the cursor of the next
+        # page, which is null on the last one
+        if isinstance(report, ReportPage):
+            return {"rows": rows, "cursor": report.cursor}
+        return rows
+
+    def _search_cars(self, args):
+        # ranges arrive as [low, high] lists, with null for an open end
+        return [car.as_row()
+                for car in self.report_generator.search_cars(**args)]
+
+    def _save_data(self, args):
+        if not self.salon.save_data(args["filename"]):
+            raise OSError(f"Could not save {args['filename']}")
+        return args["filename"]
+
+    def _load_data(self, args):
+        if not self.salon.load_data(args["filename"]):
+            raise OSError(f"Could not load {args['filename']}")
+        return args["filename"]
+
+
+class AutoSalonClient:
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.next_id = 0
+
+    async def connect(self, host="127.0.0.1", port=8765, path=None):
+        if path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(
+                path, limit=AutoSalonServer.STREAM_LIMIT)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(
+                host, port, limit=AutoSalonServer.STREAM_LIMIT)
+        return self
+
+    async def request(self, operation, **args):
+        self.next_id += 1
+        self.writer.write(json.dumps({"id": self.next_id, "op": operation,
+                                      "args": args}).encode() + b"\n")
+        await self.writer.drain()
+        response = json.loads(await self.reader.readline())
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+class LoadGenerator:
+    # every client sells its own cars and asks for period reports in
+    # between, so writers and readers overlap on the server
+    REPORTS = ("SHOW_SALES_IN_PERIOD", "SHOW_MOST_SALE_CAR_IN_PERIOD",
+               "SHOW_TOP_EMPLOYEE_IN_PERIOD", "SHOW_PROFIT_IN_PERIOD")
+
+    def __init__(self, host="127.0.0.1", port=8765, path=None,
+                 clients=10, requests=100):
+        self.address = {"host": host, "port": port, "path": path}
+        self.clients = clients
+        self.requests = requests
+        self.latencies = {}
+
+    async def run(self):
+        started = time.perf_counter()
+        await asyncio.gather(*(self._client(number)
+                               for number in range(self.clients)))
+        elapsed = time.perf_counter() - started
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {
+            "clients": self.clients,
+            "requests": total,
+            "seconds": elapsed,
+            "requests_per_second": total / elapsed if elapsed else 0.0,
+            "latency_ms": {operation: self._percentiles(samples)
+                           for operation, samples in self.latencies.items()},
+        }
+
+    async def _client(self, number):
+        client = await AutoSalonClient().connect(**self.address)
+        try:
+            employee_id = f"load-{number}"
+            await self._timed(client, "add_employee", employee_id=employee_id,
+                              full_name=f"Load Client {number}",
+                              position="Seller", phone_number="0",
+                              email=f"{employee_id}@example.com")
+            for request in range(self.requests):
+                if request % 3 == 2:
+                    await self._timed(
+                        client, "report",
+                        report_type=self.REPORTS[request % len(self.REPORTS)],
+                        start_date="2024-01-01", end_date="2024-12-31")
+                    continue
+                car_id = f"{employee_id}-{request}"
+                if request % 3 == 0:
+                    await self._timed(client, "add_car", car_id=car_id,
+                                      producer="Ford", model="Focus",
+                                      release_year=2024, cost=5000,
+                                      potential_sale_price=10000)
+                else:
+                    await self._timed(client, "register_sale",
+                                      employee_id=employee_id,
+                                      car_id=f"{employee_id}-{request - 1}",
+                                      sale_date=(f"2024-"
+                                                 f"{request % 12 + 1:02d}-01"),
+                                      real_sale_price=7000)
+        finally:
+            await client.close()
+
+    async def _timed(self, client, operation, **args):
+        started = time.perf_counter()
+        await client.request(operation, **args)
+        self.latencies.setdefault(operation, []).append(
+            (time.perf_counter() - started) * 1000)
+
+    @staticmethod
+    def _percentiles(samples):
+        ordered = sorted(samples)
+        return {f"p{percent}": ordered[min(len(ordered) - 1,
+                                           len(ordered) * percent // 100)]
+                for percent in (50, 95, 99)}
+
+
+async def serve(args):
+    # only the save and load messages, not one per request
+    salon = AutoSalon(thread_safe=True, metrics=Metrics(LogSink(
+        sys.stderr, names=("load_data", "save_data", "autosave"))))
+    if args.data and not salon.load_data(args.data):
+        sys.exit(f"Could not load {args.data}")
+    server = AutoSalonServer(salon)
+    await server.start(args.host, args.port, args.unix)
+    print(f"Serving auto salon on {args.unix or server.address}")
+    async with server.server:
+        await server.server.serve_forever()
+
+
+async def load(args):
+    generator = LoadGenerator(args.host, args.port, args.unix,
+                              args.clients, args.requests)
+    print(json.dumps(await generator.run(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Auto salon JSON service")
+    parser.add_argument("command", choices=("serve", "load"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Unix socket path instead of TCP")
+    parser.add_argument("--data", help="salon file to load before serving")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100)
+    arguments = parser.parse_args()
+    asyncio.run(serve(arguments) if arguments.command == "serve"
+                else load(arguments))
@@ -1,7 +1,17 @@
-from datetime import datetime
+import asyncio
+import csv
+import json
+import pickle
+import sys
+import threading
+import warnings
+from collections import Counter
+from datetime import datetime, timedelta
+import Exam
 from Exam import (Employee, Car, AutoSalon, ReportGenerator,
                   ReportsMenu, Sale, SaveDataToFile,
-                  LoadDataFromFile, DateValidator)
+                  LoadDataFromFile, DateValidator, ReportProcessor,
+                  Metrics, MemorySink, LogSink, ReportPage)
 import pytest
 
 
@@ -118,6 +128,1382 @@ def test_show_sales_report(autosalon, sale):
     assert len(sales_report) == 1
 
 
+@pytest.fixture
+def busy_autosalon(employee):
+    autosalon = AutoSalon()
+    autosalon.add_employee(employee)
+    for car_id, model in enumerate(["Mustang", "Focus", "Mustang", "Fiesta"]):
+        autosalon.add_car(Car(car_id, "Ford", model, 2024, 5000, 10000))
+    # registered out of date order on purpose
+    autosalon.register_sale(1, 0, datetime(2024, 8, 10), 7000)
+    autosalon.register_sale(1, 1, datetime(2024, 8, 1), 6000)
+    autosalon.register_sale(1, 2, datetime(2024, 8, 20), 8000)
+    autosalon.register_sale(1, 3, datetime(2024, 8, 1), 5500)
+    return autosalon
+
+
+def test_sales_index_keeps_date_order(busy_autosalon):
+    dates = [sale.sale_date for sale in busy_autosalon.sales_index]
+    assert dates == sorted(dates)
+    assert len(busy_autosalon.sales_index) == len(busy_autosalon.sales)
+
+
+def test_show_sales_in_period_report(busy_autosalon):
+    report_generator = ReportGenerator(busy_autosalon)
+    report = report_generator.generate_report(
+        ReportsMenu.SHOW_SALES_IN_PERIOD,
+        start_date=datetime(2024, 8, 1), end_date=datetime(2024, 8, 10))
+    assert [sale.car.car_id for sale in report] == [1, 3, 0]
+
+
+def test_show_reports_by_date_report(busy_autosalon):
+    report_generator = ReportGenerator(busy_autosalon)
+    report = report_generator.generate_report(
+        ReportsMenu.SHOW_REPORTS_BY_DATE, date=datetime(2024, 8, 1))
+    assert [sale.car.car_id for sale in report] == [1, 3]
+
+
+def test_load_data_rebuilds_sales_index(busy_autosalon, tmp_path):
+    filename = tmp_path / "salon.pkl"
+    busy_autosalon.save_data(filename)
+    loaded = AutoSalon()
+    loaded.load_data(filename)
+    assert len(loaded.sales_in_period(datetime(2024, 8, 1),
+                                      datetime(2024, 8, 31))) == 4
+
+
+def test_show_sales_by_employee_report(busy_autosalon):
+    report_generator = ReportGenerator(busy_autosalon)
+    report = report_generator.generate_report(
+        ReportsMenu.SHOW_SALES_BY_EMPLOYEE, employee_id=1)
+    assert [sale.car.car_id for sale in report] == [1, 3, 0, 2]
+
+    report = report_generator.generate_report(
+        ReportsMenu.SHOW_SALES_BY_EMPLOYEE, employee_id=1,
+        start_date=datetime(2024, 8, 5), end_date=datetime(2024, 8, 31))
+    assert [sale.car.car_id for sale in report] == [0, 2]
+
+    report = report_generator.generate_report(
+        ReportsMenu.SHOW_SALES_BY_EMPLOYEE, employee_id=2)
+    assert report == []
+
+
+def test_sales_by_model(busy_autosalon):
+    report_generator = ReportGenerator(busy_autosalon)
+    report = report_generator.get_sales_by_model("Ford", "Mustang")
+    assert [sale.car.car_id for sale in report] == [0, 2]
+    assert report_generator.get_sales_by_model("Ford", "Mondeo") == []
+
+
+def test_remove_employee_keeps_sales_history(busy_autosalon, employee):
+    busy_autosalon.remove_employee(employee)
+    assert len(busy_autosalon.employee_sales(employee.employee_id)) == 4
+
+
+def test_period_summary(busy_autosalon):
+    report_generator = ReportGenerator(busy_autosalon)
+    summary = report_generator.get_period_summary(datetime(2024, 8, 1),
+                                                  datetime(2024, 8, 31))
+    assert summary.sales_count == 4
+    assert summary.revenue == 26500
+    assert summary.profit == 6500
+    assert summary.most_sale_car() == "Mustang"
+    assert summary.top_employee() == "John Connor"
+
+
+def test_period_reports(busy_autosalon):
+    report_generator = ReportGenerator(busy_autosalon)
+    period = {"start_date": datetime(2024, 8, 1),
+              "end_date": datetime(2024, 8, 10)}
+    assert (report_generator.generate_report(
+        ReportsMenu.SHOW_MOST_SALE_CAR_IN_PERIOD, **period)
+        == "Most sale car in period - Fiesta")
+    assert (report_generator.generate_report(
+        ReportsMenu.SHOW_TOP_EMPLOYEE_IN_PERIOD, **period)
+        == "The top employee is John Connor")
+    assert (report_generator.generate_report(
+        ReportsMenu.SHOW_PROFIT_IN_PERIOD, **period)
+        == "Total profit in period is: 3500.0")
+    assert (report_generator.generate_report(
+        ReportsMenu.SHOW_PROFIT_IN_PERIOD, start_date=datetime(2023, 1, 1),
+        end_date=datetime(2023, 12, 31)) == "No sales in period")
+
+
+@pytest.fixture
+def columnar_autosalon(busy_autosalon):
+    pytest.importorskip("numpy")
+    autosalon = AutoSalon(columnar=True)
+    autosalon.employees = busy_autosalon.employees
+    for sale in busy_autosalon.sales:
+        autosalon.add_car(sale.car)
+        autosalon.register_sale(sale.employee.employee_id, sale.car.car_id,
+                                sale.sale_date, sale.real_sale_price)
+    return autosalon
+
+
+def test_columnar_sales_reports_match(busy_autosalon, columnar_autosalon):
+    period = {"start_date": datetime(2024, 8, 1),
+              "end_date": datetime(2024, 8, 15)}
+    for report_type, kwargs in [
+            (ReportsMenu.SHOW_SALES_IN_PERIOD, period),
+            (ReportsMenu.SHOW_REPORTS_BY_DATE, {"date": datetime(2024, 8, 1)}),
+            (ReportsMenu.SHOW_SALES_BY_EMPLOYEE, {"employee_id": 1})]:
+        expected = ReportGenerator(busy_autosalon).generate_report(
+            report_type, **kwargs)
+        report = ReportGenerator(columnar_autosalon).generate_report(
+            report_type, **kwargs)
+        assert ([(sale.car.car_id, sale.sale_date) for sale in report]
+                == [(sale.car.car_id, sale.sale_date) for sale in expected])
+
+    summary = ReportGenerator(columnar_autosalon).get_period_summary(**period)
+    assert summary.sales_count == 3
+    assert summary.revenue == 18500
+    assert summary.profit == 3500
+    assert summary.top_employee() == "John Connor"
+
+
+def test_columnar_sales_materialize_sales(columnar_autosalon):
+    sale = columnar_autosalon.sales[0]
+    assert sale.car.model == "Mustang"
+    assert sale.sale_date == datetime(2024, 8, 10)
+    assert sale.real_sale_price == 7000
+    assert len(list(columnar_autosalon.sales)) == 4
+
+
+def test_columnar_sales_keep_details_of_re_added_employee(car):
+    pytest.importorskip("numpy")
+    autosalon = AutoSalon(columnar=True)
+    autosalon.add_employee(Employee(1, "Old Name", "Seller", "1", "a@b.c"))
+    autosalon.add_car(car)
+    autosalon.add_car(Car(2, "Ford", "Focus", 2023, 4000, 8000))
+    autosalon.register_sale(1, 1, datetime(2024, 8, 1), 7000)
+    autosalon.add_employee(Employee(1, "New Name", "Seller", "1", "a@b.c"))
+    autosalon.register_sale(1, 2, datetime(2024, 8, 2), 7500)
+
+    assert ([sale.employee.full_name for sale in autosalon.sales]
+            == ["Old Name", "New Name"])
+    assert len(autosalon.sales.employee_sales(1)) == 2
+    summary = ReportGenerator(autosalon).get_period_summary(
+        datetime(2024, 8, 1), datetime(2024, 8, 2))
+    assert summary.employee_sales == {"Old Name": 1, "New Name": 1}
+
+
+def test_journal_replays_log_on_load(tmp_path, employee, car):
+    filename = str(tmp_path / "salon.journal")
+    autosalon = AutoSalon()
+    autosalon.open_journal(filename)
+    autosalon.add_employee(employee)
+    autosalon.add_car(car)
+    autosalon.add_car(Car(2, "Ford", "Focus", 2023, 4000, 8000))
+    autosalon.register_sale(1, 1, datetime(2024, 8, 1), 7000)
+    autosalon.close_journal()
+
+    restored = AutoSalon()
+    restored.open_journal(filename)
+    assert list(restored.employees) == [1]
+    assert list(restored.cars) == [2]
+    assert len(restored.sales_on_date(datetime(2024, 8, 1))) == 1
+    restored.close_journal()
+
+
+def test_journal_checkpoint_compacts_log(tmp_path, employee, car):
+    filename = str(tmp_path / "salon.journal")
+    autosalon = AutoSalon()
+    autosalon.open_journal(filename, checkpoint_every=2)
+    autosalon.add_employee(employee)
+    autosalon.add_car(car)
+    assert autosalon.journal.pending == 0
+    autosalon.register_sale(1, 1, datetime(2024, 8, 1), 7000)
+    autosalon.close_journal()
+
+    restored = AutoSalon()
+    restored.load_data(filename)
+    assert len(restored.sales) == 0
+    restored.open_journal(filename)
+    assert len(restored.sales) == 1
+    restored.close_journal()
+
+
+def test_journal_drops_truncated_record(tmp_path, employee, car):
+    filename = str(tmp_path / "salon.journal")
+    autosalon = AutoSalon()
+    autosalon.open_journal(filename)
+    autosalon.add_employee(employee)
+    autosalon.add_car(car)
+    autosalon.close_journal()
+    with open(filename + ".log", "r+b") as log:
+        log.truncate(log.seek(0, 2) - 3)
+
+    restored = AutoSalon()
+    restored.open_journal(filename)
+    assert list(restored.employees) == [1]
+    assert restored.cars == {}
+    restored.add_car(car)
+    restored.close_journal()
+
+    restored = AutoSalon()
+    restored.open_journal(filename)
+    assert list(restored.cars) == [1]
+    restored.close_journal()
+
+
+def test_binary_snapshot_reports_match(busy_autosalon, tmp_path):
+    filename = tmp_path / "salon.bin"
+    busy_autosalon.save_snapshot(filename)
+    mapped = AutoSalon()
+    mapped.load_data(filename)
+    period = {"start_date": datetime(2024, 8, 1),
+              "end_date": datetime(2024, 8, 15)}
+    for report_type, kwargs in [
+            (ReportsMenu.SHOW_SALES_IN_PERIOD, period),
+            (ReportsMenu.SHOW_REPORTS_BY_DATE, {"date": datetime(2024, 8, 1)}),
+            (ReportsMenu.SHOW_SALES_BY_EMPLOYEE, {"employee_id": 1}),
+            (ReportsMenu.SHOW_MOST_SALE_CAR_IN_PERIOD, period),
+            (ReportsMenu.SHOW_PROFIT_IN_PERIOD, period)]:
+        mapped_report = ReportGenerator(mapped).generate_report(
+            report_type, **kwargs)
+        assert repr(mapped_report) == repr(ReportGenerator(
+            busy_autosalon).generate_report(report_type, **kwargs))
+
+
+def test_binary_snapshot_accepts_new_sales(busy_autosalon, tmp_path):
+    filename = tmp_path / "salon.bin"
+    busy_autosalon.save_snapshot(filename)
+    mapped = AutoSalon()
+    mapped.load_data(filename)
+    mapped.add_car(Car("X-1", "Kia", "Rio", 2022, 3000, 6000))
+    mapped.register_sale(1, "X-1", datetime(2024, 8, 5), 5000)
+    report = mapped.sales_in_period(datetime(2024, 8, 1),
+                                    datetime(2024, 8, 10))
+    assert [sale.car.car_id for sale in report] == [1, 3, "X-1", 0]
+    assert len(mapped.sales) == 5
+
+    pickled = tmp_path / "salon.pkl"
+    mapped.save_data(pickled)
+    loaded = AutoSalon()
+    loaded.load_data(pickled)
+    assert isinstance(loaded.sales, list)
+    assert len(loaded.sales) == 5
+
+
+def test_binary_snapshot_can_be_saved_over(busy_autosalon, tmp_path):
+    filename = tmp_path / "salon.bin"
+    busy_autosalon.save_snapshot(filename)
+    mapped = AutoSalon()
+    mapped.load_data(filename)
+    mapped.save_data(filename)
+    assert isinstance(mapped.sales, list)
+    assert len(mapped.sales_in_period(datetime(2024, 8, 1),
+                                      datetime(2024, 8, 10))) == 3
+    loaded = AutoSalon()
+    assert loaded.load_data(filename)
+    assert len(loaded.sales) == len(busy_autosalon.sales)
+
+    loaded.save_snapshot(filename)
+    mapped = AutoSalon()
+    mapped.load_data(filename)
+    mapped.save_snapshot(filename)
+    assert AutoSalon().load_data(filename)
+    assert [sale.car.car_id for sale in mapped.sales] == [
+        sale.car.car_id for sale in loaded.sales]
+
+
+def test_binary_snapshot_keeps_details_of_re_added_employee(car, tmp_path):
+    autosalon = AutoSalon()
+    autosalon.add_employee(Employee(1, "Old Name", "Seller", "1", "a@b.c"))
+    autosalon.add_car(car)
+    autosalon.add_car(Car(2, "Ford", "Focus", 2023, 4000, 8000))
+    autosalon.register_sale(1, 1, datetime(2024, 8, 1), 7000)
+    autosalon.add_employee(Employee(1, "New Name", "Seller", "1", "a@b.c"))
+    autosalon.register_sale(1, 2, datetime(2024, 8, 2), 7500)
+    filename = tmp_path / "salon.bin"
+    autosalon.save_snapshot(filename)
+    mapped = AutoSalon()
+    mapped.load_data(filename)
+
+    assert ([sale.employee.full_name for sale in mapped.sales]
+            == ["Old Name", "New Name"])
+    assert len(mapped.sales.employee_sales(1)) == 2
+    summary = ReportGenerator(mapped).get_period_summary(
+        datetime(2024, 8, 1), datetime(2024, 8, 2))
+    assert summary.employee_sales == {"Old Name": 1, "New Name": 1}
+
+
+def test_domain_objects_use_slots(employee, car, sale):
+    for record in (employee, car, sale):
+        assert not hasattr(record, "__dict__")
+    restored = pickle.loads(pickle.dumps(sale))
+    assert repr(restored) == repr(sale)
+
+
+def test_slotted_objects_load_dict_pickles(monkeypatch):
+    class Car:
+        def __init__(self, car_id, producer, model,
+                     release_year, cost, potential_sale_price):
+            self.car_id = car_id
+            self.producer = producer
+            self.model = model
+            self.release_year = release_year
+            self.cost = cost
+            self.potential_sale_price = potential_sale_price
+
+    slotted_car = Exam.Car
+    Car.__module__, Car.__qualname__ = "Exam", "Car"
+    monkeypatch.setattr(Exam, "Car", Car)
+    old_pickle = pickle.dumps(Car(1, "Ford", "Mustang", 2024, 5000, 10000))
+    monkeypatch.setattr(Exam, "Car", slotted_car)
+    assert repr(pickle.loads(old_pickle)) == (
+        "Car: ID - 1, Producer - Ford, Model - Mustang, "
+        "Release year - 2024, Cost - 5000, Potential sale price - 10000")
+
+
+def test_load_data_shares_repeated_values(busy_autosalon, tmp_path):
+    filename = tmp_path / "salon.pkl"
+    busy_autosalon.save_data(filename)
+    loaded = AutoSalon()
+    loaded.load_data(filename)
+    first, second = loaded.sales_on_date(datetime(2024, 8, 1))
+    assert first.sale_date is second.sale_date
+    assert first.car.producer is second.car.producer
+    # timestamps with a time of day rarely repeat and are not kept
+    loaded.bulk_add_cars(Car(car_id, "Kia", "Rio", 2023, 4000, 8000)
+                         for car_id in range(10, 20))
+    loaded.bulk_register_sales((1, car_id, datetime(2024, 9, 1, 10, car_id),
+                                6000) for car_id in range(10, 20))
+    assert len(loaded._shared_dates) == 3
+
+
+def test_export_sales_report_to_csv(busy_autosalon, tmp_path):
+    filename = tmp_path / "sales.csv"
+    processor = ReportProcessor(ReportGenerator(busy_autosalon))
+    exported = processor.export_report(
+        ReportsMenu.SHOW_SALES_IN_PERIOD, filename, "csv",
+        start_date=datetime(2024, 8, 1), end_date=datetime(2024, 8, 10))
+    assert exported == 3
+    with open(filename, newline='') as file:
+        rows = list(csv.DictReader(file))
+    assert [row["car_id"] for row in rows] == ["1", "3", "0"]
+    assert rows[0]["sale_date"] == "2024-08-01T00:00:00"
+    assert rows[0]["real_sale_price"] == "6000"
+
+
+def test_export_report_to_jsonl(busy_autosalon, tmp_path):
+    filename = tmp_path / "profit.jsonl"
+    processor = ReportProcessor(ReportGenerator(busy_autosalon))
+    processor.export_report(
+        ReportsMenu.SHOW_PROFIT_IN_PERIOD, filename, "jsonl",
+        start_date=datetime(2024, 8, 1), end_date=datetime(2024, 8, 31))
+    with open(filename) as file:
+        rows = [json.loads(line) for line in file]
+    assert rows == [{"report": "Total profit in period is: 6500.0"}]
+
+
+def test_bulk_ingestion_reports_row_errors(busy_autosalon, tmp_path):
+    filename = tmp_path / "cars.csv"
+    filename.write_text("car_id,producer,model,release_year,cost,"
+                        "potential_sale_price\n"
+                        "10,Kia,Rio,2022,3000,6000\n"
+                        "11,Kia,Ceed,2023,,7000\n"
+                        "12,Kia,Rio,2023,3500,6500\n")
+    cars = busy_autosalon.bulk_add_cars(Exam.BulkSource.read_csv(filename))
+    assert cars.accepted == 2
+    assert cars.errors == [(2, "missing cost")]
+    assert busy_autosalon.cars["10"].cost == 3000.0
+
+    sales = busy_autosalon.bulk_register_sales([
+        (1, "12", datetime(2024, 8, 5), 6000),
+        {"employee_id": 1, "car_id": "10", "sale_date": "2024-07-30",
+         "real_sale_price": "5000"},
+        (1, "12", datetime(2024, 8, 6), 6000),
+        (7, "10", datetime(2024, 8, 6), 6000),
+        (1, "12", 12345, 6000),
+    ])
+    assert sales.accepted == 2
+    assert [row for row, _ in sales.errors] == [3, 4, 5]
+    assert sales.errors[2] == (5, "sale_date 12345 is not a datetime")
+    assert len(busy_autosalon.sales) == len(busy_autosalon.sales_index) == 6
+    assert busy_autosalon.cars == {}
+    report = busy_autosalon.sales_in_period(datetime(2024, 7, 1),
+                                            datetime(2024, 8, 5))
+    assert [sale.car.car_id for sale in report] == ["10", 1, 3, "12"]
+    assert [sale.car.car_id for sale in busy_autosalon.model_sales(
+        "Kia", "Rio")] == ["10", "12"]
+
+
+def test_bulk_add_employees(autosalon):
+    result = autosalon.bulk_add_employees([
+        {"employee_id": 2, "full_name": "Sarah Connor", "position": "Seller",
+         "phone_number": "987654321", "email": "sarah@gmail.com"},
+        (2, "Kyle Reese", "Seller", "111", "kyle@gmail.com"),
+    ])
+    assert result.accepted == 1
+    assert autosalon.employees[2].full_name == "Sarah Connor"
+
+
+def test_report_cache_hits_and_window_invalidation(busy_autosalon):
+    report_generator = ReportGenerator(busy_autosalon)
+    august = {"start_date": datetime(2024, 8, 1),
+              "end_date": datetime(2024, 8, 31)}
+    july = {"start_date": datetime(2024, 7, 1),
+            "end_date": datetime(2024, 7, 31)}
+    report_generator.generate_report(ReportsMenu.SHOW_PROFIT_IN_PERIOD,
+                                     **august)
+    report_generator.generate_report(ReportsMenu.SHOW_PROFIT_IN_PERIOD,
+                                     **july)
+    assert (report_generator.generate_report(
+        ReportsMenu.SHOW_PROFIT_IN_PERIOD, **august)
+        == "Total profit in period is: 6500.0")
+    assert report_generator.cache.stats()["hits"] == 1
+
+    busy_autosalon.add_car(Car(9, "Ford", "Focus", 2024, 5000, 10000))
+    busy_autosalon.register_sale(1, 9, datetime(2024, 8, 12), 9000)
+    assert report_generator.cache.get(
+        (ReportsMenu.SHOW_PROFIT_IN_PERIOD, None, *july.values(), None))[0]
+    assert (report_generator.generate_report(
+        ReportsMenu.SHOW_PROFIT_IN_PERIOD, **august)
+        == "Total profit in period is: 10500.0")
+
+
+def test_report_cache_evicts_least_recently_used(busy_autosalon):
+    report_generator = ReportGenerator(busy_autosalon, cache_size=2)
+    for day in (1, 10, 20):
+        report_generator.generate_report(ReportsMenu.SHOW_REPORTS_BY_DATE,
+                                         date=datetime(2024, 8, day))
+    stats = report_generator.cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+
+
+def test_rollup_summary_matches_raw_rows(employee):
+    autosalon = AutoSalon()
+    autosalon.add_employee(employee)
+    autosalon.add_employee(Employee(2, "Sarah Connor", "Seller",
+                                    "987654321", "sarah@gmail.com"))
+    models = ["Mustang", "Focus", "Fiesta"]
+    for car_id in range(120):
+        autosalon.add_car(Car(car_id, "Ford", models[car_id % 3], 2024,
+                              5000 + car_id, 10000))
+        autosalon.register_sale(car_id % 2 + 1, car_id,
+                                datetime(2024, 6, 1, car_id % 24)
+                                + timedelta(days=car_id), 7000 + car_id)
+    report_generator = ReportGenerator(autosalon)
+    for start_date, end_date in [
+            (datetime(2024, 6, 1), datetime(2024, 9, 28)),
+            (datetime(2024, 6, 15, 12), datetime(2024, 8, 2, 6)),
+            (datetime(2024, 7, 1), datetime(2024, 7, 31, 23, 59, 59, 999999)),
+            (datetime(2024, 7, 3, 1), datetime(2024, 7, 3, 20))]:
+        summary = report_generator.get_period_summary(start_date, end_date)
+        raw = autosalon.sales_in_period(start_date, end_date)
+        assert summary.sales_count == len(raw)
+        assert summary.profit == sum(sale.real_sale_price - sale.car.cost
+                                     for sale in raw)
+        assert summary.model_sales == Counter(sale.car.model for sale in raw)
+        assert summary.employee_sales == Counter(
+            sale.employee.full_name for sale in raw)
+
+
+@pytest.fixture
+def history_autosalon(employee):
+    autosalon = AutoSalon(rollups=False)
+    autosalon.add_employee(employee)
+    autosalon.add_employee(Employee(2, "Sarah Connor", "Seller",
+                                    "987654321", "sarah@gmail.com"))
+    models = ["Mustang", "Focus", "Fiesta", "Kuga"]
+    autosalon.bulk_add_cars(
+        Car(car_id, "Ford", models[car_id % 4 if car_id % 3 else 0], 2024,
+            4999.99 + car_id / 7, 10000)
+        for car_id in range(400))
+    autosalon.bulk_register_sales(
+        (car_id % 3 // 2 + 1, car_id,
+         datetime(2024, 1, 1) + timedelta(hours=car_id * 13),
+         7000.01 + car_id / 3)
+        for car_id in range(400))
+    return autosalon
+
+
+def test_parallel_summary_matches_serial(history_autosalon, tmp_path):
+    period = (datetime(2024, 1, 10), datetime(2024, 6, 30))
+    serial = ReportGenerator(history_autosalon).get_period_summary(*period)
+    parallel = ReportGenerator(history_autosalon, workers=3)
+    parallel.parallel.min_rows = 0
+    for summary in (parallel.get_period_summary(*period),
+                    Exam.ParallelSummary._summarize_encoded(
+                        *Exam.ParallelSummary._encode(
+                            history_autosalon.sales_in_period(*period)))):
+        assert repr(summary) == repr(serial)
+        assert summary.model_sales == serial.model_sales
+    parallel.close()
+
+    filename = tmp_path / "salon.bin"
+    history_autosalon.save_snapshot(filename)
+    mapped = AutoSalon()
+    mapped.load_data(filename)
+    parallel = ReportGenerator(mapped, workers=3)
+    parallel.parallel.min_rows = 0
+    assert repr(parallel.get_period_summary(*period)) == repr(serial)
+    parallel.close()
+
+
+def test_parallel_summaries_keep_their_own_salon(history_autosalon,
+                                                 monkeypatch):
+    period = (datetime(2024, 1, 1), datetime(2024, 12, 31))
+    smaller = AutoSalon(rollups=False)
+    smaller.employees = history_autosalon.employees
+    smaller.sales = history_autosalon.sales[:150]
+    smaller.rebuild_indexes()
+    counts = {}
+
+    def summarize(salon, name):
+        generator = ReportGenerator(salon, cache_size=0, workers=2)
+        generator.parallel.min_rows = 0
+        try:
+            counts[name] = generator.get_period_summary(*period).sales_count
+        finally:
+            generator.close()
+
+    threads = [threading.Thread(target=summarize, args=(salon, name))
+               for name, salon in (("history", history_autosalon),
+                                   ("smaller", smaller))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counts == {"history": 400, "smaller": 150}
+
+    # one pool serves every summary, and is never forked from this
+    # threaded process
+    generator = ReportGenerator(smaller, cache_size=0, workers=2)
+    generator.parallel.min_rows = 0
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        assert generator.get_period_summary(*period).sales_count == 150
+        pool = generator.parallel._executor
+        assert generator.get_period_summary(*period).sales_count == 150
+        assert generator.parallel._executor is pool
+    generator.close()
+    assert generator.parallel._executor is None
+
+    # rollups answer a period themselves, so workers are not used
+    calls = []
+    monkeypatch.setattr(Exam.ParallelSummary, "summarize",
+                        lambda self, salon, *period: calls.append(salon))
+    with_rollups = AutoSalon()
+    with_rollups.sales = history_autosalon.sales
+    with_rollups.rebuild_indexes()
+    ReportGenerator(with_rollups, workers=2).get_period_summary(*period)
+    assert calls == []
+    ReportGenerator(smaller, workers=2).get_period_summary(*period)
+    assert len(calls) == 1
+
+
+def test_period_summary_paths_agree(history_autosalon):
+    period = (datetime(2024, 2, 3, 5), datetime(2024, 5, 1))
+    with_rollups = AutoSalon()
+    with_rollups.employees = history_autosalon.employees
+    with_rollups.sales = history_autosalon.sales
+    with_rollups.rebuild_indexes()
+    assert (repr(ReportGenerator(with_rollups).get_period_summary(*period))
+            == repr(ReportGenerator(history_autosalon)
+                    .get_period_summary(*period)))
+
+
+def test_federated_report_merges_branches(busy_autosalon, tmp_path):
+    first = tmp_path / "first.pkl"
+    busy_autosalon.save_data(first)
+    branch = AutoSalon()
+    branch.add_employee(Employee(2, "Sarah Connor", "Seller",
+                                 "987654321", "sarah@gmail.com"))
+    for car_id in range(3):
+        branch.add_car(Car(car_id, "Kia", "Rio", 2023, 3000, 6000))
+        branch.register_sale(2, car_id, datetime(2024, 8, 2), 5000)
+    second = tmp_path / "second.bin"
+    branch.save_snapshot(second)
+    corrupt = tmp_path / "corrupt.pkl"
+    corrupt.write_bytes(b"not a pickle")
+
+    sink = MemorySink()
+    federated = Exam.FederatedReportGenerator(
+        [str(first), str(second), str(corrupt), str(tmp_path / "missing")],
+        metrics=Metrics(sink))
+    result = federated.get_period_summary(datetime(2024, 8, 1),
+                                          datetime(2024, 8, 31))
+    assert sorted(result.failed) == [str(corrupt), str(tmp_path / "missing")]
+    assert sink.counters["federated.failed"] == 2
+    assert result.summary.sales_count == 7
+    assert result.summary.profit == 12500
+    # each branch has a different leader; the merged counters decide
+    assert result.summary.employee_sales == {"John Connor": 4,
+                                             "Sarah Connor": 3}
+    assert result.summary.most_sale_car() == "Rio"
+    assert (federated.generate_report(
+        ReportsMenu.SHOW_TOP_EMPLOYEE_IN_PERIOD,
+        start_date=datetime(2024, 8, 1), end_date=datetime(2024, 8, 31))
+        == "The top employee is John Connor")
+
+
+def test_server_handles_concurrent_clients(busy_autosalon):
+    from ExamServer import AutoSalonServer, AutoSalonClient, LoadGenerator
+
+    async def scenario():
+        server = AutoSalonServer(busy_autosalon)
+        server.STREAM_LIMIT = 1024
+        await server.start(port=0)
+        host, port = server.address[:2]
+        try:
+            client = await AutoSalonClient().connect(host, port)
+            await client.request("add_car", car_id=7, producer="Ford",
+                                 model="Kuga", release_year=2024, cost=5000,
+                                 potential_sale_price=10000)
+            sale = await client.request("register_sale", employee_id=1,
+                                        car_id=7, sale_date="2024-08-15",
+                                        real_sale_price=9000)
+            assert sale["sale_date"] == "2024-08-15T00:00:00"
+            profit = await client.request(
+                "report", report_type="SHOW_PROFIT_IN_PERIOD",
+                start_date="2024-08-01", end_date="2024-08-31")
+            assert profit == "Total profit in period is: 10500.0"
+            with pytest.raises(RuntimeError, match="not found"):
+                await client.request("register_sale", employee_id=1,
+                                     car_id=7, sale_date="2024-08-15",
+                                     real_sale_price=9000)
+            with pytest.raises(RuntimeError, match="Could not save"):
+                await client.request("save_data",
+                                     filename="/nonexistent/dir/x.pkl")
+            await client.close()
+
+            # a line over the stream limit is answered, not left to kill
+            # the connection task
+            client = await AutoSalonClient().connect(host, port)
+            with pytest.raises(RuntimeError, match="ValueError"):
+                await client.request("add_car", producer="x" * 4096)
+            await client.close()
+
+            stats = await LoadGenerator(host, port, clients=4,
+                                        requests=9).run()
+            assert stats["requests"] == 4 * 10
+            assert set(stats["latency_ms"]) == {"add_employee", "add_car",
+                                                "register_sale", "report"}
+        finally:
+            await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_snapshot_is_not_changed_by_later_sales(employee):
+    salon = AutoSalon(thread_safe=True)
+    salon.add_employee(employee)
+    for car_id in range(3):
+        salon.add_car(Car(car_id, "Ford", "Focus", 2024, 5000, 10000))
+    salon.register_sale(1, 0, datetime(2024, 8, 10), 7000)
+    snapshot = salon.snapshot()
+
+    salon.register_sale(1, 1, datetime(2024, 8, 1), 8000)
+    salon.bulk_register_sales([(1, 2, datetime(2024, 8, 20), 9000)])
+    assert len(snapshot.sales) == 1
+    assert sorted(snapshot.cars) == [1, 2]
+    assert len(snapshot.sales_in_period(None, None)) == 1
+    assert snapshot.rollup.months[(2024, 8)].sales_count == 1
+    assert len(salon.sales_in_period(None, None)) == 3
+    assert salon.rollup.months[(2024, 8)].sales_count == 3
+    with pytest.raises(ValueError):
+        AutoSalon(columnar=True, thread_safe=True)
+
+
+def test_write_after_snapshot_copies_only_what_changes(employee,
+                                                       monkeypatch):
+    monkeypatch.setattr(Exam.SaleIndex, "CHUNK", 4)
+    monkeypatch.setattr(Exam.SortedColumn, "CHUNK", 4)
+    monkeypatch.setattr(Exam.LayeredDict, "FOLD", 8)
+    salon = AutoSalon(thread_safe=True)
+    salon.add_employee(employee)
+    salon.bulk_add_cars([(car_id, "Ford", ("Focus", "Kuga")[car_id % 2],
+                          2024, 5000 + car_id, 10000)
+                         for car_id in range(60)])
+    salon.bulk_register_sales([(1, car_id, datetime(2024, 1, 1)
+                                + timedelta(days=car_id), 7000)
+                               for car_id in range(40)])
+    snapshot = salon.snapshot()
+    expected = (repr(snapshot.sales_in_period(None, None)),
+                repr(snapshot.search_cars(order_by="cost")),
+                repr(list(snapshot.cars.values())))
+
+    salon.register_sale(1, 40, datetime(2024, 1, 20, 12), 7000)
+    salon.remove_car(salon.cars[41])
+    salon.add_car(Car(41, "Ford", "Focus", 2024, 5000, 10000))
+    assert len(snapshot.sales) == 40 and len(salon.sales) == 41
+    assert salon.sales is snapshot.sales.sales
+    # only the chunk that took the backdated sale was copied
+    shared = [chunk for chunk in salon.sales_index.sale_chunks
+              if any(chunk is old for old in snapshot.sales_index.sale_chunks)]
+    assert len(shared) == len(salon.sales_index.sale_chunks) - 1
+    assert salon.cars.base is snapshot.cars.base
+    assert (repr(snapshot.sales_in_period(None, None)),
+            repr(snapshot.search_cars(order_by="cost")),
+            repr(list(snapshot.cars.values()))) == expected
+    assert list(salon.cars)[-1] == 41
+    assert [sale.car.car_id for sale in salon.sales_on_date(
+        datetime(2024, 1, 20, 12))] == [40]
+    sales = pickle.loads(pickle.dumps(snapshot.sales))
+    assert type(sales) is list and repr(sales) == repr(snapshot.sales)
+    cars = pickle.loads(pickle.dumps(salon.cars))
+    assert type(cars) is dict and repr(cars) == repr(salon.cars)
+
+
+def test_thread_safe_salon_under_concurrent_writers_and_readers():
+    salon = AutoSalon(thread_safe=True)
+    report_generator = ReportGenerator(salon)
+    writers = 4
+    sales_per_writer = 150
+    for writer in range(writers):
+        salon.add_employee(Employee(writer, f"Seller {writer}", "Seller",
+                                    "0", f"seller{writer}@example.com"))
+    failures = []
+    done = threading.Event()
+
+    def write(writer):
+        for number in range(sales_per_writer):
+            car_id = (writer, number)
+            salon.add_car(Car(car_id, "Ford", ("Focus", "Kuga")[number % 2],
+                              2024, 5000, 10000))
+            # backdated sales land in the middle of the date indexes
+            sale_date = datetime(2024, 1, 1) + timedelta(
+                days=(number * 37 + writer) % 365)
+            if number % 10 == 9:
+                salon.bulk_register_sales([(writer, car_id, sale_date, 7000)])
+            else:
+                salon.register_sale(writer, car_id, sale_date, 7000)
+
+    def read():
+        window = (datetime(2024, 3, 1), datetime(2024, 9, 30, 23, 59, 59))
+        while not done.is_set():
+            try:
+                snapshot = salon.snapshot()
+                sold = {sale.car.car_id for sale in snapshot.sales}
+                assert len(sold) == len(snapshot.sales)
+                assert not sold & set(snapshot.cars)
+                assert len(snapshot.sales_index) == len(snapshot.sales)
+                assert sum(len(index) for index in
+                           snapshot.sales_by_employee.values()) == len(sold)
+                assert sum(bucket.sales_count
+                           for days in snapshot.rollup.days.values()
+                           for bucket in days.values()) == len(sold)
+                summary = report_generator._period_summary(snapshot, *window)
+                assert summary.sales_count == len(
+                    snapshot.sales_in_period(*window))
+                report_generator.generate_report(
+                    ReportsMenu.SHOW_PROFIT_IN_PERIOD, start_date=window[0],
+                    end_date=window[1])
+            except Exception as e:
+                failures.append(e)
+                return
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    writer_threads = [threading.Thread(target=write, args=(writer,))
+                      for writer in range(writers)]
+    # switch threads far more often than usual to shake out interleavings
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        for thread in readers + writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert failures == []
+    assert len(salon.sales) == writers * sales_per_writer
+    assert salon.cars == {}
+    raw = report_generator._period_summary(salon, None, None)
+    assert raw.sales_count == writers * sales_per_writer
+    assert (report_generator.generate_report(
+        ReportsMenu.SHOW_PROFIT_IN_PERIOD, start_date=datetime(2024, 1, 1),
+        end_date=datetime(2024, 12, 31, 23, 59, 59))
+        == f"Total profit in period is: {2000.0 * writers * sales_per_writer}")
+
+
+def test_leaderboards_rank_by_count_revenue_and_profit(history_autosalon):
+    report_generator = ReportGenerator(history_autosalon)
+    period = (datetime(2024, 2, 1), datetime(2024, 6, 30))
+    sales = history_autosalon.sales_in_period(*period)
+    for by in Exam.Leaderboard.DIMENSIONS:
+        for metric in Exam.Leaderboard.METRICS:
+            totals = {}
+            for sale in sales:
+                totals.setdefault(Exam.Leaderboard.key(sale, by), []).append(
+                    Exam.Leaderboard.weight(sale, metric))
+            expected = sorted(((key, sum(values) if metric == "count"
+                                else sum(values) / 100)
+                               for key, values in totals.items()),
+                              key=lambda item: (-item[1], item[0]))
+            assert report_generator.get_leaderboard(
+                *period, by=by, metric=metric, k=3) == expected[:3]
+    top = report_generator.get_leaderboard(*period, k=1)[0][0]
+    assert top == report_generator.get_period_summary(*period).most_sale_car()
+    with pytest.raises(ValueError):
+        report_generator.get_leaderboard(by="color")
+
+
+def test_leaderboard_ties_go_to_smallest_name():
+    assert Exam.Leaderboard.select([("Kuga", 2), ("Focus", 2), ("Puma", 3),
+                                    ("Fiesta", 1)], 3) == [
+        ("Puma", 3), ("Focus", 2), ("Kuga", 2)]
+
+
+def test_columnar_leaderboards_match(history_autosalon):
+    pytest.importorskip("numpy")
+    columnar = AutoSalon(columnar=True)
+    columnar.employees = history_autosalon.employees
+    columnar.sales = Exam.ColumnarSales(history_autosalon.sales)
+    columnar.rebuild_indexes()
+    for by in Exam.Leaderboard.DIMENSIONS:
+        for metric in Exam.Leaderboard.METRICS:
+            assert (ReportGenerator(columnar).get_leaderboard(
+                by=by, metric=metric)
+                == ReportGenerator(history_autosalon).get_leaderboard(
+                    by=by, metric=metric))
+
+
+def test_space_saving_leaderboard_keeps_heavy_hitters():
+    leaderboard = Exam.SpaceSavingLeaderboard(capacity=10)
+    # one model sells far more often than a long tail of rare ones
+    for number in range(5000):
+        leaderboard.offer("Focus" if number % 4 == 0 else f"rare-{number}", 1)
+    assert len(leaderboard.totals) == 10
+    (key, total), = leaderboard.top(1)
+    assert key == "Focus"
+    assert leaderboard.guaranteed("Focus") <= 1250 <= total
+    with pytest.raises(ValueError):
+        Exam.SpaceSavingLeaderboard(metric="profit")
+
+
+@pytest.fixture
+def sqlite_autosalon(busy_autosalon, tmp_path):
+    autosalon = AutoSalon(storage=Exam.SqliteStorage(tmp_path / "salon.db"))
+    for employee in busy_autosalon.employees.values():
+        autosalon.add_employee(employee)
+    autosalon.add_car(Car(9, "Kia", "Rio", 2023, 4000, 8000))
+    for sale in busy_autosalon.sales:
+        autosalon.add_car(sale.car)
+        autosalon.register_sale(sale.employee.employee_id, sale.car.car_id,
+                                sale.sale_date, sale.real_sale_price)
+    yield autosalon
+    autosalon.storage.close()
+
+
+def test_sqlite_storage_reports_match(busy_autosalon, sqlite_autosalon):
+    busy_autosalon.add_car(Car(9, "Kia", "Rio", 2023, 4000, 8000))
+    period = {"start_date": datetime(2024, 8, 1),
+              "end_date": datetime(2024, 8, 10)}
+    for report_type, kwargs in (
+            (ReportsMenu.SHOW_EMPLOYEES, {}),
+            (ReportsMenu.SHOW_CARS, {}),
+            (ReportsMenu.SHOW_SALES_IN_PERIOD, period),
+            (ReportsMenu.SHOW_REPORTS_BY_DATE, {"date": datetime(2024, 8, 1)}),
+            (ReportsMenu.SHOW_SALES_BY_EMPLOYEE, {"employee_id": 1}),
+            (ReportsMenu.SHOW_MOST_SALE_CAR_IN_PERIOD, period),
+            (ReportsMenu.SHOW_TOP_EMPLOYEE_IN_PERIOD, period),
+            (ReportsMenu.SHOW_PROFIT_IN_PERIOD, period)):
+        assert (repr(ReportGenerator(sqlite_autosalon).generate_report(
+            report_type, **kwargs))
+            == repr(ReportGenerator(busy_autosalon).generate_report(
+                report_type, **kwargs)))
+    assert (repr(ReportGenerator(sqlite_autosalon).get_sales_by_model(
+        "Ford", "Mustang")) == repr(ReportGenerator(
+            busy_autosalon).get_sales_by_model("Ford", "Mustang")))
+    assert (ReportGenerator(sqlite_autosalon).get_leaderboard(
+        metric="revenue") == ReportGenerator(busy_autosalon).get_leaderboard(
+            metric="revenue"))
+
+
+def test_sqlite_storage_persists_and_rolls_back(sqlite_autosalon, employee,
+                                                monkeypatch):
+    filename = sqlite_autosalon.storage.filename
+
+    def fail(*args):
+        raise RuntimeError("disk full")
+
+    sqlite_autosalon.add_car(Car(10, "Kia", "Ceed", 2023, 4000, 8000))
+    monkeypatch.setattr(sqlite_autosalon, "_changed", fail)
+    with pytest.raises(RuntimeError):
+        sqlite_autosalon.register_sale(1, 10, datetime(2024, 9, 1), 7000)
+    monkeypatch.undo()
+    sqlite_autosalon.remove_employee(employee)
+    sqlite_autosalon.storage.close()
+
+    reopened = AutoSalon(storage=Exam.SqliteStorage(filename))
+    try:
+        # the failed sale left neither a sale row nor a sold car behind
+        assert sorted(reopened.cars) == [9, 10]
+        assert len(reopened.sales) == 4
+        assert 1 not in reopened.employees
+        assert len(reopened.employee_sales(1)) == 4
+    finally:
+        reopened.storage.close()
+
+
+def test_sqlite_storage_loads_pickled_data(busy_autosalon, tmp_path):
+    filename = tmp_path / "salon.pkl"
+    busy_autosalon.save_data(filename)
+    autosalon = AutoSalon(storage=Exam.SqliteStorage())
+    assert autosalon.load_data(filename)
+    assert (repr(autosalon.sales_in_period(None, None))
+            == repr(busy_autosalon.sales_in_period(None, None)))
+    autosalon.save_data(tmp_path / "copy.pkl")
+    copy = AutoSalon()
+    copy.load_data(tmp_path / "copy.pkl")
+    assert (repr(list(copy.sales_index))
+            == repr(list(busy_autosalon.sales_index)))
+
+
+def test_sqlite_storage_keeps_details_of_re_added_employee(car, tmp_path):
+    filename = tmp_path / "salon.db"
+    autosalon = AutoSalon(storage=Exam.SqliteStorage(filename))
+    autosalon.add_employee(Employee(1, "Old Name", "Seller", "1", "a@b.c"))
+    autosalon.add_car(car)
+    autosalon.add_car(Car(2, "Ford", "Focus", 2023, 4000, 8000))
+    autosalon.register_sale(1, 1, datetime(2024, 8, 1), 7000)
+    autosalon.add_employee(Employee(1, "New Name", "Seller", "1", "a@b.c"))
+    autosalon.register_sale(1, 2, datetime(2024, 8, 2), 7500)
+    try:
+        assert ([sale.employee.full_name for sale in autosalon.sales]
+                == ["Old Name", "New Name"])
+        summary = ReportGenerator(autosalon).get_period_summary(
+            datetime(2024, 8, 1), datetime(2024, 8, 2))
+        assert summary.employee_sales == {"Old Name": 1, "New Name": 1}
+    finally:
+        autosalon.storage.close()
+
+    # a database from before sales kept their employee
+    connection = Exam.sqlite3.connect(filename)
+    with connection:
+        connection.execute("ALTER TABLE sales RENAME TO new_sales")
+        connection.execute(
+            "CREATE TABLE sales (sale_id INTEGER PRIMARY KEY, employee_id, "
+            "car_id, producer, model, release_year, cost_cents INTEGER, "
+            "potential_sale_price_cents INTEGER, sale_date INTEGER NOT NULL, "
+            "real_sale_price_cents INTEGER)")
+        connection.execute(
+            "INSERT INTO sales SELECT sale_id, employee_id, car_id, "
+            "producer, model, release_year, cost_cents, "
+            "potential_sale_price_cents, sale_date, real_sale_price_cents "
+            "FROM new_sales")
+        connection.execute("DROP TABLE new_sales")
+    connection.close()
+    reopened = AutoSalon(storage=Exam.SqliteStorage(filename))
+    try:
+        assert ([sale.employee.full_name for sale in reopened.sales]
+                == ["New Name", "New Name"])
+    finally:
+        reopened.storage.close()
+
+
+def test_batch_runner_shares_windows_and_writes_outputs(busy_autosalon,
+                                                        tmp_path,
+                                                        monkeypatch, capsys):
+    from ExamBatch import BatchReportRunner, ReportSpec
+
+    spec_file = tmp_path / "nightly.jsonl"
+    spec_file.write_text(
+        "# nightly reports\n"
+        + json.dumps({"report": "SHOW_SALES_IN_PERIOD",
+                      "start_date": "2024-08-01", "end_date": "2024-08-10",
+                      "output": str(tmp_path / "sales.jsonl")}) + "\n"
+        + json.dumps({"report": "SHOW_PROFIT_IN_PERIOD",
+                      "start_date": "2024-08-01", "end_date": "2024-08-31",
+                      "output": str(tmp_path / "summary.txt")}) + "\n")
+    specs = ReportSpec.read(spec_file) + [
+        ReportSpec.parse("SHOW_TOP_EMPLOYEE_IN_PERIOD,start_date=2024-08-01,"
+                         f"end_date=2024-08-31,output={tmp_path}/summary.txt"),
+        ReportSpec.from_dict({"report": "SHOW_SALES_BY_EMPLOYEE",
+                              "employee_id": 1})]
+    runner = BatchReportRunner(busy_autosalon)
+    summaries = []
+    get_period_summary = runner.report_generator.get_period_summary
+    monkeypatch.setattr(runner.report_generator, "get_period_summary",
+                        lambda *window: summaries.append(window)
+                        or get_period_summary(*window))
+    runner.run(specs)
+
+    assert len(summaries) == 1
+    rows = [json.loads(line) for line in
+            (tmp_path / "sales.jsonl").read_text().splitlines()]
+    assert [row["car_id"] for row in rows] == [1, 3, 0]
+    assert {row["report"] for row in rows} == {"SHOW_SALES_IN_PERIOD"}
+    summary = (tmp_path / "summary.txt").read_text()
+    assert "Total profit in period is: 6500.0" in summary
+    assert "The top employee is John Connor" in summary
+    assert "SHOW_SALES_BY_EMPLOYEE: employee_id - 1" in capsys.readouterr().out
+    assert [shared for _, _, shared in runner.timings] == [False, False,
+                                                           True, False, False]
+    with pytest.raises(ValueError):
+        ReportSpec.parse("SHOW_EVERYTHING")
+    with pytest.raises(ValueError, match="unknown fields employee"):
+        ReportSpec.parse("SHOW_SALES_BY_EMPLOYEE,employee=1")
+    assert ReportSpec.parse(
+        "SHOW_SALES_BY_EMPLOYEE,employee_id=007").employee_id == "007"
+
+    filename = tmp_path / "salon.pkl"
+    busy_autosalon.save_data(filename)
+    windows = []
+    monkeypatch.setattr(Exam.ParallelSummary, "summarize",
+                        lambda self, salon, *window: windows.append(window)
+                        or Exam.PeriodSummary())
+    salon = BatchReportRunner.load_salon(filename, workers=2)
+    BatchReportRunner(salon, workers=2).run(specs[1:2])
+    assert len(windows) == 1
+    assert BatchReportRunner.load_salon(tmp_path / "missing.pkl") is None
+
+
+@pytest.mark.parametrize("compression", ["zlib", "lzma"])
+def test_chunked_snapshot_round_trip(history_autosalon, tmp_path,
+                                     monkeypatch, compression):
+    monkeypatch.setattr(Exam.ChunkedSnapshot, "CHUNK_SALES", 64)
+    history_autosalon.remove_employee(history_autosalon.employees[2])
+    filename = tmp_path / "salon.salonz"
+    history_autosalon.save_data(filename, compression=compression)
+    assert filename.stat().st_size < len(pickle.dumps(
+        history_autosalon._data())) / 2
+
+    loaded = AutoSalon()
+    assert loaded.load_data(filename)
+    assert repr(loaded.sales) == repr(history_autosalon.sales)
+    assert sorted(loaded.employees) == [1]
+    assert loaded.sales[0].employee is loaded.employees[1]
+    assert len({id(sale.employee) for sale in loaded.sales}) == 2
+
+
+def test_chunked_snapshot_detects_corruption(busy_autosalon, tmp_path):
+    filename = tmp_path / "salon.salonz"
+    busy_autosalon.save_data(filename, compression="zlib")
+    content = bytearray(filename.read_bytes())
+
+    corrupt = tmp_path / "corrupt.salonz"
+    content[-20] ^= 0xFF
+    corrupt.write_bytes(content)
+    assert AutoSalon().load_data(corrupt) is False
+
+    truncated = tmp_path / "truncated.salonz"
+    truncated.write_bytes(filename.read_bytes()[:-12])
+    assert AutoSalon().load_data(truncated) is False
+
+
+def test_money_is_stored_in_cents(employee, monkeypatch):
+    car = Car(1, "Ford", "Focus", 2024, 4999.99, "10000.50")
+    assert (car.cost_cents, car.potential_sale_price_cents) == (499999,
+                                                                1000050)
+    assert (car.cost, car.potential_sale_price) == (4999.99, 10000.5)
+    assert Exam.Money.from_cents(700000) == 7000
+    for amount in ("abc", None, "inf", float("nan")):
+        with pytest.raises(ValueError):
+            Exam.Money.to_cents(amount)
+
+    salon = AutoSalon()
+    salon.add_employee(employee)
+    cars = salon.bulk_add_cars([(2, "Kia", "Rio", 2022, "abc", 6000),
+                                (3, "Kia", "Rio", 2022, 4000, "6000.10")])
+    assert cars.errors == [(1, "'abc' is not an amount of money")]
+    sales = salon.bulk_register_sales([(1, 3, datetime(2024, 8, 1), None),
+                                       (1, 3, datetime(2024, 8, 1),
+                                        "5000.10")])
+    assert [row for row, _ in sales.errors] == [1]
+    assert salon.sales[0].real_sale_price_cents == 500010
+    assert Exam.BulkSource.money("5000.10") == Exam.Decimal("5000.10")
+
+    class Sale:
+        def __init__(self, employee, car, sale_date, real_sale_price):
+            self.employee = employee
+            self.car = car
+            self.sale_date = sale_date
+            self.real_sale_price = real_sale_price
+
+    slotted_sale = Exam.Sale
+    Sale.__module__, Sale.__qualname__ = "Exam", "Sale"
+    monkeypatch.setattr(Exam, "Sale", Sale)
+    old_pickle = pickle.dumps(Sale(employee, car, datetime(2024, 8, 1),
+                                   7000.1))
+    monkeypatch.setattr(Exam, "Sale", slotted_sale)
+    assert pickle.loads(old_pickle).real_sale_price_cents == 700010
+
+    new_pickle = pickle.dumps(slotted_sale(employee, car, datetime(2024, 8, 1),
+                                           "7000.10"))
+    monkeypatch.setattr(Exam, "Sale", Sale)
+    old_sale = pickle.loads(new_pickle)
+    monkeypatch.setattr(Exam, "Sale", slotted_sale)
+    assert old_sale.real_sale_price == 7000.1
+    assert old_sale.car.cost == car.cost
+    assert pickle.loads(new_pickle).real_sale_price_cents == 700010
+    state = {"employee": employee, "car": car,
+             "sale_date": datetime(2024, 8, 1), "real_sale_price_cents": 5}
+    restored = slotted_sale.__new__(slotted_sale)
+    restored.__setstate__(state)
+    assert restored.real_sale_price_cents == 5
+
+
+def test_profit_is_summed_exactly_in_cents(employee):
+    autosalon = AutoSalon()
+    autosalon.add_employee(employee)
+    autosalon.bulk_add_cars(Car(car_id, "Ford", "Focus", 2024, 0.2, 1)
+                            for car_id in range(10))
+    autosalon.bulk_register_sales((1, car_id, datetime(2024, 8, 1), 0.3)
+                                  for car_id in range(10))
+    summary = ReportGenerator(autosalon).get_period_summary(
+        datetime(2024, 8, 1), datetime(2024, 8, 1))
+    # ten float sums of 0.3 - 0.2 would give 0.9999999999999999
+    assert summary.profit_cents == 100
+    assert summary.profit == 1.0
+
+
+def test_benchmark_suite_is_seeded_and_flags_regressions():
+    from ExamBenchmarks import SuiteBenchmark, SyntheticData
+
+    first = SyntheticData(7).salon(500)
+    second = SyntheticData(7).salon(500)
+    assert len(first.sales) == 500 and len(first.cars) == 50
+    assert ([sale.as_row() for sale in first.sales]
+            == [sale.as_row() for sale in second.sales])
+    assert all(sale.car.cost <= sale.real_sale_price
+               <= sale.car.potential_sale_price for sale in first.sales)
+
+    results = json.loads(json.dumps(SuiteBenchmark(500, repeat=1).run()))
+    assert {"register_sale_each", "save_data_zlib", "load_data_pickle",
+            "report_show_profit_in_period"} <= set(results["timings"])
+    slower = {"timings": {name: seconds * 2 + 1
+                          for name, seconds in results["timings"].items()}}
+    assert SuiteBenchmark.compare(results, results) == {}
+    assert set(SuiteBenchmark.compare(results, slower)) == set(
+        results["timings"])
+
+
+def test_metrics_count_time_and_log_when_asked(employee, tmp_path, capsys):
+    sink = MemorySink()
+    metrics = Metrics(sink, LogSink(), trace_memory=True)
+    salon = AutoSalon(metrics=metrics)
+    salon.add_employee(employee)
+    salon.add_car(Car(1, "Ford", "Focus", 2024, 5000, 10000))
+    salon.register_sale(1, 1, datetime(2024, 8, 1), 7000)
+    salon.register_sale(1, 2, datetime(2024, 8, 1), 7000)
+    report_generator = ReportGenerator(salon)
+    for _ in range(2):
+        report_generator.generate_report(ReportsMenu.SHOW_PROFIT_IN_PERIOD)
+    filename = str(tmp_path / "salon.pkl")
+    salon.save_data(filename)
+    AutoSalon(metrics=metrics).load_data(filename)
+    metrics.stop()
+
+    recorded = sink.as_dict()
+    assert recorded["counters"]["register_sale"] == 1
+    assert recorded["counters"]["register_sale.not_found"] == 1
+    assert recorded["counters"]["report_cache.hit"] == 1
+    assert (recorded["counters"]["save_data.bytes"]
+            == recorded["counters"]["load_data.bytes"] > 0)
+    profit = recorded["latency"]["report.SHOW_PROFIT_IN_PERIOD"]
+    assert profit["count"] == 2
+    assert profit["p50_seconds"] <= profit["max_seconds"]
+    assert {"save_data", "load_data"} <= set(recorded["memory_peak_bytes"])
+    output = capsys.readouterr().out
+    assert "Sale registered" in output and "car - 2 not found" in output
+    assert ("load_data", "Data loaded") in sink.events
+
+    AutoSalon().register_sale(1, 1, datetime(2024, 8, 1), 7000)
+    assert capsys.readouterr().out == ""
+
+    quiet = AutoSalon(metrics=Metrics(sink, LogSink(names=("save_data",))))
+    quiet.register_sale(1, 1, datetime(2024, 8, 1), 7000)
+    assert quiet.save_data(str(tmp_path / "missing" / "salon.pkl")) is False
+    assert sink.counters["save_data.errors"] == 1
+    assert capsys.readouterr().out.startswith("Error saving file")
+
+
+def test_autosave_writes_deltas_that_load_back(employee, tmp_path,
+                                               monkeypatch):
+    with pytest.raises(ValueError):
+        AutoSalon().start_autosave(str(tmp_path / "plain.pkl"))
+    salon = AutoSalon(thread_safe=True)
+    salon.add_employee(employee)
+    salon.bulk_add_cars(Car(car_id, "Ford", "Focus", 2024, 5000, 10000)
+                        for car_id in range(6))
+    filename = str(tmp_path / "salon.pkl")
+    salon.start_autosave(filename, interval=3600, threshold=2)
+    assert salon.autosave.flush()
+    salon.register_sale(1, 0, datetime(2024, 8, 1), 7000)
+    salon.register_sale(1, 1, datetime(2024, 8, 2), 8000)
+    # the threshold wakes the saver without waiting for the interval
+    for _ in range(500):
+        if (tmp_path / "salon.pkl.1.delta").exists():
+            break
+        threading.Event().wait(0.01)
+    assert (tmp_path / "salon.pkl.1.delta").exists()
+    salon.remove_car(Car(5, "Ford", "Focus", 2024, 5000, 10000))
+    salon.save_data(filename)
+    assert (tmp_path / "salon.pkl.2.delta").exists()
+
+    # a failed write leaves the files alone and makes the next save whole
+    def replace(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(Exam.os, "replace", replace)
+    salon.register_sale(1, 2, datetime(2024, 8, 3), 9000)
+    assert not salon.autosave.flush()
+    assert salon.autosave.full
+    monkeypatch.undo()
+    salon.stop_autosave()
+    assert not (tmp_path / "salon.pkl.1.delta").exists()
+
+    # deltas of an older base are ignored
+    (tmp_path / "salon.pkl.1.delta").write_bytes(pickle.dumps(
+        {"generation": "old", "employees": {}, "cars": {}, "sales": []}))
+    loaded = AutoSalon()
+    assert loaded.load_data(filename)
+    assert sorted(loaded.cars) == [3, 4]
+    assert [sale.car.car_id for sale in loaded.sales] == [0, 1, 2]
+
+    salon = AutoSalon(thread_safe=True)
+    salon.load_data(filename)
+    salon.start_autosave(filename, interval=3600)
+    salon.register_sale(1, 3, datetime(2024, 8, 4), 6000)
+    salon.stop_autosave()
+    loaded = AutoSalon()
+    assert loaded.load_data(filename)
+    assert sorted(loaded.cars) == [4]
+    assert loaded.sales[-1].real_sale_price == 6000
+
+
+def test_search_cars_matches_a_scan(employee):
+    import random
+    generator = random.Random(5)
+    salon = AutoSalon(thread_safe=True)
+    salon.add_employee(employee)
+    producers = {"Ford": ["Focus", "Fiesta"], "Kia": ["Rio"],
+                 "BMW": ["X5", "320d"]}
+    salon.bulk_add_cars(
+        Car(car_id, producer, generator.choice(producers[producer]),
+            generator.randint(2015, 2024), generator.randint(8000, 30000),
+            generator.randint(9000, 40000) + 0.5)
+        for car_id, producer in enumerate(generator.choice(list(producers))
+                                          for _ in range(300)))
+    salon.add_car(Car(7, "Kia", "Rio", 2022, 9000, 12000))
+    salon.remove_car(Car(8, "Ford", "Focus", 2024, 5000, 10000))
+    salon.bulk_register_sales((1, car_id, datetime(2024, 8, 1), 9000)
+                              for car_id in range(100, 160))
+    salon.register_sale(1, 9, datetime(2024, 8, 2), 9000)
+    snapshot = salon.snapshot()
+    salon.add_car(Car(1000, "Ford", "Focus", 2021, 9000, 12000))
+
+    def scan(producer=None, model=None, release_year=None, cost=None,
+             potential_sale_price=None):
+        return [car for car in snapshot.cars.values()
+                if producer in (None, car.producer)
+                and model in (None, car.model)
+                and (release_year is None
+                     or release_year[0] <= car.release_year
+                     <= release_year[1])
+                and (cost is None or car.cost <= cost[1])
+                and (potential_sale_price is None
+                     or potential_sale_price[0] <= car.potential_sale_price)]
+
+    queries = [{"producer": "Ford", "release_year": (2020, 2023),
+                "cost": (None, 15000)},
+               {"model": "Rio", "potential_sale_price": (20000, None)},
+               {"producer": "BMW", "model": "X5"},
+               {"release_year": (2018, 2018)},
+               {}]
+    for query in queries:
+        expected = scan(**query)
+        found = snapshot.search_cars(**query)
+        assert sorted(car.car_id for car in found) == sorted(
+            car.car_id for car in expected)
+        ordered = snapshot.search_cars(**query, order_by="cost",
+                                       descending=True, limit=5)
+        assert [car.cost for car in ordered] == sorted(
+            (car.cost for car in expected), reverse=True)[:5]
+    assert [car.car_id for car in snapshot.search_cars(
+        producer="Kia", model="Rio", release_year=2022, cost=9000)] == [7]
+    assert not {8, 9} & set(snapshot.car_index.cars)
+    assert 1000 not in snapshot.car_index.cars
+    assert sorted(car.car_id for car in salon.search_cars(
+        cost=(9000, 9000), potential_sale_price=12000)) == [7, 1000]
+    with pytest.raises(ValueError):
+        salon.search_cars(order_by="model")
+
+
+def test_search_cars_orders_cars_without_a_number_last():
+    salon = AutoSalon()
+    salon.add_car(Car(1, "Ford", "Focus", "unknown", 5000, 10000))
+    salon.add_car(Car(2, "Ford", "Focus", 2020, 5000, 10000))
+    salon.add_car(Car(3, "Ford", "Focus", 2022, 5000, 10000))
+    for query in ({}, {"producer": "Ford"}):
+        for descending, expected in ((False, [2, 3, 1]), (True, [3, 2, 1])):
+            found = salon.search_cars(**query, order_by="release_year",
+                                      descending=descending)
+            assert [car.car_id for car in found] == expected
+            assert [car.car_id for car in salon.search_cars(
+                **query, order_by="release_year", descending=descending,
+                limit=2)] == expected[:2]
+
+
+def test_reports_page_with_cursors_and_display_streams(employee):
+    from io import StringIO
+    salon = AutoSalon(thread_safe=True)
+    salon.add_employee(employee)
+    salon.bulk_add_cars(Car(car_id, "Ford", "Focus", 2024, 5000, 10000)
+                        for car_id in range(120))
+    salon.bulk_register_sales((1, car_id, datetime(2024, 8, 1), 7000)
+                              for car_id in range(105))
+    generator = ReportGenerator(salon)
+    page = generator.generate_report(ReportsMenu.SHOW_SALES, page_size=40)
+    assert isinstance(page, ReportPage) and len(page) == 40
+    # a sale after the first page does not shift the pages that follow
+    salon.register_sale(1, 110, datetime(2024, 8, 2), 7000)
+    sales = list(page)
+    stale = page.cursor
+    while page.cursor is not None:
+        page = generator.generate_report(ReportsMenu.SHOW_SALES,
+                                         page_size=40, cursor=page.cursor)
+        sales += page
+    assert [sale.car.car_id for sale in sales] == list(range(105))
+    assert len(page) == 25
+    with pytest.raises(ValueError):
+        generator.generate_report(ReportsMenu.SHOW_SALES, page_size=40,
+                                  cursor=stale)
+    assert isinstance(generator.generate_report(
+        ReportsMenu.SHOW_PROFIT_IN_PERIOD, page_size=10,
+        start_date=datetime(2024, 1, 1), end_date=datetime(2024, 12, 31)),
+        str)
+
+    output = StringIO()
+    ReportProcessor(generator).display_report(ReportsMenu.SHOW_CARS,
+                                              prompt=False, file=output)
+    assert output.getvalue().count("\n") == len(salon.cars) == 14
+
+
+def test_cursor_pages_of_a_plain_salon_expire_on_change(busy_autosalon):
+    generator = ReportGenerator(busy_autosalon)
+    period = {"start_date": datetime(2024, 8, 1),
+              "end_date": datetime(2024, 8, 31)}
+    page = generator.generate_report(ReportsMenu.SHOW_SALES_IN_PERIOD,
+                                     page_size=2, **period)
+    sales = list(page)
+    while page.cursor is not None:
+        page = generator.generate_report(ReportsMenu.SHOW_SALES_IN_PERIOD,
+                                         page_size=1, cursor=page.cursor,
+                                         **period)
+        sales += page
+    assert [sale.car.car_id for sale in sales] == [1, 3, 0, 2]
+
+    page = generator.generate_report(ReportsMenu.SHOW_SALES_IN_PERIOD,
+                                     page_size=2, **period)
+    busy_autosalon.add_car(Car(9, "Ford", "Focus", 2024, 5000, 10000))
+    # backdated before every row of the first page
+    busy_autosalon.register_sale(1, 9, datetime(2024, 8, 1), 9000)
+    with pytest.raises(ValueError, match="unknown or expired"):
+        generator.generate_report(ReportsMenu.SHOW_SALES_IN_PERIOD,
+                                  page_size=2, cursor=page.cursor, **period)
+
+
 def test_validate_date():
     future_date = datetime(2025, 1, 1)
     assert DateValidator.validate_date(future_date) is None